@@ -0,0 +1,136 @@
+"""Бенчмарк чтения и записи базы до и после миграции схемы.
+
+Строится база в прежней схеме (версия 1: даты ISO-строками, журнал
+репостов с rowid и отдельным индексом ключа): N каналов и M записей о
+репостах за 120 дней. Её копия обновляется миграциями на месте, после
+чего на обеих выполняются одни и те же операции: загрузка каналов,
+загрузка окна журнала за 90 дней (RepostLedger.load), проверки
+«уже переслано», запись пачками, чистка старых записей.
+
+    python bench_database.py [каналов] [репостов]
+"""
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from config import ChannelConfig
+from database import CHANNEL_COLUMNS, Database
+from migrations import migrate
+
+LOOKUPS = 20_000
+WRITES = 20_000
+WRITE_BATCH = 100
+
+
+def build_legacy(path, channels, reposts):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn, target=1)
+    rng = random.Random(1)
+    now = datetime.now(timezone.utc)
+    conn.execute('BEGIN')
+    conn.executemany('INSERT INTO channels VALUES (?, ?, ?, 1, ?, 1, 1, 0, 0)', [
+        (channel_id, rng.randint(1, 48), (now - timedelta(days=30)).isoformat(),
+         (now - timedelta(seconds=rng.randrange(86400))).isoformat())
+        for channel_id in range(channels)
+    ])
+    local = datetime.now()
+    conn.executemany('INSERT INTO reposted_messages VALUES (?, ?, ?, ?)', (
+        (i % channels, (i * 7) % channels, i, (local - timedelta(seconds=rng.randrange(120 * 86400))).isoformat())
+        for i in range(reposts)
+    ))
+    conn.execute('COMMIT')
+    conn.close()
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+class LegacyQueries:
+    """Запросы прежнего Database к схеме версии 1"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+
+    def get_all_channels(self):
+        rows = self.conn.execute(f'SELECT {CHANNEL_COLUMNS.rsplit(",", 1)[0]} FROM channels').fetchall()
+        return [ChannelConfig(
+            channel_id=row[0], posts_per_day=row[1], start_date=datetime.fromisoformat(row[2]),
+            is_active=bool(row[3]), last_repost_date=datetime.fromisoformat(row[4]), forward_mode=bool(row[5]),
+            drop_author=bool(row[6]), last_seen_message_id=row[7], live_mode=bool(row[8])
+        ) for row in rows]
+
+    def get_reposted_since(self, since):
+        return self.conn.execute(
+            'SELECT source_id, channel_id, message_id FROM reposted_messages WHERE repost_date >= ?',
+            (since.astimezone().replace(tzinfo=None).isoformat(),)
+        ).fetchall()
+
+    def is_reposted(self, message_id, channel_id, source_id):
+        return self.conn.execute(
+            'SELECT 1 FROM reposted_messages WHERE source_id = ? AND channel_id = ? AND message_id = ?',
+            (source_id, channel_id, message_id)
+        ).fetchone() is not None
+
+    def mark_reposted_many(self, entries):
+        now = datetime.now().isoformat()
+        self.conn.execute('BEGIN')
+        self.conn.executemany('INSERT OR REPLACE INTO reposted_messages VALUES (?, ?, ?, ?)',
+                              [(s, c, m, now) for s, c, m in entries])
+        self.conn.execute('COMMIT')
+
+    def prune_reposted(self, older_than):
+        self.conn.execute('BEGIN')
+        removed = self.conn.execute('DELETE FROM reposted_messages WHERE repost_date < ?',
+                                    (older_than.astimezone().replace(tzinfo=None).isoformat(),)).rowcount
+        self.conn.execute('COMMIT')
+        return removed
+
+    def close(self):
+        self.conn.close()
+
+
+def run(name, db, path, channels, reposts):
+    rng = random.Random(2)
+    since = datetime.now(timezone.utc) - timedelta(days=90)
+    keys = [(i % channels, (i * 7) % channels, i) for i in (rng.randrange(reposts * 2) for _ in range(LOOKUPS))]
+    load, configs = timed(db.get_all_channels)
+    window, rows = timed(lambda: db.get_reposted_since(since))
+    lookups, found = timed(lambda: sum(db.is_reposted(m, c, s) for s, c, m in keys))
+    entries = [(i % channels, (i * 7) % channels, i) for i in range(reposts, reposts + WRITES)]
+    writes, _ = timed(lambda: [db.mark_reposted_many(entries[i:i + WRITE_BATCH])
+                               for i in range(0, WRITES, WRITE_BATCH)])
+    prune, removed = timed(lambda: db.prune_reposted(since))
+    db.close()
+    print(f"{name:>6} | каналы {load * 1000:>6.1f} мс | окно {len(rows):>7} за {window * 1000:>6.1f} мс | "
+          f"проверка {lookups / LOOKUPS * 1e6:>5.1f} мкс | запись {WRITES / writes:>7.0f} строк/с | "
+          f"чистка {removed} за {prune * 1000:>6.1f} мс | файл {os.path.getsize(path) / 2 ** 20:>5.1f} МБ")
+    return found
+
+
+def main(channels, reposts):
+    with tempfile.TemporaryDirectory() as tmp:
+        before = os.path.join(tmp, 'before.db')
+        after = os.path.join(tmp, 'after.db')
+        build_legacy(before, channels, reposts)
+        shutil.copy(before, after)
+
+        conn = sqlite3.connect(after, isolation_level=None)
+        elapsed, applied = timed(lambda: migrate(conn))
+        conn.execute('VACUUM')
+        conn.close()
+        print(f"Миграция {applied} на месте: {elapsed:.2f} с ({channels} каналов, {reposts} репостов)")
+
+        found_before = run('до', LegacyQueries(before), before, channels, reposts)
+        found_after = run('после', Database(after), after, channels, reposts)
+        assert found_before == found_after, (found_before, found_after)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000, int(sys.argv[2]) if len(sys.argv) > 2 else 500_000)
@@ -0,0 +1,112 @@
+"""Сквозной бенчмарк бота на поддельном Telegram.
+
+ChannelReposter целиком (планировщики, Warmup, буфер источников, учёт
+репостов, база в потоке AsyncDatabase) работает против FakeTelegram на
+виртуальном времени: N каналов с синтетической историей, у каждого своё
+расписание, каждый вызов API ждёт заданную задержку и может получить
+flood wait. Сутки работы проходят за секунды реального времени.
+
+Печатается пропускная способность (постов в секунду виртуального
+времени), сколько вызовов API уходит на один пост, сколько было flood
+wait и сколько памяти занял бот (tracemalloc, пик и остаток).
+
+    python bench_e2e.py [каналов] [часов] [постов_в_день] [задержка_сек] [доля_flood]
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from config import ChannelConfig
+from database import Database
+from fake_telegram import FakeTelegram, VirtualClockLoop
+
+START = datetime(2024, 6, 1, tzinfo=timezone.utc).timestamp()
+HISTORY = 30
+
+
+def fill(path, backend, channels, posts_per_day):
+    """Каналы с историей в FakeTelegram и их расписание в базе бота"""
+    rng = random.Random(1)
+    db = Database(path)
+    start_date = datetime.fromtimestamp(START, timezone.utc) - timedelta(days=365)
+    for index in range(channels):
+        channel_id = backend.add_channel(index + 1, posts=HISTORY)
+        last = datetime.fromtimestamp(START - rng.uniform(0, 86400 / posts_per_day), timezone.utc)
+        db.add_channel(ChannelConfig(
+            channel_id, posts_per_day, start_date, last_repost_date=last.replace(microsecond=0)
+        ))
+    db.close()
+
+
+async def simulate(bot, backend, hours):
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    runner = asyncio.create_task(bot.start())
+    await asyncio.sleep(hours * 3600)
+    await bot.client.disconnect()
+    await runner
+    return time.perf_counter() - started, loop.time() - START
+
+
+def main(channels, hours, posts_per_day, latency, flood_probability):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Кеш медиа бот создаёт в текущем каталоге
+        os.chdir(tmp)
+        from main import ChannelReposter
+        logging.disable(logging.INFO)
+
+        loop = VirtualClockLoop(START)
+        asyncio.set_event_loop(loop)
+        backend = FakeTelegram(latency=latency, jitter=latency / 2, flood_probability=flood_probability,
+                               clock=loop.time)
+        path = os.path.join(tmp, 'bench.db')
+        fill(path, backend, channels, posts_per_day)
+        before = {peer_id: len(channel.messages) for peer_id, channel in backend.channels.items()}
+        calls_before = backend.api_calls
+
+        tracemalloc.start()
+        bot = ChannelReposter(client_factory=backend.client, db_name=path, session_names=['bench'],
+                              clock=loop.time, metrics_port=None)
+        # Пока поток базы занят, виртуальные часы стоят
+        loop.busy_hook = lambda: bot.db.pending > 0
+        try:
+            real, virtual = loop.run_until_complete(simulate(bot, backend, hours))
+        finally:
+            loop.run_until_complete(loop.shutdown_default_executor())
+            asyncio.set_event_loop(None)
+            loop.close()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    # Альбом — один пост из нескольких сообщений
+    posts = sum(
+        len({msg.grouped_id or -msg.id for msg in channel.messages[before[peer_id]:]})
+        for peer_id, channel in backend.channels.items()
+    )
+    calls = backend.api_calls - calls_before
+    expected = channels * posts_per_day * hours / 24
+    print(f"{channels} каналов по {posts_per_day} постов в день, {hours} ч виртуальных за {real:.1f} с реальных")
+    print(f"Постов: {posts} из ~{expected:.0f} по расписанию, {posts / virtual:.3f} постов/с, "
+          f"{posts / real:.0f} постов на секунду симуляции")
+    print(f"Вызовов API: {calls}, на пост {calls / max(posts, 1):.2f} "
+          f"({', '.join(f'{name} {count}' for name, count in backend.calls.most_common())})")
+    print(f"Flood wait: {sum(backend.floods.values())}")
+    print(f"Память бота: пик {peak / 2 ** 20:.1f} МБ, после остановки {current / 2 ** 20:.1f} МБ, "
+          f"{peak / channels / 1024:.1f} КБ на канал")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if len(args) > 0 else 1000,
+        float(args[1]) if len(args) > 1 else 24,
+        int(args[2]) if len(args) > 2 else 24,
+        float(args[3]) if len(args) > 3 else 0.05,
+        float(args[4]) if len(args) > 4 else 0.0
+    )
@@ -0,0 +1,90 @@
+"""Бенчмарк фильтра постов с тысячами правил.
+
+Получатель с N словами чёрного списка, N/10 регулярными выражениями и
+N/100 заменами. Меряется время одного поста через скомпилированный
+фильтр (автомат Ахо — Корасик, общая альтернатива регулярных
+выражений) и, для сравнения, через перебор правил по одному. Посты —
+случайные подписи длиной 30-300 слов, каждый десятый с запрещённым
+словом.
+
+    python bench_filters.py [слов] [постов]
+"""
+import random
+import re
+import statistics
+import sys
+import time
+from content_filter import REGEX, REPLACE, STRIP_LINKS, WORD, CompiledFilter, FilterRule, normalize
+from posts import PostUnit
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def word(rng, low=4, high=10):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(low, high)))
+
+
+def make_rules(rng, count):
+    rules = [FilterRule(None, 1, WORD, word(rng, 6, 12)) for _ in range(count)]
+    rules += [FilterRule(None, 1, REGEX, f"{word(rng, 5, 8)}\\s+\\d+{word(rng, 2, 3)}") for _ in range(count // 10)]
+    rules += [FilterRule(None, 1, REPLACE, word(rng, 6, 10), '') for _ in range(count // 100)]
+    rules.append(FilterRule(None, 1, STRIP_LINKS))
+    return rules
+
+
+def make_posts(rng, rules, count):
+    words = [rule.pattern for rule in rules if rule.kind == WORD]
+    posts = []
+    for index in range(count):
+        text = [word(rng) for _ in range(rng.randint(30, 300))]
+        if index % 10 == 0:
+            text.insert(rng.randrange(len(text)), rng.choice(words))
+        posts.append(PostUnit(1, None, (index,), caption=' '.join(text)))
+    return posts
+
+
+def naive(rules):
+    """Перебор правил по одному: так фильтр выглядел бы без компиляции в общий автомат"""
+    words = [normalize(rule.pattern) for rule in rules if rule.kind == WORD]
+    patterns = [re.compile(rule.pattern, re.IGNORECASE) for rule in rules if rule.kind == REGEX]
+    replaces = [(re.compile(rule.pattern, re.IGNORECASE), rule.replacement) for rule in rules if rule.kind == REPLACE]
+
+    def apply(post):
+        text = normalize(post.caption)
+        if any(item in text for item in words) or any(pattern.search(post.caption) for pattern in patterns):
+            return None
+        caption = post.caption
+        for pattern, replacement in replaces:
+            caption = pattern.sub(replacement, caption)
+        return caption
+    return apply
+
+
+def measure(apply, posts):
+    timings = []
+    blocked = 0
+    for post in posts:
+        started = time.perf_counter()
+        result = apply(post)
+        timings.append(time.perf_counter() - started)
+        blocked += result is None or (isinstance(result, tuple) and result[0] is None)
+    timings.sort()
+    return timings, blocked
+
+
+def main(count, posts_count):
+    rng = random.Random(1)
+    rules = make_rules(rng, count)
+    posts = make_posts(rng, rules, posts_count)
+    started = time.perf_counter()
+    compiled = CompiledFilter(rules)
+    print(f"Правил: {len(rules)} (слов {count}), компиляция {(time.perf_counter() - started) * 1000:.0f} мс")
+    for name, apply in (('скомпилированный', compiled.apply), ('перебор', naive(rules))):
+        timings, blocked = measure(apply, posts)
+        print(f"{name:>16}: p50 {statistics.median(timings) * 1e6:>8.1f} мкс, "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1e6:>8.1f} мкс, "
+              f"среднее {statistics.mean(timings) * 1e6:>8.1f} мкс на пост, отброшено {blocked}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
@@ -0,0 +1,122 @@
+"""Бенчмарк памяти группировки сообщений в посты на потоке из 100k сообщений.
+
+Прежняя группировка (_group_messages) получала весь список сообщений,
+собирала альбомы в словарь и держала все объекты Message до конца
+прохода. Потоковый AlbumGrouper сворачивает сообщения в PostUnit по мере
+поступления и задерживает только незавершённый альбом. Сравнивается пик
+памяти (tracemalloc) за проход; «поток+все» держит все посты до конца,
+как буфер источника, и показывает размер самих PostUnit.
+
+    python bench_grouping.py [сообщений]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from posts import AlbumGrouper
+
+
+class FakeMessage:
+    """Похож на Message Telethon по числу полей: большинство постов несут много служебного"""
+
+    def __init__(self, message_id, grouped_id):
+        self.id = message_id
+        self.grouped_id = grouped_id
+        self.chat_id = -1001234567890
+        self.peer_id = {'channel_id': 1234567890}
+        self.date = datetime.now(timezone.utc)
+        self.message = 'Текст поста ' * 20
+        self.entities = [{'offset': 0, 'length': 5}]
+        self.media = {'document': message_id, 'access_hash': message_id * 31, 'file_reference': b'x' * 24}
+        self.reply_markup = None
+        self.out = False
+        self.mentioned = False
+        self.media_unread = False
+        self.silent = False
+        self.post = True
+        self.from_scheduled = False
+        self.legacy = False
+        self.edit_hide = False
+        self.pinned = False
+        self.noforwards = False
+        self.from_id = None
+        self.fwd_from = None
+        self.via_bot_id = None
+        self.reply_to = None
+        self.views = random.randrange(10_000)
+        self.forwards = random.randrange(100)
+        self.replies = {'replies': 0, 'replies_pts': 0}
+        self.edit_date = None
+        self.post_author = 'Автор'
+        self.reactions = [{'emoticon': '👍', 'count': random.randrange(100)}]
+        self.restriction_reason = []
+        self.ttl_period = None
+        self._client = None
+        self._text = None
+
+
+def stream(count):
+    message_id = 1
+    while message_id <= count:
+        size = 1 if random.random() < 0.7 else random.randint(2, 10)
+        grouped_id = message_id if size > 1 else None
+        for i in range(message_id, min(message_id + size, count + 1)):
+            yield FakeMessage(i, grouped_id)
+        message_id += size
+
+
+def legacy_group_messages(messages):
+    """Прежний _group_messages из main.py"""
+    albums = []
+    single_messages = []
+    grouped = {}
+    for msg in reversed(messages):
+        if not msg:
+            continue
+        if getattr(msg, 'grouped_id', None):
+            grouped.setdefault(msg.grouped_id, []).append(msg)
+        else:
+            single_messages.append(msg)
+    for group in sorted(grouped.values(), key=lambda x: x[0].date):
+        albums.append(sorted(group, key=lambda m: m.id))
+    return albums + [[msg] for msg in single_messages]
+
+
+def measure(name, func, count):
+    random.seed(1)
+    tracemalloc.start()
+    started = time.perf_counter()
+    posts = func(count)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>10} | {posts:>7} постов | {elapsed:>5.2f} с | пик {peak / 2 ** 20:>7.1f} МБ")
+
+
+def run_legacy(count):
+    return len(legacy_group_messages(list(stream(count))))
+
+
+def run_streaming(count):
+    grouper = AlbumGrouper()
+    posts = 0
+    for msg in stream(count):
+        posts += len(grouper.feed(msg))
+    return posts + len(grouper.flush())
+
+
+def run_streaming_kept(count):
+    grouper = AlbumGrouper()
+    kept = []
+    for msg in stream(count):
+        kept.extend(grouper.feed(msg))
+    kept.extend(grouper.flush())
+    return len(kept)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    measure('прежняя', run_legacy, count)
+    measure('поток', run_streaming, count)
+    measure('поток+все', run_streaming_kept, count)
@@ -0,0 +1,106 @@
+"""Бенчмарк задержки event loop при шквале ошибок в журнале.
+
+Задачи-«каналы» без перерыва пишут ошибки отправки (как при обрыве
+связи), а отдельная задача просыпается каждые 5 мс и меряет, насколько
+позже срока её разбудили — столько же ждал бы ответ на команду.
+Сравниваются прежняя настройка (FileHandler и StreamHandler прямо в
+event loop), LogPipeline без выборки и LogPipeline с выборкой
+повторяющихся ошибок. Консоль направлена в /dev/null.
+
+    python bench_logging.py [задач] [секунд]
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from log_pipeline import LogPipeline, bind
+
+TICK = 0.005
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, time.perf_counter() - started - TICK))
+
+
+async def storm(channel_id, stop, counter):
+    log = logging.getLogger('bench')
+    bind(channel_id=channel_id)
+    message_id = 0
+    while not stop.is_set():
+        message_id += 1
+        log.error(f"Ошибка отправки одиночного сообщения в канал {channel_id}: Connection reset by peer",
+                  extra={'message_id': message_id})
+        counter[0] += 1
+        if message_id % 20 == 0:
+            # Между вызовами API задача отдаёт управление
+            await asyncio.sleep(0)
+
+
+async def measure(tasks, seconds):
+    stop = asyncio.Event()
+    lags, counter = [], [0]
+    runners = [asyncio.create_task(storm(channel_id, stop, counter)) for channel_id in range(tasks)]
+    tick = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(tick, *runners)
+    return lags, counter[0]
+
+
+def legacy(path):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    text = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [logging.FileHandler(path, encoding='utf-8'), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(text)
+        root.addHandler(handler)
+
+    def stop():
+        for handler in handlers:
+            root.removeHandler(handler)
+            handler.close()
+    return stop
+
+
+def run(name, setup, tasks, seconds, path):
+    stop = setup(path)
+    started = time.perf_counter()
+    lags, emitted = asyncio.run(measure(tasks, seconds))
+    stop()
+    elapsed = time.perf_counter() - started
+    lags.sort()
+    folder = os.path.dirname(path)
+    # Вместе с файлами после ротации
+    size = sum(os.path.getsize(os.path.join(folder, file)) for file in os.listdir(folder)
+               if file.startswith(os.path.basename(path)))
+    print(f"{name:>18} | задержка p50 {statistics.median(lags) * 1000:>6.2f} мс, "
+          f"p99 {lags[int(len(lags) * 0.99)] * 1000:>7.2f} мс, макс {lags[-1] * 1000:>7.1f} мс | "
+          f"записей {emitted / seconds:>8.0f}/с, в журнал {size / elapsed / 2 ** 20:>6.1f} МБ/с")
+
+
+def main(tasks, seconds):
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        for index, (name, setup) in enumerate((
+            ('прежний', legacy),
+            ('конвейер', lambda path: LogPipeline(path, sample_limit=0).start().stop),
+            ('конвейер+выборка', lambda path: LogPipeline(path).start().stop),
+        )):
+            # StreamHandler запоминает sys.stderr при создании
+            stderr, sys.stderr = sys.stderr, devnull
+            try:
+                run(name, setup, tasks, seconds, os.path.join(tmp, f'bot{index}.log'))
+            finally:
+                sys.stderr = stderr
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50, float(sys.argv[2]) if len(sys.argv) > 2 else 3)
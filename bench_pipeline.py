@@ -0,0 +1,92 @@
+"""Бенчмарк быстрого репоста истории: последовательно против конвейера.
+
+Поддельный клиент отдаёт историю страницами по 100 сообщений с задержкой
+сети и «пересылает» пачку с задержкой отправки. Старая схема загружает
+всё окно одним get_messages и затем отправляет пачки по очереди с паузой
+в 1 секунду (пауза масштабируется параметром scale). Конвейер загружает
+следующие страницы, пока отправляется текущая пачка. Сравниваются
+сообщений в минуту и пик памяти (tracemalloc).
+
+    python bench_pipeline.py [сообщений] [scale]
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+from pipeline import batch_posts, run_pipeline
+
+PAGE_SIZE = 100
+PAGE_LATENCY = 0.02
+SEND_LATENCY = 0.02
+
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.id = message_id
+        self.text = 'x' * 200
+        self.media = None
+        self.grouped_id = None
+
+
+class FakeClient:
+    """Имитация iter_messages/forward_messages Telethon с задержками"""
+
+    def __init__(self, total):
+        self.total = total
+        self.sent = 0
+
+    async def iter_messages(self, limit):
+        for start in range(1, min(limit, self.total) + 1, PAGE_SIZE):
+            await asyncio.sleep(PAGE_LATENCY)
+            for message_id in range(start, min(start + PAGE_SIZE, limit + 1)):
+                yield FakeMessage(message_id)
+
+    async def get_messages(self, limit):
+        return [msg async for msg in self.iter_messages(limit)]
+
+    async def forward_messages(self, messages):
+        await asyncio.sleep(SEND_LATENCY)
+        self.sent += len(messages)
+
+
+async def serial(client, limit, pause):
+    messages = await client.get_messages(limit)
+    for start in range(0, len(messages), PAGE_SIZE):
+        await client.forward_messages(messages[start:start + PAGE_SIZE])
+        await asyncio.sleep(pause)
+
+
+async def pipelined(client, limit, pause):
+    async def posts():
+        async for msg in client.iter_messages(limit):
+            yield [msg]
+
+    async def deliver(batch):
+        await client.forward_messages([msg for group in batch for msg in group])
+
+    await run_pipeline(batch_posts(posts(), PAGE_SIZE), deliver)
+
+
+def measure(name, runner, limit, pause):
+    client = FakeClient(limit)
+    tracemalloc.start()
+    started = time.perf_counter()
+    asyncio.run(runner(client, limit, pause))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rate = client.sent / elapsed * 60
+    print(f"{name:10} {client.sent:7} сообщений за {elapsed:6.2f} с, "
+          f"{rate:10.0f} в минуту, пик памяти {peak / 1024:8.0f} КБ")
+
+
+def main(limit, scale):
+    measure('serial', serial, limit, 1.0 * scale)
+    measure('pipeline', pipelined, limit, 0)
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    )
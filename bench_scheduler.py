@@ -0,0 +1,76 @@
+"""Бенчмарк планировщика на симулированных часах.
+
+Сравнивает старую модель (воркер на канал, пробуждение каждые 300 с
+с чтением канала из БД) и центральную кучу дедлайнов: считает
+пробуждения и чтения БД за сутки для разного числа каналов.
+
+    python bench_scheduler.py [N ...]
+"""
+import heapq
+import random
+import sys
+import time
+from scheduler import DeadlineHeap
+
+DAY = 86400
+POLL_INTERVAL = 300
+
+
+def make_channels(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    return [(channel_id, rng.randint(1, 48)) for channel_id in range(count)]
+
+
+def simulate_polling(channels):
+    """Каждый воркер просыпается раз в 300 с и читает канал из БД"""
+    wakeups = db_reads = posts = 0
+    timers = [(rng_offset * POLL_INTERVAL / len(channels), channel_id, 0.0, ppd)
+              for rng_offset, (channel_id, ppd) in enumerate(channels)]
+    heapq.heapify(timers)
+    while timers:
+        now, channel_id, last, ppd = heapq.heappop(timers)
+        if now >= DAY:
+            continue
+        wakeups += 1
+        db_reads += 1
+        interval = DAY / ppd
+        if now - last >= interval:
+            posts += 1
+            last = now
+            # Старый воркер спал interval после поста, затем ещё 300 с
+            heapq.heappush(timers, (now + interval + POLL_INTERVAL, channel_id, last, ppd))
+        else:
+            heapq.heappush(timers, (now + POLL_INTERVAL, channel_id, last, ppd))
+    return wakeups, db_reads, posts
+
+
+def simulate_heap(channels):
+    """Один планировщик спит до ближайшего дедлайна"""
+    heap = DeadlineHeap()
+    intervals = {}
+    for channel_id, ppd in channels:
+        intervals[channel_id] = DAY / ppd
+        heap.push(channel_id, intervals[channel_id])
+    wakeups = posts = 0
+    while heap.peek() is not None and heap.peek() < DAY:
+        now = heap.peek()
+        wakeups += 1
+        for channel_id in heap.pop_due(now):
+            posts += 1
+            heap.push(channel_id, now + intervals[channel_id])
+    return wakeups, 0, posts
+
+
+def main(sizes):
+    print(f"{'channels':>9} | {'model':>8} | {'wakeups':>10} | {'db reads':>10} | {'posts':>8} | {'cpu s':>6}")
+    for size in sizes:
+        channels = make_channels(size)
+        for name, simulate in (('polling', simulate_polling), ('heap', simulate_heap)):
+            started = time.perf_counter()
+            wakeups, reads, posts = simulate(channels)
+            elapsed = time.perf_counter() - started
+            print(f"{size:>9} | {name:>8} | {wakeups:>10} | {reads:>10} | {posts:>8} | {elapsed:>6.2f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 10000])
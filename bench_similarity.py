@@ -0,0 +1,84 @@
+"""Бенчмарк поиска похожих постов в индексе отпечатков.
+
+В индекс одного получателя (худший случай: всё окно в одном канале)
+записывается N случайных отпечатков, затем меряется задержка поиска
+по полосам и, для сравнения, полного перебора всех отпечатков.
+
+    python bench_similarity.py [отпечатков] [получателей]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from database import Database
+from similarity import BITS, SimilarityIndex, _signed, hamming
+
+LOOKUPS = 200
+
+
+class SyncDb:
+    """Database с async-интерфейсом без потоков: меряем сам запрос"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+
+        async def call(*args):
+            return method(*args)
+        return call
+
+
+async def run(count: int, destinations: int):
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), wal=True)
+        index = SimilarityIndex(SyncDb(db), max_distance=6, window_days=7)
+        fingerprints = [rng.getrandbits(BITS) for _ in range(count)]
+        started = time.perf_counter()
+        now = int(time.time())
+        for offset in range(0, count, 10_000):
+            rows = [
+                (i % destinations, 'text', bucket, _signed(value), now)
+                for i, value in enumerate(fingerprints[offset:offset + 10_000], offset)
+                for bucket in index.buckets(value)
+            ]
+            db.add_fingerprints(rows)
+        print(f"Записано {count} отпечатков ({count * index.bands} строк) за {time.perf_counter() - started:.1f} с")
+
+        queries = [value ^ (1 << rng.randrange(BITS)) for value in rng.sample(fingerprints, LOOKUPS // 2)]
+        queries += [rng.getrandbits(BITS) for _ in range(LOOKUPS // 2)]
+        banded = []
+        found = 0
+        for value in queries:
+            started = time.perf_counter()
+            found += await index.find(0, [('text', value)]) is not None
+            banded.append(time.perf_counter() - started)
+
+        scan = []
+        for value in queries[:20]:
+            started = time.perf_counter()
+            rows = db.conn.execute(
+                'SELECT DISTINCT fingerprint FROM similarity WHERE destination_id = 0 AND kind = ?', ('text',)
+            ).fetchall()
+            any(hamming(row[0] % (1 << BITS), value) <= index.max_distance for row in rows)
+            scan.append(time.perf_counter() - started)
+
+    def ms(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+    print(f"Найдено похожих: {found} из {LOOKUPS // 2} искажённых копий")
+    print(f"По полосам: p50 {ms(banded, 0.5):.3f} мс, p99 {ms(banded, 0.99):.3f} мс, "
+          f"среднее {statistics.mean(banded) * 1000:.3f} мс")
+    print(f"Перебор:    p50 {ms(scan, 0.5):.1f} мс")
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    destinations = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    asyncio.run(run(count, destinations))
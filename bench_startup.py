@@ -0,0 +1,116 @@
+"""Бенчмарк холодного старта для большого числа каналов.
+
+В базу записывается N каналов со случайным расписанием и последним
+репостом за последние двое суток (часть каналов просрочена, как после
+простоя при деплое). Сравниваются прежний запуск (все каналы ставятся в
+расписание одним проходом, просроченные стартуют разом) и Warmup
+(пачки с паузой, самые просроченные первыми). Время пауз — виртуальное;
+реальным меряется, сколько event loop занят без передышки (столько
+ждут ответа команды) и время чтения каналов из базы (в боте оно идёт в
+потоке AsyncDatabase и цикл не занимает).
+
+    python bench_startup.py [каналов]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from config import STARTUP_BATCH_INTERVAL, STARTUP_BATCH_SIZE, STARTUP_JITTER, ChannelConfig
+from database import Database
+from scheduler import RepostScheduler, next_deadline
+from warmup import Warmup
+
+
+class VirtualTime:
+    def __init__(self, now):
+        self.now = now
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        # Здесь event loop свободен и обслуживает команды
+        await asyncio.sleep(0)
+
+
+def fill(db, count, now):
+    rng = random.Random(1)
+    for channel_id in range(count):
+        last = now - timedelta(seconds=rng.uniform(0, 2 * 86400))
+        db.add_channel(ChannelConfig(
+            channel_id, rng.randint(1, 48), datetime(2020, 1, 1, tzinfo=timezone.utc), last_repost_date=last
+        ))
+
+
+async def handler(config):
+    return config
+
+
+def peak_per_second(times):
+    return max(Counter(int(at) for at in times).values()) if times else 0
+
+
+async def run(count: int):
+    now = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), wal=True)
+        fill(db, count, now)
+
+        started = time.perf_counter()
+        channels = db.get_all_channels()
+        load = time.perf_counter() - started
+        print(f"Чтение {count} каналов из базы: {load * 1000:.0f} мс")
+
+        # Прежний запуск: один проход без await, затем все просроченные — в одну секунду
+        scheduler = RepostScheduler(handler, clock=now.timestamp)
+        started = time.perf_counter()
+        for config in channels:
+            scheduler.schedule(config)
+        blocked = time.perf_counter() - started
+        overdue = len(scheduler.heap.pop_due(now.timestamp()))
+        print(f"Прежний: цикл занят {blocked * 1000:.0f} мс, просроченных {overdue}, "
+              f"в первую секунду {overdue} запусков ({overdue * 2} запросов get_entity+история)")
+
+        # Warmup: пачки по STARTUP_BATCH_SIZE; первая обработка просроченного канала — в момент запуска
+        virtual = VirtualTime(now.timestamp())
+        warmup = Warmup(STARTUP_BATCH_SIZE, STARTUP_BATCH_INTERVAL, STARTUP_JITTER,
+                        clock=virtual.clock, sleep=virtual.sleep, rng=random.Random(1))
+        scheduler = RepostScheduler(handler, clock=virtual.clock)
+        first_runs = []
+        slices = []
+
+        def activate(config):
+            async def run_one():
+                scheduler.schedule(config)
+                deadline = next_deadline(config)
+                if deadline <= virtual.now:
+                    first_runs.append(virtual.now - warmup.started_at)
+            return run_one
+
+        started = time.perf_counter()
+        for config in channels:
+            warmup.submit(config.channel_id, next_deadline(config), activate(config))
+        slices.append(time.perf_counter() - started)
+
+        original = warmup._activate
+
+        async def timed_activate(batch):
+            started = time.perf_counter()
+            await original(batch)
+            slices.append(time.perf_counter() - started)
+        warmup._activate = timed_activate
+        await warmup.drain()
+
+        print(f"Warmup:  цикл занят не дольше {max(slices) * 1000:.0f} мс подряд, пачек {warmup.batches}, "
+              f"в секунду не больше {peak_per_second(first_runs)} запусков, "
+              f"все каналы запущены за {warmup.ready_seconds:.0f} с (виртуальных)")
+        db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
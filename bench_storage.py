@@ -0,0 +1,86 @@
+"""Бенчмарк задержки event loop при нагрузке на БД.
+
+Параллельно с потоком записей (update_last_repost + mark_reposted) в
+цикле крутится «пульс», который засыпает на 1 мс и меряет, насколько
+позже он проснулся. Сравниваются синхронный Database (вызовы прямо в
+event loop, коммит на каждую строку) и AsyncDatabase.
+
+    python bench_storage.py [операций]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from config import ChannelConfig
+from database import Database
+from storage import AsyncDatabase
+
+CHANNELS = 100
+WORKERS = 50
+
+
+async def heartbeat(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def run_load(db, operations, is_async):
+    async def worker(worker_id):
+        for i in range(worker_id, operations, WORKERS):
+            channel_id = i % CHANNELS
+            now = datetime.now(timezone.utc)
+            if is_async:
+                await db.update_last_repost(channel_id, now)
+                await db.mark_reposted(i, channel_id)
+            else:
+                db.update_last_repost(channel_id, now)
+                db.mark_reposted(i, channel_id)
+                await asyncio.sleep(0)
+
+    lags = []
+    stop = asyncio.Event()
+    pulse = asyncio.create_task(heartbeat(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(WORKERS)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await pulse
+    return elapsed, lags
+
+
+def report(name, operations, elapsed, lags):
+    lags = sorted(lags) or [0.0]
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(
+        f"{name:>6} | {operations / elapsed:>9.0f} ops/s | "
+        f"lag p50 {statistics.median(lags) * 1000:>7.2f} ms | "
+        f"p99 {p99 * 1000:>7.2f} ms | max {lags[-1] * 1000:>7.2f} ms"
+    )
+
+
+async def main(operations):
+    now = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(os.path.join(tmp, 'sync.db'))
+        for channel_id in range(CHANNELS):
+            sync_db.add_channel(ChannelConfig(channel_id, 2, now, last_repost_date=now))
+        elapsed, lags = await run_load(sync_db, operations, False)
+        report('sync', operations * 2, elapsed, lags)
+        sync_db.close()
+
+        async_db = AsyncDatabase(os.path.join(tmp, 'async.db'))
+        for channel_id in range(CHANNELS):
+            await async_db.add_channel(ChannelConfig(channel_id, 2, now, last_repost_date=now))
+        elapsed, lags = await run_load(async_db, operations, True)
+        report('async', operations * 2, elapsed, lags)
+        print(f"async: {async_db.writes} записей в {async_db.commits} коммитах")
+        await async_db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Консистентное хеширование с виртуальными узлами.
+
+    При выпадении узла на другие переезжают только его ключи, остальные
+    остаются на месте.
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 64):
+        self.replicas = replicas
+        self.nodes: List[str] = []
+        self._points: List[Tuple[int, str]] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        self._points.extend((_hash(f'{node}#{i}'), node) for i in range(self.replicas))
+        self._points.sort()
+
+    def nodes_for(self, key: Hashable) -> Iterator[str]:
+        """Узлы в порядке предпочтения для ключа (каждый по одному разу)"""
+        if not self._points:
+            return
+        start = bisect_right(self._points, (_hash(str(key)), ''))
+        seen = set()
+        for offset in range(len(self._points)):
+            node = self._points[(start + offset) % len(self._points)][1]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+
+@dataclass
+class Session:
+    """Аккаунт пула: клиент, свой регулятор скорости и свой кеш сущностей"""
+    name: str
+    client: Any
+    governor: Any
+    entities: Any
+    connected: bool = True
+    unavailable_until: float = 0.0
+
+
+class ClientPool:
+    """Пул сессий Telegram, между которыми распределяются каналы.
+
+    Канал закрепляется за сессией консистентным хешированием. Сессия,
+    получившая долгий flood wait (не меньше failover_after секунд) или
+    потерявшая соединение, временно выпадает из выбора — её каналы
+    переходят к следующей сессии по кольцу и возвращаются, когда она
+    снова доступна. Первая сессия — основная: через неё работают команды.
+    """
+
+    def __init__(self, sessions: List[Session], replicas: int = 64, failover_after: float = 300,
+                 clock: Callable[[], float] = time.monotonic):
+        if not sessions:
+            raise ValueError("В пуле должна быть хотя бы одна сессия")
+        self.sessions: Dict[str, Session] = {session.name: session for session in sessions}
+        self.primary = sessions[0]
+        self.failover_after = failover_after
+        self.clock = clock
+        self.ring = HashRing(self.sessions, replicas)
+        self.failovers = 0
+        for session in sessions:
+            # Флуд при отправке регулятор отдаёт вызывающему, а тот может его заглушить (outbox):
+            # пул узнаёт о нём прямо из регулятора
+            session.governor.on_flood = lambda seconds, session=session: self.report_flood(
+                session, seconds, frozen=True
+            )
+
+    def __iter__(self) -> Iterator[Session]:
+        return iter(self.sessions.values())
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def is_available(self, session: Session) -> bool:
+        return session.connected and session.unavailable_until <= self.clock()
+
+    def owner(self, key: Hashable) -> Session:
+        """Сессия, за которой канал закреплён, без учёта доступности"""
+        return self.sessions[next(self.ring.nodes_for(key))]
+
+    def session_for(self, key: Hashable, ready: bool = False) -> Optional[Session]:
+        """Первая доступная сессия по кольцу или None, если доступных нет.
+
+        ready — пропускать и сессии на короткой паузе flood wait: их
+        регулятор заморожен, и отправка через них ждала бы конца паузы.
+        """
+        for name in self.ring.nodes_for(key):
+            session = self.sessions[name]
+            if self.is_available(session) and not (ready and session.governor.frozen_for() > 0):
+                return session
+        return None
+
+    def report_flood(self, session: Session, seconds: float, frozen: bool = False) -> bool:
+        """Учесть flood wait; True, если каналы сессии временно переезжают.
+
+        frozen — регулятор сессии уже заморожен этим флудом сам (ошибка
+        пришла из governor.call), повторно его не замораживаем.
+        """
+        if not frozen:
+            session.governor.freeze(seconds)
+        if seconds < self.failover_after or len(self.sessions) == 1:
+            return False
+        session.unavailable_until = max(session.unavailable_until, self.clock() + seconds)
+        self.failovers += 1
+        logger.warning(f"Сессия {session.name}: flood wait {seconds} с, каналы переходят к другим сессиям")
+        return True
+
+    def set_connected(self, session: Session, connected: bool) -> bool:
+        """Обновить состояние соединения; True, если оно изменилось"""
+        if session.connected == connected:
+            return False
+        session.connected = connected
+        if connected:
+            logger.info(f"Сессия {session.name} снова на связи")
+        else:
+            self.failovers += 1
+            logger.warning(f"Сессия {session.name} отключилась, каналы переходят к другим сессиям")
+        return True
+
+    def assignments(self, keys: Iterable[Hashable]) -> Dict[str, int]:
+        """Сколько ключей сейчас обслуживает каждая сессия"""
+        counts = {name: 0 for name in self.sessions}
+        for key in keys:
+            session = self.session_for(key)
+            if session is not None:
+                counts[session.name] += 1
+        return counts
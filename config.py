@@ -1,6 +1,7 @@
+import os
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Optional, Tuple
 
 @dataclass
 class ChannelConfig:
@@ -10,8 +11,122 @@ class ChannelConfig:
     is_active: bool = True
     last_repost_date: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
     interval_seconds: Optional[int] = None
+    # Копировать посты пакетной пересылкой вместо повторной загрузки медиа
+    forward_mode: bool = True
+    # Скрывать автора при пересылке (пост выглядит как собственный)
+    drop_author: bool = True
+    # id последнего просмотренного сообщения источника
+    last_seen_message_id: int = 0
+    # Брать новые посты из живых обновлений вместо опроса истории
+    live_mode: bool = False
+
+@dataclass
+class RouteConfig:
+    """Маршрут: посты канала-источника копируются в канал-получатель"""
+    source_id: int
+    destination_id: int
+    start_date: datetime
+    is_active: bool = True
+    last_repost_date: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    # Собственное расписание получателя; None — как у канала-источника
+    posts_per_day: Optional[int] = None
+    interval_seconds: Optional[int] = None
+    # id последнего просмотренного сообщения источника для этого получателя
+    last_seen_message_id: int = 0
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.source_id, self.destination_id
+
+    @property
+    def has_schedule(self) -> bool:
+        return bool(self.posts_per_day or self.interval_seconds)
 
 API_ID = 20871122  # <-- Ваш настоящий API ID, обязательно число!
 API_HASH = "1f25ee7d62859a93eb9d3eeec9375ccc"
 SESSION_NAME = "Skuff"
-DATABASE_NAME = "channels.db"
\ No newline at end of file
+# Сессии пула аккаунтов; первая — основная (через неё работают команды).
+# Каждая сессия должна быть авторизована и состоять в обслуживаемых каналах
+# Несколько процессов (см. SHARDING) задают свои сессии через REPOST_SESSIONS=a,b
+SESSION_NAMES = [name for name in os.environ.get('REPOST_SESSIONS', '').split(',') if name] or [SESSION_NAME]
+DATABASE_NAME = "channels.db"
+# Ограничения скорости отправки (на аккаунт и на канал-получатель)
+SEND_RATE_PER_SECOND = 1.0
+SEND_BURST = 5
+DESTINATION_SENDS_PER_MINUTE = 20
+DESTINATION_BURST = 3
+
+# Сколько дней хранить записи о пересланных сообщениях
+REPOSTED_RETENTION_DAYS = 90
+
+# Сколько постов держать в очереди живых обновлений одного канала
+LIVE_QUEUE_SIZE = 100
+
+# Кеш сущностей: TTL в памяти (сек) и срок хранения в базе (дни)
+ENTITY_CACHE_TTL = 6 * 3600
+ENTITY_CACHE_PERSIST_DAYS = 30
+
+# Сколько задач репоста истории выполняется одновременно
+JOB_CONCURRENCY = 2
+# Сколько пачек быстрого репоста загружать наперёд, пока идёт отправка
+PIPELINE_DEPTH = 2
+
+# Общий буфер постов источника для маршрутов: сколько постов держать
+# в памяти и сколько секунд не перепроверять конец истории
+SOURCE_BUFFER_POSTS = 500
+SOURCE_TAIL_TTL = 60
+
+# Локальный HTTP-эндпоинт метрик в формате Prometheus (None — выключен)
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9464
+
+# Flood wait не короче этого (сек) переводит каналы сессии на другие сессии пула
+SESSION_FAILOVER_FLOOD_SECONDS = 300
+
+# Шардирование: несколько процессов делят одну базу, каналы распределяются
+# арендой с продлением. Имя процесса по умолчанию — хост:pid
+SHARDING = os.environ.get('REPOST_SHARDING') == '1'
+SHARD_OWNER = os.environ.get('REPOST_SHARD_OWNER')
+LEASE_TTL = 30
+LEASE_RENEW_SECONDS = 10
+
+# Кеш медиа для повторной отправки из каналов с запретом пересылки:
+# каталог, предельный размер на диске и параллельное скачивание частями
+MEDIA_CACHE_DIR = 'media_cache'
+MEDIA_CACHE_MAX_BYTES = 2 * 1024 ** 3
+MEDIA_PART_SIZE = 1024 * 1024
+MEDIA_DOWNLOAD_PARTS = 4
+
+# Пропуск похожих постов (источники репостят друг друга): предельное
+# расстояние Хэмминга между отпечатками, окно и размер индекса на получателя,
+# минимальная длина текста в словах для сравнения текстов
+SIMILARITY_MAX_DISTANCE = 6
+SIMILARITY_WINDOW_DAYS = 7
+SIMILARITY_MAX_PER_DESTINATION = 10_000
+SIMILARITY_MIN_WORDS = 5
+
+# Запуск каналов после старта: пачками по STARTUP_BATCH_SIZE (самые
+# просроченные первыми) с паузой STARTUP_BATCH_INTERVAL плюс до STARTUP_JITTER сек
+STARTUP_BATCH_SIZE = 50
+STARTUP_BATCH_INTERVAL = 2.0
+STARTUP_JITTER = 1.0
+
+# Повторы неудачных отправок через outbox: (попыток, начальная пауза, предельная
+# пауза в секундах) для сетевых сбоев и ошибок сервера, flood wait и прочих ошибок.
+# Ошибки запроса (400/403/404) не повторяются: пост сразу уходит в недоставленные
+OUTBOX_RETRY_NETWORK = (6, 10, 900)
+OUTBOX_RETRY_FLOOD = (5, 60, 3600)
+OUTBOX_RETRY_OTHER = (3, 60, 3600)
+# Через сколько секунд вернуться к повтору, который пока нельзя выполнить (нет сессии или аренды)
+OUTBOX_DEFER_SECONDS = 60
+
+# Журнал: файл с ротацией по размеру (или по времени, если задан LOG_ROTATE_WHEN,
+# например 'midnight'), записи в JSON. С одной строки кода за LOG_SAMPLE_WINDOW
+# секунд в журнал попадает не больше LOG_SAMPLE_LIMIT предупреждений и ошибок
+LOG_FILE = 'bot.log'
+LOG_MAX_BYTES = 20 * 1024 ** 2
+LOG_BACKUPS = 5
+LOG_ROTATE_WHEN = None
+LOG_JSON = True
+LOG_SAMPLE_LIMIT = 20
+LOG_SAMPLE_WINDOW = 60
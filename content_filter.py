@@ -0,0 +1,491 @@
+import copy
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from posts import PostUnit
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python до 3.11
+    import sre_constants
+    import sre_parse
+
+# Виды правил: первые четыре отбрасывают пост, последние два меняют подпись
+WORD = 'word'
+REGEX = 'regex'
+MEDIA = 'media'
+MAX_SIZE = 'max_size'
+REPLACE = 'replace'
+STRIP_LINKS = 'strip_links'
+RULE_KINDS = (WORD, REGEX, MEDIA, MAX_SIZE, REPLACE, STRIP_LINKS)
+
+# Типы содержимого для правил media; text — пост без медиа
+MEDIA_KINDS = ('text', 'photo', 'video', 'gif', 'sticker', 'voice', 'audio', 'document', 'poll', 'other')
+
+_LINK = re.compile(r'(?:https?://|www\.|t\.me/)\S+', re.IGNORECASE)
+# Сущности разметки, которые делают текст ссылкой
+_LINK_ENTITIES = ('MessageEntityUrl', 'MessageEntityTextUrl')
+_BACKREFERENCE = re.compile(r'\\\d|\(\?P=')
+# Короче этого буквальный кусок регулярного выражения не отсеивает тексты
+MIN_LITERAL = 3
+_SIZE = re.compile(r'(\d+(?:\.\d+)?)\s*([кkмmгg]?)[бb]?', re.IGNORECASE)
+
+
+@dataclass
+class FilterRule:
+    """Правило фильтра для постов, уходящих получателю destination_id.
+
+    source_id None — для постов из любого источника. Канал, который
+    репостит сам в себя, — это пара (channel_id, channel_id).
+    """
+    source_id: Optional[int]
+    destination_id: int
+    kind: str
+    pattern: str = ''
+    replacement: str = ''
+    rule_id: Optional[int] = None
+    created_at: float = 0.0
+
+    def describe(self) -> str:
+        source = '*' if self.source_id is None else str(self.source_id)
+        value = f"{self.pattern} => {self.replacement}" if self.kind == REPLACE else self.pattern
+        return f"#{self.rule_id} {source} → {self.destination_id}: {self.kind} {value}".rstrip()
+
+
+def parse_size(value: str) -> int:
+    """Размер в байтах из '500', '300К', '20M', '1.5G'"""
+    match = _SIZE.fullmatch(value.strip())
+    if not match:
+        raise ValueError(f"Непонятный размер: {value}")
+    unit = match.group(2).lower()
+    power = {'': 0, 'к': 1, 'k': 1, 'м': 2, 'm': 2, 'г': 3, 'g': 3}[unit]
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+def validate(rule: FilterRule):
+    """Проверить правило до сохранения; ValueError с понятным текстом, если оно не скомпилируется"""
+    if rule.kind not in RULE_KINDS:
+        raise ValueError(f"Неизвестный тип правила {rule.kind}, допустимы: {', '.join(RULE_KINDS)}")
+    if rule.kind in (WORD, REGEX, REPLACE, MEDIA, MAX_SIZE) and not rule.pattern.strip():
+        raise ValueError(f"Для правила {rule.kind} нужно значение")
+    if rule.kind in (REGEX, REPLACE):
+        try:
+            re.compile(rule.pattern)
+        except re.error as e:
+            raise ValueError(f"Ошибка в регулярном выражении: {str(e)}")
+    if rule.kind == REPLACE:
+        try:
+            re.compile(rule.pattern).sub(rule.replacement, '')
+        except (re.error, IndexError) as e:
+            raise ValueError(f"Ошибка в замене: {str(e)}")
+    if rule.kind == MEDIA:
+        unknown = set(_split(rule.pattern)) - set(MEDIA_KINDS)
+        if unknown:
+            raise ValueError(f"Неизвестные типы {', '.join(sorted(unknown))}, допустимы: {', '.join(MEDIA_KINDS)}")
+    if rule.kind == MAX_SIZE:
+        parse_size(rule.pattern)
+
+
+def _split(value: str) -> List[str]:
+    return [item.strip().lower() for item in value.split(',') if item.strip()]
+
+
+def normalize(text: str) -> str:
+    """Текст для поиска слов: без регистра, ё как е"""
+    return text.lower().replace('ё', 'е')
+
+
+def media_kind(media) -> str:
+    """Тип медиа поста по его атрибутам (без скачивания)"""
+    if getattr(media, 'photo', None) is not None:
+        return 'photo'
+    document = getattr(media, 'document', None)
+    if document is not None:
+        attributes = getattr(document, 'attributes', None) or ()
+        names = {type(attribute).__name__: attribute for attribute in attributes}
+        if 'DocumentAttributeSticker' in names:
+            return 'sticker'
+        if 'DocumentAttributeAnimated' in names:
+            return 'gif'
+        if 'DocumentAttributeVideo' in names:
+            return 'video'
+        if 'DocumentAttributeAudio' in names:
+            return 'voice' if getattr(names['DocumentAttributeAudio'], 'voice', False) else 'audio'
+        return 'document'
+    if getattr(media, 'poll', None) is not None:
+        return 'poll'
+    return 'other'
+
+
+class KeywordAutomaton:
+    """Автомат Ахо — Корасик: все слова ищутся за один проход по тексту.
+
+    Стоимость проверки зависит от длины текста, а не от числа слов, поэтому
+    тысячи слов чёрного списка стоят столько же, сколько десяток.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        # Состояние — словарь переходов; fail и output (слова, кончающиеся
+        # в состоянии, вместе со словами-суффиксами) — параллельные списки
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+        self._size = 0
+        for word in words:
+            self._add(normalize(word))
+        self._link()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _add(self, word: str):
+        if not word:
+            return
+        state = 0
+        for char in word:
+            following = self._goto[state].get(char)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][char] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = following
+        if not self._output[state]:
+            self._size += 1
+            self._output[state] = (word,)
+
+    def _link(self):
+        """Ссылки неудачи обходом в ширину; output дополняется словами-суффиксами"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[following] = target if target != following else 0
+                self._output[following] += self._output[self._fail[following]]
+
+    def find_all(self, text: str) -> List[str]:
+        """Все слова, встретившиеся в нормализованном тексте, в порядке первого появления"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found: Dict[str, None] = {}
+        state = 0
+        for char in text:
+            following = goto[state].get(char)
+            while following is None and state:
+                state = fail[state]
+                following = goto[state].get(char)
+            state = following or 0
+            if output[state]:
+                found.update(dict.fromkeys(output[state]))
+        return list(found)
+
+
+def required_literal(pattern: str) -> str:
+    """Самый длинный кусок текста, без которого шаблон не совпадёт ('' — такого нет).
+
+    Берутся подряд идущие буквальные символы верхнего уровня шаблона и
+    обязательных групп; альтернативы, повторы и классы символов кусок
+    прерывают. Кусок приведён к виду normalize(), как и проверяемый текст.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, RecursionError):
+        return ''
+    best = ''
+
+    def walk(items):
+        nonlocal best
+        run = []
+        for op, value in items:
+            if op is sre_constants.LITERAL:
+                run.append(chr(value))
+                continue
+            if len(run) > len(best):
+                best = ''.join(run)
+            run = []
+            if op is sre_constants.SUBPATTERN:
+                walk(value[-1])
+        if len(run) > len(best):
+            best = ''.join(run)
+
+    walk(parsed)
+    return normalize(best)
+
+
+def _combine(patterns: Sequence[str]) -> List[re.Pattern]:
+    """Регулярные выражения одним шаблоном-альтернативой.
+
+    Шаблоны с обратными ссылками (\\1, (?P=имя)) в общей альтернативе
+    поменяли бы смысл — они компилируются отдельно, как и набор, который
+    не собрался целиком (повторяющиеся имена групп).
+    """
+    alone = [pattern for pattern in patterns if _BACKREFERENCE.search(pattern)]
+    combinable = [pattern for pattern in patterns if not _BACKREFERENCE.search(pattern)]
+    compiled = []
+    if combinable:
+        try:
+            compiled.append(re.compile('|'.join(f'(?:{pattern})' for pattern in combinable), re.IGNORECASE))
+        except re.error:
+            alone = list(patterns)
+            compiled = []
+    compiled.extend(re.compile(pattern, re.IGNORECASE) for pattern in alone)
+    return compiled
+
+
+def _utf16(text: str, index: int) -> int:
+    """Позиция index строки в единицах UTF-16, как считает смещения Telegram"""
+    return len(text[:index].encode('utf-16-le')) // 2
+
+
+def _edit(text: str, entities: Optional[list], spans: List[Tuple[int, int, str]]) -> Tuple[str, Optional[list]]:
+    """Заменить участки (начало, конец, замена) текста и сдвинуть разметку.
+
+    Разметка хранит смещения в UTF-16. Сущность, целиком попавшая в
+    заменённый участок, пропадает; частично попавшая — обрезается до
+    границы участка.
+    """
+    parts, last = [], 0
+    # (старое начало, старый конец, новое начало, новый конец) в UTF-16
+    moved = []
+    shift = 0
+    for start, end, replacement in spans:
+        parts.append(text[last:start])
+        parts.append(replacement)
+        last = end
+        old_start, old_end = _utf16(text, start), _utf16(text, end)
+        new_start = old_start + shift
+        new_end = new_start + len(replacement.encode('utf-16-le')) // 2
+        moved.append((old_start, old_end, new_start, new_end))
+        shift = new_end - old_end
+    parts.append(text[last:])
+    if not entities:
+        return ''.join(parts), entities
+
+    def position(offset: int, is_end: bool) -> int:
+        delta = 0
+        for old_start, old_end, new_start, new_end in moved:
+            if offset >= old_end:
+                delta = new_end - old_end
+                continue
+            if offset > old_start:
+                return new_start if is_end else new_end
+            break
+        return offset + delta
+
+    result = []
+    for entity in entities:
+        start = position(entity.offset, False)
+        end = position(entity.offset + entity.length, True)
+        if end <= start:
+            continue
+        entity = copy.copy(entity)
+        entity.offset, entity.length = start, end - start
+        result.append(entity)
+    return ''.join(parts), result
+
+
+class CompiledFilter:
+    """Правила одного получателя, собранные для быстрой проверки поста.
+
+    Слова чёрного списка и обязательные буквальные куски регулярных
+    выражений (блокировки и замен) собраны в один автомат Ахо — Корасик,
+    так что подпись просматривается один раз. Регулярное выражение
+    запускается, только если в тексте нашёлся его кусок: у re нет общего
+    автомата, и альтернатива из сотен шаблонов пробует каждый в каждой
+    позиции. Шаблоны без такого куска проверяются всегда, одной
+    альтернативой.
+    """
+
+    def __init__(self, rules: Sequence[FilterRule], media_size: Callable[[object], int] = lambda media: 0):
+        self.rules = len(rules)
+        self.media_size = media_size
+        self.media = {kind for rule in rules if rule.kind == MEDIA for kind in _split(rule.pattern)}
+        sizes = [parse_size(rule.pattern) for rule in rules if rule.kind == MAX_SIZE]
+        self.max_size = min(sizes) if sizes else None
+        self.strip_links = any(rule.kind == STRIP_LINKS for rule in rules)
+        self.words = {normalize(rule.pattern) for rule in rules if rule.kind == WORD}
+        # Кусок текста -> регулярные выражения блокировки, которые без него не совпадут
+        self.guarded: Dict[str, List[re.Pattern]] = defaultdict(list)
+        unguarded = []
+        for rule in rules:
+            if rule.kind != REGEX:
+                continue
+            literal = required_literal(rule.pattern)
+            if len(literal) >= MIN_LITERAL:
+                self.guarded[literal].append(re.compile(rule.pattern, re.IGNORECASE))
+            else:
+                unguarded.append(rule.pattern)
+        self.patterns = _combine(unguarded)
+        # Замены идут в порядке добавления: (кусок или '', шаблон, замена)
+        self.replaces = []
+        for rule in rules:
+            if rule.kind == REPLACE:
+                literal = required_literal(rule.pattern)
+                self.replaces.append((literal if len(literal) >= MIN_LITERAL else '',
+                                      re.compile(rule.pattern, re.IGNORECASE), rule.replacement))
+        literals = set(self.words) | set(self.guarded) | {literal for literal, _, _ in self.replaces if literal}
+        self.automaton = KeywordAutomaton(literals) if literals else None
+
+    def _hits(self, caption: str) -> List[str]:
+        if self.automaton is None or not caption:
+            return []
+        return self.automaton.find_all(normalize(caption))
+
+    def blocked(self, post: PostUnit, hits: Optional[List[str]] = None) -> Optional[str]:
+        """Причина отбросить пост или None; hits — результат автомата, если он уже пройден"""
+        if self.media:
+            kinds = {media_kind(media) for media in post.media} or {'text'}
+            hit = kinds & self.media
+            if hit:
+                return f"тип {', '.join(sorted(hit))}"
+        if self.max_size is not None:
+            size = max((self.media_size(media) for media in post.media), default=0)
+            if size > self.max_size:
+                return f"файл {size} байт больше {self.max_size}"
+        if not post.caption:
+            return None
+        if hits is None:
+            hits = self._hits(post.caption)
+        for literal in hits:
+            if literal in self.words:
+                return f"слово «{literal}»"
+        candidates = [pattern for literal in hits for pattern in self.guarded.get(literal, ())]
+        for pattern in candidates + self.patterns:
+            match = pattern.search(post.caption)
+            if match:
+                return f"шаблон «{match.group(0)[:50]}»"
+        return None
+
+    def rewrite(self, post: PostUnit, hits: Optional[List[str]] = None) -> PostUnit:
+        """Пост с изменённой подписью или тот же объект, если менять нечего"""
+        caption, entities = post.caption, post.entities
+        changed = False
+        if caption and self.replaces:
+            present = set(self._hits(caption) if hits is None else hits)
+            for literal, pattern, replacement in self.replaces:
+                # После первой замены текст другой: остальные шаблоны проверяются без отсева
+                if literal and literal not in present and not changed:
+                    continue
+                spans = [(match.start(), match.end(), match.expand(replacement))
+                         for match in pattern.finditer(caption)]
+                if spans:
+                    caption, entities = _edit(caption, entities, spans)
+                    changed = True
+        link_preview, buttons = post.link_preview, post.buttons
+        if self.strip_links:
+            spans = [(match.start(), match.end(), '') for match in _LINK.finditer(caption)]
+            if spans:
+                caption, entities = _edit(caption, entities, spans)
+                changed = True
+            if entities and any(type(entity).__name__ in _LINK_ENTITIES for entity in entities):
+                entities = [entity for entity in entities if type(entity).__name__ not in _LINK_ENTITIES]
+                changed = True
+            if link_preview or buttons is not None:
+                # Кнопки рекламных постов — почти всегда ссылки
+                link_preview, buttons = False, None
+                changed = True
+        if not changed:
+            return post
+        if not caption.strip():
+            # От подписи остались одни пробелы между вырезанными ссылками
+            caption, entities = '', None
+        return PostUnit(post.chat_id, post.grouped_id, post.ids, post.date, caption, entities, post.media,
+                        link_preview, buttons, edited=True)
+
+    def apply(self, post: PostUnit) -> Tuple[Optional[PostUnit], Optional[str]]:
+        """(пост к отправке, None) или (None, причина) для отброшенного"""
+        hits = self._hits(post.caption)
+        reason = self.blocked(post, hits)
+        if reason is not None:
+            return None, reason
+        return self.rewrite(post, hits), None
+
+
+class ContentFilters:
+    """Правила фильтров всех получателей с компиляцией по требованию.
+
+    Правила читаются из базы целиком при запуске и после каждой команды;
+    набор для пары источник → получатель компилируется при первом посте и
+    дальше используется готовым. Другие процессы с той же базой замечают
+    изменения по отметке (наибольший id и число правил) в refresh().
+    """
+
+    def __init__(self, db, media_size: Callable[[object], int] = lambda media: 0):
+        self.db = db
+        self.media_size = media_size
+        self._rules: Dict[int, List[FilterRule]] = {}
+        self._compiled: Dict[Tuple[int, int], CompiledFilter] = {}
+        self._stamp = None
+        self.blocked = 0
+        self.rewritten = 0
+        self.compile_seconds = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(rules) for rules in self._rules.values())
+
+    async def load(self):
+        rules = await self.db.get_filter_rules()
+        grouped = defaultdict(list)
+        for rule in rules:
+            grouped[rule.destination_id].append(rule)
+        # Подмена целиком: отправки, уже взявшие старый набор, его и доработают
+        self._rules = dict(grouped)
+        self._compiled = {}
+        self._stamp = await self.db.filter_rules_stamp()
+
+    async def refresh(self) -> bool:
+        """Перечитать правила, если их поменял другой процесс"""
+        if await self.db.filter_rules_stamp() == self._stamp:
+            return False
+        await self.load()
+        return True
+
+    async def add(self, rule: FilterRule) -> FilterRule:
+        validate(rule)
+        rule.created_at = time.time()
+        rule.rule_id = await self.db.add_filter_rule(rule)
+        await self.load()
+        return rule
+
+    async def remove(self, rule_id: Optional[int] = None, destination_id: Optional[int] = None) -> int:
+        """Удалить правило rule_id или все правила получателя"""
+        removed = await self.db.delete_filter_rules(rule_id, destination_id)
+        if removed:
+            await self.load()
+        return removed
+
+    def rules_for(self, destination_id: int, source_id: Optional[int] = None) -> List[FilterRule]:
+        """Правила получателя: общие для всех источников и (если задан) для источника source_id"""
+        return [rule for rule in self._rules.get(destination_id, ())
+                if source_id is None or rule.source_id in (None, source_id)]
+
+    def compiled(self, source_id: int, destination_id: int) -> Optional[CompiledFilter]:
+        if destination_id not in self._rules:
+            return None
+        key = (source_id, destination_id)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            started = time.perf_counter()
+            compiled = self._compiled[key] = CompiledFilter(
+                self.rules_for(destination_id, source_id), self.media_size
+            )
+            self.compile_seconds += time.perf_counter() - started
+        return compiled
+
+    def apply(self, source_id: int, destination_id: int, post: PostUnit) -> Tuple[Optional[PostUnit], Optional[str]]:
+        """Пропустить пост через правила: (пост к отправке, None) или (None, причина)"""
+        compiled = self.compiled(source_id, destination_id)
+        if compiled is None or not compiled.rules:
+            return post, None
+        result, reason = compiled.apply(post)
+        if result is None:
+            self.blocked += 1
+        elif result is not post:
+            self.rewritten += 1
+        return result, reason
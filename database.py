@@ -1,109 +1,562 @@
 import sqlite3
-from datetime import datetime
-from typing import List, Optional
-from config import ChannelConfig
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from config import ChannelConfig, RouteConfig
+from jobs import RepostJob
+from leases import Fence
+from migrations import migrate
+from content_filter import FilterRule
+from outbox import OutboxEntry
+
+JOB_COLUMNS = (
+    'job_id, kind, from_channel, to_channel, job_limit, interval, offset_date, chat_id, '
+    'status, min_id, max_id, checkpoint, sent_count, total, run_seconds, '
+    'created_at, updated_at, error'
+)
+
+CHANNEL_COLUMNS = (
+    'channel_id, posts_per_day, start_date, is_active, last_repost_date, '
+    'forward_mode, drop_author, last_seen_message_id, live_mode, interval_seconds'
+)
+
+OUTBOX_COLUMNS = (
+    'entry_id, kind, source_id, destination_id, message_ids, post_key, '
+    'status, attempts, next_attempt, error, created_at'
+)
+
+FILTER_COLUMNS = 'rule_id, source_id, destination_id, kind, pattern, replacement, created_at'
+
+ROUTE_COLUMNS = (
+    'source_id, destination_id, posts_per_day, interval_seconds, start_date, '
+    'last_repost_date, last_seen_message_id, is_active'
+)
+
+def _epoch(dt: datetime) -> int:
+    """Дата в целых секундах epoch; дата без пояса считается UTC, как в планировщике"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _from_epoch(value: int) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc)
+
 
 class Database:
-    def __init__(self, db_name: str):
-        self.conn = sqlite3.connect(db_name)
-        self._create_tables()
+    def __init__(self, db_name: str, wal: bool = False, check_same_thread: bool = True,
+                 create_tables: bool = True):
+        # Транзакциями управляем сами, чтобы их можно было вкладывать и группировать
+        self.conn = sqlite3.connect(db_name, isolation_level=None, check_same_thread=check_same_thread)
+        self._depth = 0
+        if wal:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        if create_tables:
+            self._create_tables()
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция; вложенный вызов работает как SAVEPOINT внутри внешней"""
+        if self._depth == 0:
+            self.conn.execute('BEGIN')
+        else:
+            self.conn.execute(f'SAVEPOINT sp{self._depth}')
+        self._depth += 1
+        try:
+            yield self.conn
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute('ROLLBACK')
+            else:
+                self.conn.execute(f'ROLLBACK TO sp{self._depth}')
+                self.conn.execute(f'RELEASE sp{self._depth}')
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute(f'RELEASE sp{self._depth}')
+
+    def close(self):
+        self.conn.close()
 
     def _create_tables(self):
-        """Создание таблиц БД при инициализации"""
-        with self.conn:
-            # Таблица для хранения настроек каналов
-            self.conn.execute('''
-                CREATE TABLE IF NOT EXISTS channels (
-                    channel_id INTEGER PRIMARY KEY,
-                    posts_per_day INTEGER NOT NULL,
-                    start_date TEXT NOT NULL,
-                    is_active BOOLEAN NOT NULL DEFAULT 1,
-                    last_repost_date TEXT NOT NULL
-                )
-            ''')
+        """Создание таблиц БД и обновление схемы до текущей версии"""
+        migrate(self.conn)
 
-            # Таблица для отслеживания пересланных сообщений
-            self.conn.execute('''
-                CREATE TABLE IF NOT EXISTS reposted_messages (
-                    message_id INTEGER,
-                    channel_id INTEGER,
-                    repost_date TEXT NOT NULL,
-                    PRIMARY KEY (message_id, channel_id)
-                )
-            ''')
+    @staticmethod
+    def _fenced(fence: Optional[Fence]) -> Tuple[str, Tuple]:
+        """Условие WHERE, пропускающее запись только владельцу живой аренды"""
+        if fence is None:
+            return '', ()
+        return (
+            ' AND EXISTS (SELECT 1 FROM leases WHERE resource = ? AND owner = ? AND token = ? AND expires_at > ?)',
+            (fence.resource, fence.owner, fence.token, fence.now)
+        )
+
+    @staticmethod
+    def _row_to_config(row) -> ChannelConfig:
+        return ChannelConfig(
+            channel_id=row[0],
+            posts_per_day=row[1],
+            start_date=_from_epoch(row[2]),
+            is_active=bool(row[3]),
+            last_repost_date=_from_epoch(row[4]),
+            forward_mode=bool(row[5]),
+            drop_author=bool(row[6]),
+            last_seen_message_id=row[7],
+            live_mode=bool(row[8]),
+            interval_seconds=row[9]
+        )
 
     def add_channel(self, config: ChannelConfig):
         """Добавление или обновление канала в БД"""
-        with self.conn:
-            self.conn.execute('''
-                INSERT OR REPLACE INTO channels 
-                VALUES (?, ?, ?, ?, ?)
+        with self.transaction():
+            self.conn.execute(f'''
+                INSERT INTO channels ({CHANNEL_COLUMNS})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    posts_per_day = excluded.posts_per_day,
+                    start_date = excluded.start_date,
+                    is_active = excluded.is_active,
+                    last_repost_date = excluded.last_repost_date,
+                    forward_mode = excluded.forward_mode,
+                    drop_author = excluded.drop_author,
+                    live_mode = excluded.live_mode,
+                    interval_seconds = excluded.interval_seconds,
+                    -- курсор только растёт: устаревшая копия настроек не откатит его
+                    last_seen_message_id = MAX(last_seen_message_id, excluded.last_seen_message_id)
             ''', (
                 config.channel_id,
                 config.posts_per_day,
-                config.start_date.isoformat(),
+                _epoch(config.start_date),
                 config.is_active,
-                config.last_repost_date.isoformat()
+                _epoch(config.last_repost_date),
+                config.forward_mode,
+                config.drop_author,
+                config.last_seen_message_id,
+                config.live_mode,
+                config.interval_seconds
             ))
 
     def get_all_channels(self) -> List[ChannelConfig]:
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT * FROM channels')
-            return [
-                ChannelConfig(
-                    channel_id=row[0],
-                    posts_per_day=row[1],
-                    start_date=datetime.fromisoformat(row[2]),
-                    is_active=bool(row[3]),
-                    last_repost_date=datetime.fromisoformat(row[4])
-                ) 
-                for row in cursor.fetchall()
-            ]
+        cursor = self.conn.cursor()
+        cursor.execute(f'SELECT {CHANNEL_COLUMNS} FROM channels')
+        return [self._row_to_config(row) for row in cursor.fetchall()]
 
     def get_channel(self, channel_id: int) -> Optional[ChannelConfig]:
         """Получение конкретного канала по ID"""
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT * FROM channels WHERE channel_id = ?', (channel_id,))
-            row = cursor.fetchone()
-            if row:
-                return ChannelConfig(
-                    channel_id=row[0],
-                    posts_per_day=row[1],
-                    start_date=datetime.fromisoformat(row[2]),
-                    is_active=bool(row[3]),
-                    last_repost_date=datetime.fromisoformat(row[4])
-                )
-            return None
+        cursor = self.conn.cursor()
+        cursor.execute(f'SELECT {CHANNEL_COLUMNS} FROM channels WHERE channel_id = ?', (channel_id,))
+        row = cursor.fetchone()
+        if row:
+            return self._row_to_config(row)
+        return None
 
-    def update_last_repost(self, channel_id: int, date: datetime):
-        """Обновление времени последнего репоста"""
-        with self.conn:
-            self.conn.execute('''
+    def update_last_repost(self, channel_id: int, date: datetime, fence: Optional[Fence] = None) -> bool:
+        """Обновление времени последнего репоста; False, если аренда канала потеряна"""
+        clause, params = self._fenced(fence)
+        with self.transaction():
+            cursor = self.conn.execute(f'''
                 UPDATE channels 
                 SET last_repost_date = ?
-                WHERE channel_id = ?
-            ''', (date.isoformat(), channel_id))
+                WHERE channel_id = ?{clause}
+            ''', (_epoch(date), channel_id) + params)
+            return cursor.rowcount > 0
+
+    def update_cursor(self, channel_id: int, message_id: int, fence: Optional[Fence] = None) -> bool:
+        """Сдвинуть курсор последнего просмотренного сообщения канала"""
+        clause, params = self._fenced(fence)
+        with self.transaction():
+            cursor = self.conn.execute(f'''
+                UPDATE channels
+                SET last_seen_message_id = MAX(last_seen_message_id, ?)
+                WHERE channel_id = ?{clause}
+            ''', (message_id, channel_id) + params)
+            return cursor.rowcount > 0
 
-    def mark_reposted(self, message_id: int, channel_id: int):
+    def mark_reposted(self, message_id: int, channel_id: int, source_id: Optional[int] = None):
         """Пометить сообщение как пересланное"""
-        with self.conn:
+        self.mark_reposted_many([(
+            channel_id if source_id is None else source_id,
+            channel_id,
+            message_id
+        )])
+
+    def mark_reposted_many(self, entries: List[Tuple[int, int, int]]):
+        """Пометить пачку (источник, получатель, id сообщения) одним запросом"""
+        now = int(time.time())
+        with self.transaction():
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO reposted_messages
+                (source_id, channel_id, message_id, repost_date)
+                VALUES (?, ?, ?, ?)
+            ''', [(source_id, channel_id, message_id, now) for source_id, channel_id, message_id in entries])
+
+    def is_reposted(self, message_id: int, channel_id: int, source_id: Optional[int] = None) -> bool:
+        """Проверить, было ли сообщение переслано"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT 1 FROM reposted_messages 
+            WHERE source_id = ? AND channel_id = ? AND message_id = ?
+        ''', (channel_id if source_id is None else source_id, channel_id, message_id))
+        return cursor.fetchone() is not None
+
+    def get_reposted_since(self, since: datetime) -> List[Tuple[int, int, int]]:
+        """Все ключи пересланных сообщений не старше since"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT source_id, channel_id, message_id FROM reposted_messages
+            WHERE repost_date >= ?
+        ''', (_epoch(since),))
+        return cursor.fetchall()
+
+    def prune_reposted(self, older_than: datetime) -> int:
+        """Удалить записи о репостах старше older_than"""
+        with self.transaction():
+            cursor = self.conn.execute(
+                'DELETE FROM reposted_messages WHERE repost_date < ?',
+                (_epoch(older_than),)
+            )
+            return cursor.rowcount
+
+    def save_entity(self, peer_id: int, peer_type: str, entity_id: int, access_hash: int, cached_at: int):
+        """Сохранить InputPeer в кеш сущностей"""
+        with self.transaction():
             self.conn.execute('''
-                INSERT OR REPLACE INTO reposted_messages 
-                VALUES (?, ?, ?)
+                INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?)
+            ''', (peer_id, peer_type, entity_id, access_hash, cached_at))
+
+    def get_entities(self) -> List[Tuple[int, str, int, int, int]]:
+        """Все сохранённые InputPeer"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT peer_id, peer_type, entity_id, access_hash, cached_at FROM entities')
+        return cursor.fetchall()
+
+    def delete_entity(self, peer_id: int):
+        with self.transaction():
+            self.conn.execute('DELETE FROM entities WHERE peer_id = ?', (peer_id,))
+
+    def save_media_file(self, media_key: str, digest: str, size: int):
+        with self.transaction():
+            self.conn.execute(
+                'INSERT OR REPLACE INTO media_files VALUES (?, ?, ?)', (media_key, digest, size)
+            )
+
+    def get_media_files(self) -> List[Tuple[str, str]]:
+        """Ключ медиа источника -> хеш содержимого"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT media_key, digest FROM media_files')
+        return cursor.fetchall()
+
+    def save_media_upload(self, session: str, digest: str, kind: str, file_id: int, access_hash: int,
+                          file_reference: bytes, uploaded_at: int):
+        """Запомнить загруженный сессией файл для повторной отправки по ссылке"""
+        with self.transaction():
+            self.conn.execute('''
+                INSERT OR REPLACE INTO media_uploads VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (session, digest, kind, file_id, access_hash, file_reference, uploaded_at))
+
+    def get_media_uploads(self) -> List[Tuple[str, str, str, int, int, bytes]]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT session, digest, kind, file_id, access_hash, file_reference FROM media_uploads')
+        return cursor.fetchall()
+
+    def delete_media_upload(self, session: str, digest: str):
+        with self.transaction():
+            self.conn.execute('DELETE FROM media_uploads WHERE session = ? AND digest = ?', (session, digest))
+
+    def add_fingerprints(self, rows: List[Tuple[int, str, int, int, int]]):
+        """Записать полосы отпечатков: (получатель, вид, корзина, отпечаток, время)"""
+        with self.transaction():
+            self.conn.executemany('INSERT INTO similarity VALUES (?, ?, ?, ?, ?)', rows)
+
+    def find_fingerprints(self, destination_id: int, kind: str, buckets: List[int], since: int) -> List[int]:
+        """Отпечатки получателя, у которых совпадает хотя бы одна полоса"""
+        placeholders = ', '.join('?' * len(buckets))
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT DISTINCT fingerprint FROM similarity
+            WHERE destination_id = ? AND kind = ? AND bucket IN ({placeholders}) AND seen_at >= ?
+        ''', (destination_id, kind, *buckets, since))
+        return [row[0] for row in cursor.fetchall()]
+
+    def prune_fingerprints(self, older_than: int, max_rows_per_destination: int) -> int:
+        """Удалить старые отпечатки и самые старые сверх лимита строк на получателя"""
+        with self.transaction():
+            removed = self.conn.execute('DELETE FROM similarity WHERE seen_at < ?', (older_than,)).rowcount
+            removed += self.conn.execute('''
+                DELETE FROM similarity WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY destination_id ORDER BY seen_at DESC, rowid DESC
+                        ) AS position
+                        FROM similarity
+                    ) WHERE position > ?
+                )
+            ''', (max_rows_per_destination,)).rowcount
+            return removed
+
+    @staticmethod
+    def _row_to_route(row) -> RouteConfig:
+        return RouteConfig(
+            source_id=row[0],
+            destination_id=row[1],
+            posts_per_day=row[2],
+            interval_seconds=row[3],
+            start_date=_from_epoch(row[4]),
+            last_repost_date=_from_epoch(row[5]),
+            last_seen_message_id=row[6],
+            is_active=bool(row[7])
+        )
+
+    def add_route(self, route: RouteConfig):
+        """Добавление или обновление маршрута"""
+        with self.transaction():
+            self.conn.execute(f'''
+                INSERT INTO routes ({ROUTE_COLUMNS})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source_id, destination_id) DO UPDATE SET
+                    posts_per_day = excluded.posts_per_day,
+                    interval_seconds = excluded.interval_seconds,
+                    start_date = excluded.start_date,
+                    last_repost_date = excluded.last_repost_date,
+                    is_active = excluded.is_active,
+                    last_seen_message_id = MAX(last_seen_message_id, excluded.last_seen_message_id)
             ''', (
-                message_id,
-                channel_id,
-                datetime.now().isoformat()
+                route.source_id,
+                route.destination_id,
+                route.posts_per_day,
+                route.interval_seconds,
+                _epoch(route.start_date),
+                _epoch(route.last_repost_date),
+                route.last_seen_message_id,
+                route.is_active
             ))
 
-    def is_reposted(self, message_id: int, channel_id: int) -> bool:
-        """Проверить, было ли сообщение переслано"""
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT 1 FROM reposted_messages 
-                WHERE message_id = ? AND channel_id = ?
-            ''', (message_id, channel_id))
-            return cursor.fetchone() is not None
+    def get_routes(self, source_id: Optional[int] = None) -> List[RouteConfig]:
+        """Все маршруты или только маршруты одного источника"""
+        cursor = self.conn.cursor()
+        if source_id is None:
+            cursor.execute(f'SELECT {ROUTE_COLUMNS} FROM routes')
+        else:
+            cursor.execute(f'SELECT {ROUTE_COLUMNS} FROM routes WHERE source_id = ?', (source_id,))
+        return [self._row_to_route(row) for row in cursor.fetchall()]
+
+    def get_route(self, source_id: int, destination_id: int) -> Optional[RouteConfig]:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f'SELECT {ROUTE_COLUMNS} FROM routes WHERE source_id = ? AND destination_id = ?',
+            (source_id, destination_id)
+        )
+        row = cursor.fetchone()
+        return self._row_to_route(row) if row else None
+
+    def update_route_progress(self, source_id: int, destination_id: int, date: datetime, message_id: int,
+                              fence: Optional[Fence] = None) -> bool:
+        """Сохранить время последнего репоста и курсор маршрута"""
+        clause, params = self._fenced(fence)
+        with self.transaction():
+            cursor = self.conn.execute(f'''
+                UPDATE routes
+                SET last_repost_date = ?,
+                    last_seen_message_id = MAX(last_seen_message_id, ?)
+                WHERE source_id = ? AND destination_id = ?{clause}
+            ''', (_epoch(date), message_id, source_id, destination_id) + params)
+            return cursor.rowcount > 0
+
+    def acquire_lease(self, resource: str, owner: str, now: float, ttl: float) -> Optional[int]:
+        """Взять или продлить аренду; токен ограждения или None, если ресурс занят.
+
+        Токен растёт при каждой смене владельца (и при повторном захвате
+        истёкшей аренды), поэтому он однозначно задаёт срок владения.
+        """
+        with self.transaction():
+            self.conn.execute('''
+                INSERT INTO leases (resource, owner, token, expires_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT (resource) DO UPDATE SET
+                    token = CASE WHEN leases.owner = excluded.owner AND leases.expires_at > ?
+                                 THEN leases.token ELSE leases.token + 1 END,
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at <= ?
+            ''', (resource, owner, now + ttl, now, now))
+            row = self.conn.execute(
+                'SELECT owner, token FROM leases WHERE resource = ?', (resource,)
+            ).fetchone()
+        return row[1] if row and row[0] == owner else None
+
+    def renew_lease(self, resource: str, owner: str, token: int, now: float, ttl: float) -> bool:
+        """Продлить аренду, если её никто не перехватил"""
+        with self.transaction():
+            cursor = self.conn.execute(
+                'UPDATE leases SET expires_at = ? WHERE resource = ? AND owner = ? AND token = ?',
+                (now + ttl, resource, owner, token)
+            )
+            return cursor.rowcount > 0
+
+    def release_lease(self, resource: str, owner: str):
+        """Отдать аренду; строка остаётся, чтобы токен не начинался заново"""
+        with self.transaction():
+            self.conn.execute(
+                'UPDATE leases SET expires_at = 0 WHERE resource = ? AND owner = ?',
+                (resource, owner)
+            )
+
+    def get_leases(self, now: float) -> List[Tuple[str, str, int, float]]:
+        """Живые аренды: (ресурс, владелец, токен, срок)"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'SELECT resource, owner, token, expires_at FROM leases WHERE expires_at > ?', (now,)
+        )
+        return cursor.fetchall()
+
+    def delete_route(self, source_id: int, destination_id: int) -> bool:
+        with self.transaction():
+            cursor = self.conn.execute(
+                'DELETE FROM routes WHERE source_id = ? AND destination_id = ?',
+                (source_id, destination_id)
+            )
+            return cursor.rowcount > 0
+
+    @staticmethod
+    def _job_values(job: RepostJob) -> Tuple:
+        return (
+            job.kind, job.from_channel, job.to_channel, job.limit, job.interval,
+            job.offset_date, job.chat_id, job.status, job.min_id, job.max_id,
+            job.checkpoint, job.sent_count, job.total, job.run_seconds,
+            job.created_at, job.updated_at, job.error
+        )
+
+    @staticmethod
+    def _row_to_job(row) -> RepostJob:
+        return RepostJob(
+            job_id=row[0], kind=row[1], from_channel=row[2], to_channel=row[3],
+            limit=row[4], interval=row[5], offset_date=row[6], chat_id=row[7],
+            status=row[8], min_id=row[9], max_id=row[10], checkpoint=row[11],
+            sent_count=row[12], total=row[13], run_seconds=row[14],
+            created_at=row[15], updated_at=row[16], error=row[17]
+        )
+
+    def add_job(self, job: RepostJob) -> int:
+        """Сохранить новую задачу и вернуть её id"""
+        with self.transaction():
+            cursor = self.conn.execute(f'''
+                INSERT INTO jobs ({JOB_COLUMNS.split(', ', 1)[1]})
+                VALUES ({', '.join('?' * 17)})
+            ''', self._job_values(job))
+            return cursor.lastrowid
+
+    def update_job(self, job: RepostJob):
+        """Обновить состояние и прогресс задачи"""
+        columns = JOB_COLUMNS.split(', ')[1:]
+        with self.transaction():
+            self.conn.execute(
+                f"UPDATE jobs SET {', '.join(c + ' = ?' for c in columns)} WHERE job_id = ?",
+                self._job_values(job) + (job.job_id,)
+            )
+
+    def get_job(self, job_id: int) -> Optional[RepostJob]:
+        cursor = self.conn.cursor()
+        cursor.execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE job_id = ?', (job_id,))
+        row = cursor.fetchone()
+        return self._row_to_job(row) if row else None
+
+    def get_jobs(self, statuses: Tuple[str, ...]) -> List[RepostJob]:
+        """Задачи в указанных статусах"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs WHERE status IN ({', '.join('?' * len(statuses))}) ORDER BY job_id",
+            tuple(statuses)
+        )
+        return [self._row_to_job(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _outbox_values(entry: OutboxEntry) -> Tuple:
+        return (
+            entry.kind, entry.source_id, entry.destination_id, ','.join(map(str, entry.message_ids)),
+            entry.post_key, entry.status, entry.attempts, entry.next_attempt, entry.error, int(entry.created_at)
+        )
+
+    @staticmethod
+    def _row_to_outbox(row) -> OutboxEntry:
+        return OutboxEntry(
+            entry_id=row[0], kind=row[1], source_id=row[2], destination_id=row[3],
+            message_ids=tuple(int(message_id) for message_id in row[4].split(',')), post_key=row[5],
+            status=row[6], attempts=row[7], next_attempt=row[8], error=row[9], created_at=row[10]
+        )
+
+    def add_outbox(self, entry: OutboxEntry) -> int:
+        """Сохранить неудачную отправку и вернуть id записи"""
+        with self.transaction():
+            cursor = self.conn.execute(f'''
+                INSERT INTO outbox ({OUTBOX_COLUMNS.split(', ', 1)[1]})
+                VALUES ({', '.join('?' * 10)})
+            ''', self._outbox_values(entry))
+            return cursor.lastrowid
+
+    def update_outbox(self, entry: OutboxEntry):
+        columns = OUTBOX_COLUMNS.split(', ')[1:]
+        with self.transaction():
+            self.conn.execute(
+                f"UPDATE outbox SET {', '.join(c + ' = ?' for c in columns)} WHERE entry_id = ?",
+                self._outbox_values(entry) + (entry.entry_id,)
+            )
+
+    def delete_outbox(self, entry_id: Optional[int] = None, status: Optional[str] = None) -> int:
+        """Удалить запись entry_id (None — все) в статусе status (None — в любом)"""
+        conditions, params = [], []
+        if entry_id is not None:
+            conditions.append('entry_id = ?')
+            params.append(entry_id)
+        if status is not None:
+            conditions.append('status = ?')
+            params.append(status)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self.transaction():
+            return self.conn.execute(f'DELETE FROM outbox{where}', params).rowcount
+
+    def get_outbox(self, status: str, entry_id: Optional[int] = None) -> List[OutboxEntry]:
+        """Записи outbox в статусе status (или одна запись entry_id) по порядку появления"""
+        query = f'SELECT {OUTBOX_COLUMNS} FROM outbox WHERE status = ?'
+        params: Tuple = (status,)
+        if entry_id is not None:
+            query += ' AND entry_id = ?'
+            params += (entry_id,)
+        return [self._row_to_outbox(row) for row in self.conn.execute(query + ' ORDER BY entry_id', params)]
+
+    def count_outbox(self, status: str) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM outbox WHERE status = ?', (status,)).fetchone()[0]
+
+    def add_filter_rule(self, rule: FilterRule) -> int:
+        """Сохранить правило фильтра и вернуть его id"""
+        with self.transaction():
+            cursor = self.conn.execute(f'''
+                INSERT INTO filter_rules ({FILTER_COLUMNS.split(', ', 1)[1]})
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (rule.source_id, rule.destination_id, rule.kind, rule.pattern, rule.replacement,
+                  int(rule.created_at)))
+            return cursor.lastrowid
+
+    def delete_filter_rules(self, rule_id: Optional[int] = None, destination_id: Optional[int] = None) -> int:
+        """Удалить правило rule_id или все правила получателя destination_id"""
+        if rule_id is None and destination_id is None:
+            return 0
+        column, value = ('rule_id', rule_id) if rule_id is not None else ('destination_id', destination_id)
+        with self.transaction():
+            return self.conn.execute(f'DELETE FROM filter_rules WHERE {column} = ?', (value,)).rowcount
+
+    def get_filter_rules(self) -> List[FilterRule]:
+        """Все правила фильтров в порядке добавления (в нём применяются замены)"""
+        return [
+            FilterRule(source_id=row[1], destination_id=row[2], kind=row[3], pattern=row[4], replacement=row[5],
+                       rule_id=row[0], created_at=row[6])
+            for row in self.conn.execute(f'SELECT {FILTER_COLUMNS} FROM filter_rules ORDER BY rule_id')
+        ]
+
+    def filter_rules_stamp(self) -> Tuple[int, int]:
+        """Отметка набора правил: меняется при любом добавлении или удалении"""
+        return tuple(self.conn.execute('SELECT COALESCE(MAX(rule_id), 0), COUNT(*) FROM filter_rules').fetchone())
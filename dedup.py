@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import math
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Sequence, Tuple, Union
+from posts import PostUnit
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[int, int, int]
+
+
+def post_key(group: Union[PostUnit, Sequence]) -> int:
+    """Ключ поста для журнала репостов: grouped_id альбома или id сообщения"""
+    if isinstance(group, PostUnit):
+        return group.key
+    first = group[0]
+    return getattr(first, 'grouped_id', None) or first.id
+
+
+class BloomFilter:
+    """Фильтр Блума: «точно нет» без обращения к SQLite"""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: Key):
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: Key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: Key) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RepostLedger:
+    """Журнал репостов с фронт-кешем в памяти.
+
+    Фильтр Блума содержит все ключи из базы за окно хранения: если ключа
+    в нём нет, сообщение точно не пересылалось и SQLite не трогаем.
+    Недавние положительные ответы держит LRU. Записи уходят в базу
+    одним пакетным запросом на пачку постов.
+    """
+
+    def __init__(self, db, retention_days: int = 90, cache_size: int = 100_000,
+                 bloom_capacity: int = 1_000_000):
+        self.db = db
+        self.retention = timedelta(days=retention_days)
+        self.cache_size = cache_size
+        self.bloom_capacity = bloom_capacity
+        self.bloom = BloomFilter(bloom_capacity)
+        self.recent: "OrderedDict[Key, None]" = OrderedDict()
+        self.hits = 0
+        self.db_lookups = 0
+
+    async def load(self):
+        """Заполнить фильтр ключами из базы за окно хранения"""
+        bloom = BloomFilter(self.bloom_capacity)
+        rows = await self.db.get_reposted_since(datetime.now(timezone.utc) - self.retention)
+        for row in rows:
+            bloom.add(tuple(row))
+        # Ключи, записанные пока шло чтение, уже лежат в LRU
+        for key in self.recent:
+            bloom.add(key)
+        self.bloom = bloom
+        logger.info(f"Журнал репостов: загружено {len(rows)} ключей")
+
+    def _remember(self, key: Key):
+        self.recent[key] = None
+        self.recent.move_to_end(key)
+        if len(self.recent) > self.cache_size:
+            self.recent.popitem(last=False)
+
+    async def is_reposted(self, source_id: int, destination_id: int, message_key: int) -> bool:
+        key = (source_id, destination_id, message_key)
+        if key not in self.bloom:
+            return False
+        if key in self.recent:
+            self.recent.move_to_end(key)
+            self.hits += 1
+            return True
+        self.db_lookups += 1
+        found = await self.db.is_reposted(message_key, destination_id, source_id)
+        if found:
+            self._remember(key)
+        return found
+
+    async def filter_new(self, source_id: int, destination_id: int, groups: Iterable[Sequence]) -> List[Sequence]:
+        """Оставить только посты, которых ещё нет в журнале"""
+        result = []
+        for group in groups:
+            if not await self.is_reposted(source_id, destination_id, post_key(group)):
+                result.append(group)
+        return result
+
+    async def mark(self, source_id: int, destination_id: int, message_keys: Iterable[int]):
+        """Записать пачку отправленных постов"""
+        entries = [(source_id, destination_id, message_key) for message_key in message_keys]
+        if not entries:
+            return
+        await self.db.mark_reposted_many(entries)
+        for key in entries:
+            self.bloom.add(key)
+            self._remember(key)
+
+    async def prune(self) -> int:
+        """Удалить записи старше окна хранения и пересобрать фильтр"""
+        removed = await self.db.prune_reposted(datetime.now(timezone.utc) - self.retention)
+        if removed:
+            self.recent.clear()
+            await self.load()
+        return removed
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Row = Tuple[str, int, int]
+
+
+class EntityCache:
+    """Кеш сущностей/InputPeer с TTL и сохранением в SQLite.
+
+    В памяти держится то, что вернул resolver (полная сущность или
+    InputPeer), не дольше ttl секунд. В базу пишется компактная форма
+    (тип, id, access_hash), которой достаточно для запросов к API: после
+    перезапуска каналы берутся из неё без сетевых запросов. Одновременные
+    промахи по одному ключу сводятся к одному запросу.
+    """
+
+    def __init__(
+        self,
+        resolver: Callable[[int], Awaitable[Any]],
+        db=None,
+        ttl: float = 6 * 3600,
+        persist_ttl: float = 30 * 86400,
+        to_row: Optional[Callable[[Any], Optional[Row]]] = None,
+        from_row: Optional[Callable[[Row], Any]] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.resolver = resolver
+        self.db = db
+        self.ttl = ttl
+        self.persist_ttl = persist_ttl
+        self.to_row = to_row
+        self.from_row = from_row
+        self.clock = clock
+        self.entries: Dict[int, Tuple[Any, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._inflight: Dict[int, asyncio.Future] = {}
+
+    @property
+    def persistent(self) -> bool:
+        return self.db is not None and self.to_row is not None and self.from_row is not None
+
+    async def load(self):
+        """Подтянуть сохранённые InputPeer из базы"""
+        if not self.persistent:
+            return
+        now = self.clock()
+        loaded = 0
+        for peer_id, peer_type, entity_id, access_hash, cached_at in await self.db.get_entities():
+            if now - cached_at > self.persist_ttl:
+                continue
+            entity = self.from_row((peer_type, entity_id, access_hash))
+            # Сохранённой записи доверяем не дольше обычного TTL от момента загрузки
+            self.entries[peer_id] = (entity, now + self.ttl)
+            loaded += 1
+        logger.info(f"Кеш сущностей: загружено {loaded} записей")
+
+    def peek(self, key: int) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None or entry[1] <= self.clock():
+            return None
+        return entry[0]
+
+    async def get(self, key: int) -> Any:
+        entity = self.peek(key)
+        if entity is not None:
+            self.hits += 1
+            return entity
+        self.misses += 1
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            entity = await self.resolver(key)
+            self.put(key, entity)
+            future.set_result(entity)
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение получит вызывающий; ожидающих может не быть
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        # Ожидающие уже получили сущность: отмена во время записи в базу касается только вызывающего
+        if self.persistent:
+            await self._persist(key, entity)
+        return entity
+
+    def put(self, key: int, entity: Any):
+        self.entries[key] = (entity, self.clock() + self.ttl)
+
+    async def _persist(self, key: int, entity: Any):
+        row = self.to_row(entity)
+        if row is None:
+            return
+        try:
+            await self.db.save_entity(key, *row, int(self.clock()))
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить сущность {key}: {str(e)}")
+
+    async def invalidate(self, key: int):
+        """Забыть сущность (например, после ChannelPrivateError)"""
+        self.entries.pop(key, None)
+        if self.persistent:
+            await self.db.delete_entity(key)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"попаданий {self.hits}, промахов {self.misses} ({rate:.0f}%)"
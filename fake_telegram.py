@@ -0,0 +1,478 @@
+"""Поддельный Telegram для нагрузочных и сквозных тестов бота.
+
+FakeTelegram держит синтетические истории каналов в памяти и выдаёт
+клиентов с той частью интерфейса TelegramClient, которой пользуется
+бот: get_entity, get_messages / iter_messages, forward_messages,
+send_message, send_file, iter_download и обработчики событий. Каждый
+вызов API ждёт заданную задержку и может получить flood wait.
+
+Время виртуальное: VirtualClockLoop — event loop, который вместо
+ожидания сразу переводит часы к ближайшему таймеру. Сутки работы бота
+проходят за секунды, а задержки и flood wait остаются в масштабе.
+"""
+import asyncio
+import random
+import selectors
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from telethon.errors import FloodWaitError
+    from telethon.tl.types import InputPeerChannel
+except ImportError:  # без Telethon фейк отдаёт свои заглушки
+    FloodWaitError = None
+    InputPeerChannel = None
+
+# Методы отправки, на которых по умолчанию случается flood wait
+SEND_METHODS = ('forward_messages', 'send_message', 'send_file')
+# Сколько сообщений Telegram отдаёт за один запрос истории
+HISTORY_PAGE = 100
+
+_WORDS = (
+    'новости обзор релиз обновление сервер канал сообщение неделя город погода рынок курс '
+    'команда проект версия отчёт встреча событие фото видео подборка итоги план запуск'
+).split()
+
+
+def marked_id(channel_id: int) -> int:
+    """id канала в форме peer id (-100...), как его хранит бот"""
+    return -(10 ** 12 + channel_id)
+
+
+def bare_id(peer_id: int) -> int:
+    return -peer_id - 10 ** 12
+
+
+class FakeFloodWait(Exception):
+    """Заглушка FloodWaitError, когда Telethon не установлен"""
+
+    def __init__(self, seconds: int):
+        super().__init__(f"A wait of {seconds} seconds is required")
+        self.seconds = seconds
+
+
+def flood_wait(seconds: int) -> Exception:
+    if FloodWaitError is not None:
+        return FloodWaitError(None, capture=seconds)
+    return FakeFloodWait(seconds)
+
+
+class FakePeer:
+    """Заглушка InputPeerChannel"""
+
+    def __init__(self, channel_id: int, access_hash: int):
+        self.channel_id = channel_id
+        self.access_hash = access_hash
+        self.title = f"Канал {channel_id}"
+
+
+class FakeMedia:
+    """Фото без файла: пересылается ссылкой, скачивается синтетическими байтами"""
+
+    def __init__(self, media_id: int, size: int = 64 * 1024):
+        self.id = media_id
+        self.size = size
+
+
+class FakeMessage:
+    __slots__ = ('id', 'chat_id', 'grouped_id', 'message', 'entities', 'media', 'date', 'reply_markup')
+
+    def __init__(self, id: int, chat_id: int, message: str = '', media: Optional[FakeMedia] = None,
+                 grouped_id: Optional[int] = None, date: Optional[datetime] = None):
+        self.id = id
+        self.chat_id = chat_id
+        self.grouped_id = grouped_id
+        self.message = message
+        self.entities = None
+        self.media = media
+        self.date = date
+        self.reply_markup = None
+
+    @property
+    def text(self) -> str:
+        return self.message
+
+    raw_text = text
+
+    def __repr__(self) -> str:
+        return f"FakeMessage({self.chat_id}, {self.id})"
+
+
+class FakeEvent:
+    """Событие NewMessage или Album для обработчиков бота"""
+
+    def __init__(self, kind: str, chat_id: int, messages: List[FakeMessage]):
+        self.kind = kind
+        self.chat_id = chat_id
+        self.messages = messages
+        self.message = messages[0]
+        self.text = self.raw_text = next((msg.message for msg in messages if msg.message), '')
+        self.pattern_match = None
+        self.replies: List[str] = []
+
+    async def reply(self, text: str, **kwargs):
+        self.replies.append(text)
+
+
+class FakeChannel:
+    def __init__(self, peer_id: int, access_hash: int):
+        self.peer_id = peer_id
+        self.access_hash = access_hash
+        self.messages: List[FakeMessage] = []
+        self.next_id = 1
+
+
+class FakeTelegram:
+    """Общий для всех клиентов «сервер»: каналы, их истории и учёт вызовов.
+
+    latency и jitter — задержка каждого вызова в секундах (плюс случайная
+    добавка до jitter); flood_probability — доля вызовов flood_methods,
+    получающих flood wait на flood_seconds.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, flood_probability: float = 0.0,
+                 flood_seconds: int = 30, flood_methods=SEND_METHODS, seed: int = 1,
+                 clock: Callable[[], float] = time.time):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_probability = flood_probability
+        self.flood_seconds = flood_seconds
+        self.flood_methods = set(flood_methods)
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.channels: Dict[int, FakeChannel] = {}
+        self.clients: List['FakeClient'] = []
+        self.calls: Counter = Counter()
+        self.floods: Counter = Counter()
+        self._injected: List[tuple] = []
+        self._media_ids = 0
+
+    def client(self, name: str, api_id: Any = None, api_hash: Any = None) -> 'FakeClient':
+        """Фабрика с сигнатурой TelegramClient(name, api_id, api_hash)"""
+        client = FakeClient(self, name)
+        self.clients.append(client)
+        return client
+
+    @property
+    def api_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def add_channel(self, channel_id: int, posts: int = 0, album_ratio: float = 0.2,
+                    spacing: float = 3600) -> int:
+        """Канал с синтетической историей из posts постов (часть — альбомы); вернуть peer id"""
+        peer_id = marked_id(channel_id)
+        self.channels[peer_id] = FakeChannel(peer_id, self.rng.getrandbits(63))
+        start = self.clock() - posts * spacing
+        for index in range(posts):
+            self._append_post(peer_id, self._random_post(album_ratio), start + index * spacing)
+        return peer_id
+
+    def _random_post(self, album_ratio: float):
+        text = ' '.join(self.rng.choice(_WORDS) for _ in range(self.rng.randint(6, 30)))
+        size = self.rng.randint(2, 10) if self.rng.random() < album_ratio else self.rng.choice([0, 1])
+        return text, size
+
+    def _new_media(self) -> FakeMedia:
+        self._media_ids += 1
+        return FakeMedia(self._media_ids)
+
+    def _append_post(self, peer_id: int, post, at: Optional[float] = None) -> List[FakeMessage]:
+        text, media_count = post
+        channel = self.channels[peer_id]
+        date = datetime.fromtimestamp(self.clock() if at is None else at, timezone.utc)
+        grouped_id = self.rng.getrandbits(62) if media_count > 1 else None
+        messages = []
+        for index in range(max(1, media_count)):
+            messages.append(FakeMessage(
+                channel.next_id, peer_id,
+                message=text if index == 0 else '',
+                media=self._new_media() if media_count else None,
+                grouped_id=grouped_id,
+                date=date
+            ))
+            channel.next_id += 1
+        channel.messages.extend(messages)
+        return messages
+
+    async def publish(self, channel_id: int, text: Optional[str] = None, media_count: int = 0) -> List[FakeMessage]:
+        """Новый пост в канале: попадает в историю и приходит клиентам событиями"""
+        peer_id = channel_id if channel_id < 0 else marked_id(channel_id)
+        if text is None:
+            text, media_count = self._random_post(0.2)
+        messages = self._append_post(peer_id, (text, media_count))
+        for message in messages:
+            await self.dispatch(FakeEvent('NewMessage', peer_id, [message]))
+        if len(messages) > 1:
+            await self.dispatch(FakeEvent('Album', peer_id, messages))
+        return messages
+
+    async def command(self, text: str, chat_id: int = 1) -> List[str]:
+        """Команда администратора; вернуть ответы бота"""
+        message = FakeMessage(0, chat_id, message=text, date=datetime.fromtimestamp(self.clock(), timezone.utc))
+        event = FakeEvent('NewMessage', chat_id, [message])
+        await self.dispatch(event)
+        return event.replies
+
+    async def dispatch(self, event: FakeEvent):
+        for client in list(self.clients):
+            if client.connected:
+                await client._dispatch(event)
+
+    def inject_flood(self, method: str, seconds: int, times: int = 1):
+        """Следующие times вызовов method получат flood wait на seconds"""
+        self.inject_error(method, lambda: flood_wait(seconds), times)
+
+    def inject_error(self, method: str, error: Callable[[], Exception], times: int = 1):
+        """Следующие times вызовов method бросят исключение error()"""
+        self._injected.extend([(method, error)] * times)
+
+    async def call(self, method: str):
+        """Учесть вызов API: задержка, затем, возможно, flood wait"""
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0))
+        for index, (name, error) in enumerate(self._injected):
+            if name == method:
+                del self._injected[index]
+                error = error()
+                if hasattr(error, 'seconds'):
+                    self.floods[method] += 1
+                raise error
+        if method in self.flood_methods and self.flood_probability and self.rng.random() < self.flood_probability:
+            self.floods[method] += 1
+            raise flood_wait(self.flood_seconds)
+
+    def resolve(self, peer: Any, create: bool = False) -> FakeChannel:
+        if isinstance(peer, int):
+            peer_id = peer
+        elif hasattr(peer, 'channel_id'):
+            peer_id = marked_id(peer.channel_id)
+        else:
+            raise TypeError(f"Неизвестный peer {peer!r}")
+        channel = self.channels.get(peer_id)
+        if channel is None:
+            if not create:
+                raise ValueError(f"Could not find the input entity for {peer!r}")
+            channel = self.channels[peer_id] = FakeChannel(peer_id, 0)
+        return channel
+
+    def history(self, peer: Any) -> List[FakeMessage]:
+        return self.resolve(peer).messages
+
+
+class FakeClient:
+    """Клиент одной сессии поверх общего FakeTelegram"""
+
+    def __init__(self, backend: FakeTelegram, name: str):
+        self.backend = backend
+        self.name = name
+        self.connected = False
+        self.handlers: List[tuple] = []
+        self._disconnected = asyncio.Event()
+
+    async def start(self):
+        self.connected = True
+        self._disconnected.clear()
+        return self
+
+    async def disconnect(self):
+        self.connected = False
+        self._disconnected.set()
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def run_until_disconnected(self):
+        await self._disconnected.wait()
+
+    def on(self, builder):
+        def decorator(handler):
+            self.add_event_handler(handler, builder)
+            return handler
+        return decorator
+
+    def add_event_handler(self, handler, builder):
+        self.handlers.append((builder, handler))
+
+    async def _dispatch(self, event: FakeEvent):
+        for builder, handler in list(self.handlers):
+            if type(builder).__name__ != event.kind:
+                continue
+            pattern = getattr(builder, 'pattern', None)
+            if pattern is not None:
+                event.pattern_match = pattern(event.text or '')
+                if not event.pattern_match:
+                    continue
+            func = getattr(builder, 'func', None)
+            if func is not None and not func(event):
+                continue
+            await handler(event)
+
+    async def get_entity(self, peer):
+        await self.backend.call('get_entity')
+        channel = self.backend.resolve(peer)
+        if InputPeerChannel is not None:
+            return InputPeerChannel(bare_id(channel.peer_id), channel.access_hash)
+        return FakePeer(bare_id(channel.peer_id), channel.access_hash)
+
+    def _select(self, peer, limit, min_id=0, max_id=0, offset_date=None, add_offset=0, reverse=False):
+        messages = self.backend.history(peer)
+        selected = [
+            msg for msg in messages
+            if msg.id > min_id and (not max_id or msg.id < max_id)
+            and (offset_date is None or (msg.date > offset_date if reverse else msg.date < offset_date))
+        ]
+        if not reverse:
+            selected.reverse()
+        selected = selected[add_offset:]
+        return selected if limit is None else selected[:limit]
+
+    async def get_messages(self, peer, limit: Optional[int] = 1, ids=None, **kwargs):
+        await self.backend.call('get_messages')
+        if ids is not None:
+            # Как у Telethon: на месте удалённых сообщений None
+            found = {msg.id: msg for msg in self.backend.history(peer)}
+            return [found.get(message_id) for message_id in ids] if isinstance(ids, list) else found.get(ids)
+        return self._select(peer, limit, **kwargs)
+
+    async def iter_messages(self, peer, limit: Optional[int] = None, **kwargs):
+        """Постранично, по запросу API на каждые HISTORY_PAGE сообщений"""
+        messages = self._select(peer, limit, **kwargs)
+        for start in range(0, len(messages), HISTORY_PAGE):
+            await self.backend.call('get_messages')
+            for message in messages[start:start + HISTORY_PAGE]:
+                yield message
+        if not messages:
+            await self.backend.call('get_messages')
+
+    def _copy(self, destination: FakeChannel, source: Optional[FakeMessage], text: str = '',
+              media: Any = None, grouped_id: Optional[int] = None) -> FakeMessage:
+        message = FakeMessage(
+            destination.next_id, destination.peer_id,
+            message=source.message if source else text,
+            media=source.media if source else media,
+            grouped_id=grouped_id,
+            date=datetime.fromtimestamp(self.backend.clock(), timezone.utc)
+        )
+        destination.next_id += 1
+        destination.messages.append(message)
+        return message
+
+    async def forward_messages(self, entity, messages, from_peer=None, drop_author: bool = False, **kwargs):
+        await self.backend.call('forward_messages')
+        destination = self.backend.resolve(entity, create=True)
+        wanted = set(messages)
+        found = {msg.id: msg for msg in self.backend.history(from_peer) if msg.id in wanted}
+        grouped = {}
+        result = []
+        for message_id in messages:
+            source = found.get(message_id)
+            if source is None:
+                result.append(None)
+                continue
+            grouped_id = None
+            if source.grouped_id:
+                grouped_id = grouped.setdefault(source.grouped_id, self.backend.rng.getrandbits(62))
+            result.append(self._copy(destination, source, grouped_id=grouped_id))
+        return result
+
+    async def send_message(self, entity, message: str = '', file=None, **kwargs) -> FakeMessage:
+        await self.backend.call('send_message')
+        destination = self.backend.resolve(entity, create=True)
+        return self._copy(destination, None, text=message, media=file)
+
+    async def send_file(self, entity, file, caption: str = '', **kwargs):
+        await self.backend.call('send_file')
+        destination = self.backend.resolve(entity, create=True)
+        files = file if isinstance(file, list) else [file]
+        grouped_id = self.backend.rng.getrandbits(62) if len(files) > 1 else None
+        sent = [
+            self._copy(destination, None, text=caption if index == 0 else '', media=item, grouped_id=grouped_id)
+            for index, item in enumerate(files)
+        ]
+        return sent if isinstance(file, list) else sent[0]
+
+    async def iter_download(self, media, offset: int = 0, request_size: int = 128 * 1024,
+                            limit: Optional[int] = None, file_size: Optional[int] = None, **kwargs):
+        size = getattr(media, 'size', 0)
+        position = offset
+        chunks = 0
+        while position < size and (limit is None or chunks < limit):
+            await self.backend.call('get_file')
+            length = min(request_size, size - position)
+            yield bytes((media.id + position + i) % 256 for i in range(length))
+            position += length
+            chunks += 1
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Селектор, который вместо сна переводит виртуальные часы цикла"""
+
+    def __init__(self, loop: 'VirtualClockLoop'):
+        super().__init__()
+        self.loop = loop
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready or timeout == 0:
+            return ready
+        if self.loop.busy():
+            # Ответа ждём от потока (база, скачивание): время стоит, ждём по-настоящему
+            return super().select(0.05 if timeout is None else min(timeout, 0.05))
+        if timeout is None:
+            return super().select(None)
+        self.loop.advance(timeout)
+        return []
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop на виртуальном времени.
+
+    time() — виртуальные секунды epoch (по умолчанию от текущего
+    момента). Когда готовых задач нет, часы сразу переводятся к
+    ближайшему таймеру. Пока работа идёт в потоках (run_in_executor или
+    то, о чём сообщает busy), часы стоят и цикл ждёт результата.
+    """
+
+    def __init__(self, start: Optional[float] = None, busy: Optional[Callable[[], bool]] = None):
+        super().__init__(_VirtualSelector(self))
+        self._now = time.time() if start is None else start
+        # Шаг float у epoch порядка 1.7e9 — около 2e-7 с: при штатном 1e-9
+        # таймер на текущем моменте никогда не считается наступившим
+        self._clock_resolution = 1e-6
+        self._in_threads = 0
+        self.busy_hook = busy
+
+    def time(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += seconds
+
+    def busy(self) -> bool:
+        return self._in_threads > 0 or bool(self.busy_hook and self.busy_hook())
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self._in_threads += 1
+
+        def done(_):
+            self._in_threads -= 1
+        future.add_done_callback(done)
+        return future
+
+
+def run_virtual(main, start: Optional[float] = None, busy: Optional[Callable[[], bool]] = None):
+    """asyncio.run на виртуальном времени"""
+    loop = VirtualClockLoop(start, busy)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
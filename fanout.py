@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_right
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+from posts import AlbumGrouper, PostUnit
+
+logger = logging.getLogger(__name__)
+
+
+def group_page(messages: List[Any], full: bool) -> List[PostUnit]:
+    """Разбить страницу истории (от старых к новым) на посты.
+
+    Если страница полная, альбом в её конце может быть неполным: он
+    отбрасывается и придёт целиком со следующей страницей.
+    """
+    grouper = AlbumGrouper()
+    posts = [post for msg in messages for post in grouper.feed(msg)]
+    if not full or not posts:
+        posts.extend(grouper.flush())
+    return posts
+
+
+class _Buffer:
+    def __init__(self, start: int):
+        self.start = start  # посты после этого id загружены без пропусков
+        self.end = start  # ...до этого id включительно
+        self.fetched = start  # последний загруженный id (с открытым альбомом)
+        self.grouper = AlbumGrouper()
+        self.ends: List[int] = []
+        self.posts: List[PostUnit] = []
+        self.tail_checked_at: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+
+class SourceBuffer:
+    """Общий буфер постов каналов-источников для всех их получателей.
+
+    Страница истории источника загружается один раз и раздаётся всем
+    читателям (маршрутам и самому каналу), каждый читает посты после
+    своего курсора. Буфер источника состоит из непрерывных отрезков:
+    читатели с близкими курсорами делят один отрезок, далеко отставший
+    (например, новый маршрут с начала истории) получает свой. Посты,
+    которые прошли курсоры всех читателей отрезка, выбрасываются, а при
+    переполнении вытесняются самые старые. Конец истории перепроверяется
+    не чаще раза в tail_ttl секунд, так что число запросов растёт с числом
+    источников, а не получателей.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[int, int, int], Awaitable[List[Any]]],
+        page_size: int = 100,
+        max_posts: int = 500,
+        tail_ttl: float = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.fetch = fetch
+        self.page_size = page_size
+        self.max_posts = max_posts
+        self.tail_ttl = tail_ttl
+        self.clock = clock
+        self.segments: Dict[int, List[_Buffer]] = {}
+        self.readers: Dict[int, Dict[Hashable, int]] = {}
+        self.fetches = 0
+
+    def _segment(self, source_id: int, after_id: int) -> _Buffer:
+        segments = self.segments.setdefault(source_id, [])
+        for segment in segments:
+            if segment.start <= after_id <= segment.end:
+                return segment
+        segment = _Buffer(after_id)
+        segments.append(segment)
+        return segment
+
+    async def posts(self, source_id: int, after_id: int) -> AsyncIterator[PostUnit]:
+        """Посты источника новее after_id, от старых к новым"""
+        last = after_id
+        while True:
+            segment = self._segment(source_id, last)
+            idx = bisect_right(segment.ends, last)
+            if idx < len(segment.posts):
+                post = segment.posts[idx]
+                last = segment.ends[idx]
+                yield post
+                continue
+            if not await self._extend(source_id, segment):
+                return
+
+    async def _extend(self, source_id: int, segment: _Buffer) -> bool:
+        """Дозагрузить страницу; False, если новых постов нет"""
+        known_end = segment.end
+        async with segment.lock:
+            if segment.end != known_end or segment not in self.segments.get(source_id, ()):
+                # Пока ждали, страницу загрузил другой читатель
+                return True
+            if segment.tail_checked_at is not None and self.clock() - segment.tail_checked_at < self.tail_ttl:
+                return False
+            messages = await self.fetch(source_id, segment.fetched, self.page_size)
+            self.fetches += 1
+            full = len(messages) >= self.page_size
+            # Альбом на границе страниц ждёт продолжения в группировщике отрезка
+            posts = [post for msg in messages for post in segment.grouper.feed(msg)]
+            if not full:
+                posts.extend(segment.grouper.flush())
+            segment.fetched = max([segment.fetched] + [msg.id for msg in messages if msg])
+            segment.tail_checked_at = None if full else self.clock()
+            for post in posts:
+                segment.end = post.last_id
+                segment.ends.append(segment.end)
+                segment.posts.append(post)
+            overflow = len(segment.posts) - self.max_posts
+            if overflow > 0:
+                segment.start = segment.ends[overflow - 1]
+                del segment.ends[:overflow]
+                del segment.posts[:overflow]
+            return bool(posts) or full
+
+    def advance(self, source_id: int, reader: Hashable, cursor: int):
+        """Запомнить курсор читателя и выбросить посты, прочитанные всеми"""
+        readers = self.readers.setdefault(source_id, {})
+        readers[reader] = max(readers.get(reader, 0), cursor)
+        self._trim(source_id)
+
+    def _trim(self, source_id: int):
+        cursors = self.readers.get(source_id, {}).values()
+        kept = []
+        for segment in self.segments.get(source_id, []):
+            inside = [cursor for cursor in cursors if segment.start <= cursor <= segment.end]
+            if not inside:
+                # Никто из читателей этот отрезок больше не читает
+                continue
+            lowest = min(inside)
+            idx = bisect_right(segment.ends, lowest)
+            del segment.ends[:idx]
+            del segment.posts[:idx]
+            segment.start = lowest
+            if not any(other.start <= lowest <= other.end for other in kept):
+                kept.append(segment)
+        if kept:
+            self.segments[source_id] = kept
+        else:
+            self.segments.pop(source_id, None)
+
+    def forget(self, source_id: int, reader: Hashable):
+        """Читатель больше не читает источник (маршрут удалён или остановлен)"""
+        readers = self.readers.get(source_id)
+        if readers is None:
+            return
+        readers.pop(reader, None)
+        if not readers:
+            self.readers.pop(source_id, None)
+        self._trim(source_id)
+
+    def pending(self, source_id: int, after_id: int) -> int:
+        """Сколько уже загруженных постов источника новее after_id"""
+        for segment in self.segments.get(source_id, []):
+            if segment.start <= after_id <= segment.end:
+                return len(segment.ends) - bisect_right(segment.ends, after_id)
+        return 0
+
+    def invalidate(self, source_id: int):
+        """Сбросить буфер источника (например, канал стал недоступен)"""
+        self.segments.pop(source_id, None)
+
+    def __len__(self) -> int:
+        return sum(len(segment.posts) for segments in self.segments.values() for segment in segments)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+ACTIVE_STATUSES = (QUEUED, RUNNING, PAUSED)
+
+
+@dataclass
+class RepostJob:
+    kind: str  # 'fast' или 'slow'
+    from_channel: int
+    to_channel: int
+    limit: int
+    interval: int = 0
+    offset_date: Optional[float] = None  # epoch, для медленного репоста
+    chat_id: Optional[int] = None  # куда сообщать о результате
+    job_id: Optional[int] = None
+    status: str = QUEUED
+    # Окно сообщений задачи: (min_id, max_id]; checkpoint — последний отправленный id
+    min_id: Optional[int] = None
+    max_id: Optional[int] = None
+    checkpoint: int = 0
+    sent_count: int = 0
+    total: Optional[int] = None
+    run_seconds: float = 0.0
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    error: Optional[str] = None
+
+    def throughput(self) -> float:
+        """Сообщений в минуту за время работы"""
+        return self.sent_count / self.run_seconds * 60 if self.run_seconds > 0 else 0.0
+
+    def eta_seconds(self) -> Optional[float]:
+        total = self.total if self.total is not None else self.limit
+        remaining = max(0, total - self.sent_count)
+        if remaining == 0:
+            return 0.0
+        if self.kind == 'slow' and self.interval:
+            return remaining * self.interval
+        rate = self.throughput()
+        return remaining / rate * 60 if rate else None
+
+
+class JobManager:
+    """Очередь задач репоста истории с пулом воркеров.
+
+    Задачи хранятся в таблице jobs и переживают перезапуск: незавершённые
+    снова ставятся в очередь и продолжаются с контрольной точки. Число
+    одновременно работающих задач ограничено concurrency. Раннер получает
+    задачу и вызывает checkpoint() после каждой отправленной пачки.
+    """
+
+    def __init__(self, db, runner: Callable[[RepostJob], Awaitable[None]], concurrency: int = 2,
+                 clock: Callable[[], float] = time.time):
+        self.db = db
+        self.runner = runner
+        self.concurrency = concurrency
+        self.clock = clock
+        self.jobs: Dict[int, RepostJob] = {}
+        self.queue: "asyncio.Queue[int]" = asyncio.Queue()
+        self.running: Dict[int, asyncio.Task] = {}
+        self._workers: List[asyncio.Task] = []
+        self._resumed_at: Dict[int, float] = {}
+
+    def start(self):
+        for _ in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        for task in list(self.running.values()):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self.running.values(), return_exceptions=True)
+        self._workers.clear()
+
+    async def restore(self):
+        """Вернуть в очередь задачи, прерванные перезапуском"""
+        for job in await self.db.get_jobs(ACTIVE_STATUSES):
+            self.jobs[job.job_id] = job
+            if job.status in (QUEUED, RUNNING):
+                job.status = QUEUED
+                self.queue.put_nowait(job.job_id)
+        if self.jobs:
+            logger.info(f"Восстановлено {len(self.jobs)} задач репоста")
+
+    async def submit(self, job: RepostJob) -> RepostJob:
+        job.status = QUEUED
+        job.created_at = job.updated_at = self.clock()
+        job.job_id = await self.db.add_job(job)
+        self.jobs[job.job_id] = job
+        self.queue.put_nowait(job.job_id)
+        return job
+
+    async def get(self, job_id: int) -> Optional[RepostJob]:
+        return self.jobs.get(job_id) or await self.db.get_job(job_id)
+
+    async def active_jobs(self) -> List[RepostJob]:
+        return sorted(self.jobs.values(), key=lambda job: job.job_id)
+
+    async def checkpoint(self, job: RepostJob, message_id: int, sent: int):
+        """Запомнить прогресс: всё до message_id включительно отправлено"""
+        job.checkpoint = max(job.checkpoint, message_id)
+        job.sent_count += sent
+        await self._save(job)
+
+    async def _save(self, job: RepostJob):
+        now = self.clock()
+        resumed = self._resumed_at.get(job.job_id)
+        if resumed is not None:
+            job.run_seconds += now - resumed
+            self._resumed_at[job.job_id] = now
+        job.updated_at = now
+        await self.db.update_job(job)
+
+    async def pause(self, job_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in (QUEUED, RUNNING):
+            return False
+        await self._stop(job, PAUSED)
+        return True
+
+    async def resume(self, job_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.status != PAUSED:
+            return False
+        job.status = QUEUED
+        await self._save(job)
+        self.queue.put_nowait(job_id)
+        return True
+
+    async def cancel(self, job_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return False
+        await self._stop(job, CANCELLED)
+        self.jobs.pop(job_id, None)
+        return True
+
+    async def _stop(self, job: RepostJob, status: str):
+        job.status = status
+        task = self.running.get(job.job_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self._save(job)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            job.status = RUNNING
+            self._resumed_at[job_id] = self.clock()
+            await self._save(job)
+            task = asyncio.create_task(self.runner(job))
+            self.running[job_id] = task
+            try:
+                # Ждём через wait, чтобы отмена воркера не отменяла саму задачу
+                await asyncio.wait({task})
+            finally:
+                self.running.pop(job_id, None)
+            if task.cancelled():
+                # Пауза/отмена уже выставили статус; при остановке бота задача
+                # остаётся running и продолжится после перезапуска
+                pass
+            elif task.exception() is not None:
+                logger.error(f"Задача {job_id} завершилась с ошибкой: {str(task.exception())}")
+                job.status = FAILED
+                job.error = str(task.exception())
+            else:
+                job.status = DONE
+            await self._save(job)
+            self._resumed_at.pop(job_id, None)
+            if job.status in (DONE, FAILED):
+                self.jobs.pop(job_id, None)
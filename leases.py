@@ -0,0 +1,116 @@
+import logging
+import math
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROCESS_PREFIX = 'process:'
+
+
+@dataclass(frozen=True)
+class Fence:
+    """Доказательство владения: запись проходит, только пока аренда с этим токеном жива"""
+    resource: str
+    owner: str
+    token: int
+    now: float
+
+
+def channel_resource(channel_id: int) -> str:
+    return f'channel:{channel_id}'
+
+
+def route_resource(source_id: int, destination_id: int) -> str:
+    return f'route:{source_id}:{destination_id}'
+
+
+def parse_resource(resource: str) -> Tuple[str, Tuple[int, ...]]:
+    """'route:1:2' -> ('route', (1, 2))"""
+    kind, *ids = resource.split(':')
+    return kind, tuple(int(value) for value in ids)
+
+
+class LeaseManager:
+    """Аренда каналов в общей базе для нескольких процессов бота.
+
+    Каждый ресурс (канал или маршрут) принадлежит не более чем одному
+    процессу, пока тот продлевает аренду. Истёкшую аренду забирает
+    другой процесс, и токен ограждения (fencing token) растёт, поэтому
+    записи прежнего владельца с устаревшим токеном база отклоняет.
+    Процессы отмечаются своей арендой process:<owner>; по их числу
+    каждый берёт себе справедливую долю ресурсов и отдаёт лишнее.
+    """
+
+    def __init__(self, db, owner: str, ttl: float = 30, clock: Callable[[], float] = time.time):
+        self.db = db
+        self.owner = owner
+        self.ttl = ttl
+        self.clock = clock
+        self.held: Dict[str, Tuple[int, float]] = {}  # ресурс -> (токен, срок аренды)
+        self.processes = 1
+
+    def holds(self, resource: str) -> bool:
+        """Аренда у нас и не истекает в ближайшую треть TTL"""
+        lease = self.held.get(resource)
+        return lease is not None and lease[1] - self.ttl / 3 > self.clock()
+
+    def owns(self, resource: str) -> bool:
+        return resource in self.held
+
+    def fence(self, resource: str) -> Fence:
+        """Ограждение для записи; без аренды токен 0, и база запись отклонит"""
+        token = self.held[resource][0] if resource in self.held else 0
+        return Fence(resource, self.owner, token, self.clock())
+
+    def _order(self, resource: str) -> int:
+        """Порядок захвата свободных ресурсов: у каждого процесса свой"""
+        return zlib.crc32(f'{self.owner}/{resource}'.encode('utf-8'))
+
+    async def sync(self, resources: List[str]) -> Tuple[List[str], List[str]]:
+        """Продлить аренды, отдать лишнее и занять свою долю свободных ресурсов.
+
+        Возвращает (новые ресурсы, потерянные или отданные ресурсы).
+        """
+        now = self.clock()
+        wanted = set(resources)
+        await self.db.acquire_lease(PROCESS_PREFIX + self.owner, self.owner, now, self.ttl)
+        lost = []
+        for resource, (token, _) in list(self.held.items()):
+            if resource not in wanted:
+                await self.db.release_lease(resource, self.owner)
+            elif await self.db.renew_lease(resource, self.owner, token, now, self.ttl):
+                self.held[resource] = (token, now + self.ttl)
+                continue
+            else:
+                logger.warning(f"Аренда {resource} потеряна")
+            del self.held[resource]
+            lost.append(resource)
+
+        leases = await self.db.get_leases(now)
+        self.processes = max(1, sum(1 for resource, *_ in leases if resource.startswith(PROCESS_PREFIX)))
+        share = math.ceil(len(wanted) / self.processes)
+        for resource in sorted(self.held, key=self._order)[share:]:
+            # Появились новые процессы — отдаём им лишнее
+            await self.db.release_lease(resource, self.owner)
+            del self.held[resource]
+            lost.append(resource)
+
+        taken = {resource for resource, owner, *_ in leases if owner != self.owner}
+        acquired = []
+        for resource in sorted(wanted - taken - set(self.held), key=self._order):
+            if len(self.held) >= share:
+                break
+            token = await self.db.acquire_lease(resource, self.owner, now, self.ttl)
+            if token is not None:
+                self.held[resource] = (token, now + self.ttl)
+                acquired.append(resource)
+        return acquired, lost
+
+    async def release_all(self):
+        for resource in list(self.held):
+            await self.db.release_lease(resource, self.owner)
+        self.held.clear()
+        await self.db.release_lease(PROCESS_PREFIX + self.owner, self.owner)
@@ -0,0 +1,83 @@
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+from posts import PostUnit
+
+logger = logging.getLogger(__name__)
+
+
+class LiveFeed:
+    """Очереди новых постов, пришедших из живых обновлений.
+
+    Для каждого канала в режиме live держится ограниченная очередь
+    постов; планировщик забирает из неё по одному согласно расписанию.
+    Если очередь переполнилась, соединение переподключалось или в id
+    пришедших постов обнаружился разрыв (обновления потерялись), канал
+    помечается как требующий догоняющей выборки истории от курсора.
+    """
+
+    def __init__(self, maxlen: int = 100):
+        self.maxlen = maxlen
+        self.queues: Dict[int, Deque[PostUnit]] = {}
+        self.catchup: Set[int] = set()
+        self.last_ids: Dict[int, int] = {}
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.queues
+
+    def subscribe(self, channel_id: int):
+        """Включить live для канала; первый проход всегда догоняющий"""
+        if channel_id not in self.queues:
+            self.queues[channel_id] = deque()
+            self.catchup.add(channel_id)
+
+    def unsubscribe(self, channel_id: int):
+        self.queues.pop(channel_id, None)
+        self.catchup.discard(channel_id)
+        self.last_ids.pop(channel_id, None)
+
+    def push(self, channel_id: int, group: PostUnit) -> bool:
+        """Положить пост в очередь; False, если канал не подписан или очередь полна"""
+        queue = self.queues.get(channel_id)
+        if queue is None:
+            return False
+        first_id = group.first_id
+        last_id = self.last_ids.get(channel_id)
+        self.last_ids[channel_id] = max(last_id or 0, group.last_id)
+        if last_id is not None and first_id > last_id + 1 and channel_id not in self.catchup:
+            logger.warning(f"Пропуск обновлений в канале {channel_id} ({last_id} -> {first_id}), нужна догоняющая выборка")
+            self.catchup.add(channel_id)
+        if len(queue) >= self.maxlen:
+            # Лишнее не храним: догоним по курсору из истории
+            if channel_id not in self.catchup:
+                logger.warning(f"Очередь live канала {channel_id} переполнена, нужна догоняющая выборка")
+            self.catchup.add(channel_id)
+            return False
+        queue.append(group)
+        return True
+
+    def pending(self, channel_id: int) -> int:
+        """Сколько постов ждёт в очереди канала"""
+        return len(self.queues.get(channel_id, ()))
+
+    def pop(self, channel_id: int, after_id: int = 0) -> Optional[PostUnit]:
+        """Достать следующий пост новее after_id"""
+        queue = self.queues.get(channel_id)
+        while queue:
+            group = queue.popleft()
+            if group.last_id > after_id:
+                return group
+        return None
+
+    def needs_catchup(self, channel_id: int) -> bool:
+        return channel_id in self.catchup
+
+    def caught_up(self, channel_id: int, last_id: int):
+        """История прочитана до last_id — дальше хватает живых обновлений"""
+        self.catchup.discard(channel_id)
+        if channel_id in self.queues:
+            self.last_ids[channel_id] = max(self.last_ids.get(channel_id, 0), last_id)
+
+    def request_catchup(self):
+        """Пометить все live каналы для догоняющей выборки (после переподключения)"""
+        self.catchup.update(self.queues)
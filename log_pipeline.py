@@ -0,0 +1,177 @@
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+# Поля контекста, которые попадают в JSON-записи (из bind() или extra=)
+CONTEXT_FIELDS = ('channel_id', 'source_id', 'destination_id', 'message_id', 'session', 'job_id',
+                  'duration_ms', 'attempt', 'suppressed')
+
+log_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
+
+
+def bind(**fields):
+    """Добавить поля ко всем записям текущей задачи (например, channel_id на время обработки канала)"""
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Переносит поля bind() в запись; работает в потоке event loop, где виден контекст задачи"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Ограничивает повторяющиеся предупреждения и ошибки.
+
+    Повтором считается запись из той же строки кода: сообщения собраны
+    f-строками и у каждого канала свой текст, а место вызова одно. С
+    одного места за window секунд проходит не больше limit записей
+    уровня level и выше; следующая пропущенная после паузы запись
+    несёт в поле suppressed, сколько записей было отброшено.
+    """
+
+    def __init__(self, limit: int = 20, window: float = 60, level: int = logging.WARNING,
+                 clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.level = level
+        self.clock = clock
+        self.suppressed = 0
+        self._sites: Dict[Tuple[str, int], list] = {}  # место вызова -> [начало окна, пропущено, отброшено]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level or not self.limit:
+            return True
+        now = self.clock()
+        site = self._sites.get((record.pathname, record.lineno))
+        if site is None or now - site[0] >= self.window:
+            dropped = site[2] if site is not None else 0
+            site = self._sites[(record.pathname, record.lineno)] = [now, 0, 0]
+            if dropped:
+                record.suppressed = dropped
+        if site[1] >= self.limit:
+            site[2] += 1
+            self.suppressed += 1
+            return False
+        site[1] += 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, текст и поля контекста"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info or record.exc_text:
+            data['exc'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+_formatter = logging.Formatter()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при переполненной очереди отбрасывает запись, а не ждёт"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Копия записи для потока записи: текст уже собран, трейсбек — отдельно в exc_text.
+
+        Стандартный prepare дописывает трейсбек в сообщение, и в JSON он
+        не попадал бы в своё поле exc.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # При остановке ждём места в очереди: иначе полная очередь не даст завершить поток
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """Логирование без записи на диск в event loop.
+
+    Корневой логгер получает только DroppingQueueHandler: запись
+    проходит фильтры контекста и выборки и кладётся в очередь. Файл с
+    ротацией (по размеру или по времени) и консоль пишет фоновый поток
+    QueueListener.
+    """
+
+    def __init__(self, path: str = 'bot.log', level: int = logging.INFO, max_bytes: int = 10 * 2 ** 20,
+                 backups: int = 5, when: Optional[str] = None, json_format: bool = True, console: bool = True,
+                 sample_limit: int = 20, sample_window: float = 60, queue_size: int = 10_000):
+        if when:
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                path, when=when, backupCount=backups, encoding='utf-8'
+            )
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+            )
+        text = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        file_handler.setFormatter(JsonFormatter() if json_format else text)
+        handlers = [file_handler]
+        if console:
+            stream = logging.StreamHandler(sys.stderr)
+            stream.setFormatter(text)
+            handlers.append(stream)
+        self.handlers = handlers
+        self.sampling = SamplingFilter(sample_limit, sample_window)
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(ContextFilter())
+        self.handler.addFilter(self.sampling)
+        self.listener = _Listener(self.handler.queue, *handlers, respect_handler_level=True)
+        self.level = level
+
+    def start(self) -> 'LogPipeline':
+        root = logging.getLogger()
+        root.setLevel(self.level)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """Дописать очередь и закрыть файлы"""
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
@@ -1,22 +1,54 @@
 import asyncio
+import contextvars
+import dataclasses
 import logging
+import os
+import socket
+import time
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional, Dict
-from telethon import TelegramClient, events
-from telethon.errors import FloodWaitError, ChannelPrivateError
-from telethon.tl.types import Message
-from config import API_ID, API_HASH, SESSION_NAME, DATABASE_NAME, ChannelConfig
-from database import Database
-
-# Логирование
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+from typing import AsyncIterator, Callable, List, Optional, Dict, Tuple
+from telethon import TelegramClient, events, utils
+from telethon.errors import FloodWaitError, ChannelPrivateError, ChatForwardsRestrictedError, FileReferenceExpiredError
+from telethon.errors.rpcbaseerrors import (
+    BadRequestError, FloodError, ForbiddenError, NotFoundError, ServerError, TimedOutError
 )
+from telethon.tl.types import (
+    Message, InputPeerChannel, InputPeerChat, InputPeerUser, Document, Photo, InputDocument, InputPhoto,
+    PhotoSize, PhotoSizeProgressive, PhotoStrippedSize
+)
+from config import (
+    API_ID, API_HASH, SESSION_NAME, SESSION_NAMES, SESSION_FAILOVER_FLOOD_SECONDS, DATABASE_NAME, ChannelConfig, RouteConfig,
+    SEND_RATE_PER_SECOND, SEND_BURST, DESTINATION_SENDS_PER_MINUTE, DESTINATION_BURST,
+    REPOSTED_RETENTION_DAYS, LIVE_QUEUE_SIZE, ENTITY_CACHE_TTL, ENTITY_CACHE_PERSIST_DAYS,
+    JOB_CONCURRENCY, PIPELINE_DEPTH, SOURCE_BUFFER_POSTS, SOURCE_TAIL_TTL,
+    METRICS_HOST, METRICS_PORT, SHARDING, SHARD_OWNER, LEASE_TTL, LEASE_RENEW_SECONDS,
+    MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, MEDIA_PART_SIZE, MEDIA_DOWNLOAD_PARTS,
+    SIMILARITY_MAX_DISTANCE, SIMILARITY_WINDOW_DAYS, SIMILARITY_MAX_PER_DESTINATION, SIMILARITY_MIN_WORDS,
+    STARTUP_BATCH_SIZE, STARTUP_BATCH_INTERVAL, STARTUP_JITTER,
+    OUTBOX_RETRY_NETWORK, OUTBOX_RETRY_FLOOD, OUTBOX_RETRY_OTHER, OUTBOX_DEFER_SECONDS,
+    LOG_FILE, LOG_MAX_BYTES, LOG_BACKUPS, LOG_ROTATE_WHEN, LOG_JSON, LOG_SAMPLE_LIMIT, LOG_SAMPLE_WINDOW
+)
+from storage import AsyncDatabase
+from rate_limiter import RateGovernor
+from dedup import RepostLedger, post_key
+from live import LiveFeed
+from entity_cache import EntityCache
+from client_pool import ClientPool, Session
+from leases import LeaseManager, channel_resource, parse_resource, route_resource
+from fanout import SourceBuffer
+from media_cache import DiskLRU, MediaCache
+from similarity import SimilarityIndex, post_fingerprints
+from metrics import Metrics, Profiler, WindowCounter, start_exporter, timed, watch_loop_lag
+from jobs import JobManager, RepostJob
+from pipeline import batch_posts, run_pipeline
+from posts import PostUnit, group_stream
+from warmup import Warmup
+from outbox import CHANNEL, PENDING, ROUTE, Deferred, Outbox, OutboxEntry, RetryPolicy
+from log_pipeline import LogPipeline, bind
+from content_filter import REPLACE, RULE_KINDS, ContentFilters, FilterRule
+from scheduler import RepostScheduler, channel_interval, next_deadline
+
+# Логирование настраивается при запуске (LogPipeline): запись на диск идёт в фоновом потоке
 logger = logging.getLogger(__name__)
 
 def ensure_utc(dt: datetime) -> datetime:
@@ -25,180 +57,1046 @@ def ensure_utc(dt: datetime) -> datetime:
         return dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(timezone.utc)
 
+# Сколько сообщений Telegram принимает в одном запросе пересылки
+FORWARD_BATCH_SIZE = 100
+
+def _peer_key(entity) -> int:
+    """Ключ получателя для регулятора скорости"""
+    try:
+        return utils.get_peer_id(entity)
+    except TypeError:
+        return getattr(entity, 'id', entity)
+
+def _media_file(media):
+    """Документ или фото медиа, если у него есть файл"""
+    for file in (getattr(media, 'document', None), getattr(media, 'photo', None)):
+        if isinstance(file, (Document, Photo)):
+            return file
+    return None
+
+def _media_key(media) -> Optional[str]:
+    """Ключ файла в Telegram, известный без скачивания"""
+    file = _media_file(media)
+    if file is None:
+        return None
+    return f"{'document' if isinstance(file, Document) else 'photo'}:{file.id}"
+
+def _media_size(media) -> int:
+    """Размер файла (для фото — самого большого размера, его и скачивает Telethon); 0 — неизвестен"""
+    file = _media_file(media)
+    if isinstance(file, Document):
+        return file.size
+    size = file.sizes[-1] if file and file.sizes else None
+    if isinstance(size, PhotoSize):
+        return size.size
+    if isinstance(size, PhotoSizeProgressive):
+        return max(size.sizes)
+    return 0
+
+def _media_suffix(media) -> str:
+    file = _media_file(media)
+    if isinstance(file, Document):
+        return utils.get_extension(file)
+    return '.jpg'
+
+def _upload_from_message(message) -> Optional[tuple]:
+    """Ссылка на файл отправленного сообщения для повторной отправки без загрузки"""
+    file = _media_file(getattr(message, 'media', None))
+    if file is None:
+        return None
+    kind = 'document' if isinstance(file, Document) else 'photo'
+    return kind, file.id, file.access_hash, file.file_reference
+
+def _upload_to_input(upload):
+    kind, file_id, access_hash, file_reference = upload
+    cls = InputDocument if kind == 'document' else InputPhoto
+    return cls(id=file_id, access_hash=access_hash, file_reference=file_reference)
+
+def _fingerprints(post: PostUnit):
+    """Отпечатки поста: текст и встроенные в сообщения миниатюры (без скачивания)"""
+    thumbnails = []
+    for media in post.media:
+        file = _media_file(media)
+        sizes = (file.sizes if isinstance(file, Photo) else file.thumbs) if file else None
+        thumbnails.extend(utils.stripped_photo_to_jpg(size.bytes) for size in sizes or ()
+                          if isinstance(size, PhotoStrippedSize))
+    return post_fingerprints([post.caption], thumbnails, min_tokens=SIMILARITY_MIN_WORDS)
+
+def _peer_to_row(entity):
+    """Компактная форма InputPeer для кеша сущностей"""
+    peer = utils.get_input_peer(entity)
+    if isinstance(peer, InputPeerChannel):
+        return 'channel', peer.channel_id, peer.access_hash
+    if isinstance(peer, InputPeerUser):
+        return 'user', peer.user_id, peer.access_hash
+    if isinstance(peer, InputPeerChat):
+        return 'chat', peer.chat_id, 0
+    return None
+
+def _row_to_peer(row):
+    peer_type, entity_id, access_hash = row
+    if peer_type == 'channel':
+        return InputPeerChannel(entity_id, access_hash)
+    if peer_type == 'user':
+        return InputPeerUser(entity_id, access_hash)
+    return InputPeerChat(entity_id)
+
+_SETTINGS_FIELDS = (
+    'posts_per_day', 'interval_seconds', 'start_date', 'forward_mode', 'drop_author', 'live_mode'
+)
+
+def _settings_changed(current, fresh) -> bool:
+    """Изменились ли настройки расписания/копирования (прогресс не в счёт)"""
+    return any(getattr(current, name, None) != getattr(fresh, name, None) for name in _SETTINGS_FIELDS)
+
+# Сессия пула, через которую работает текущая задача (обработка канала, маршрута, репост истории)
+current_session: contextvars.ContextVar = contextvars.ContextVar('current_session', default=None)
+# Аренда, под которой текущая задача отправляет посты (при шардировании)
+current_lease: contextvars.ContextVar = contextvars.ContextVar('current_lease', default=None)
+
+# Политики повторов outbox по классам ошибок отправки; берётся первая подходящая
+OUTBOX_POLICIES = [
+    ((FloodError,), RetryPolicy('flood', *OUTBOX_RETRY_FLOOD)),
+    # Устаревшая ссылка на файл источника лечится повтором: сообщения загружаются заново
+    ((OSError, asyncio.TimeoutError, ServerError, TimedOutError, FileReferenceExpiredError),
+     RetryPolicy('network', *OUTBOX_RETRY_NETWORK)),
+    # Неверный или запрещённый запрос, удалённые сообщения: повтор даст то же самое
+    ((BadRequestError, ForbiddenError, NotFoundError, LookupError), RetryPolicy('permanent', 1)),
+]
+# Сколько постов подряд, сразу ушедших в недоставленные, пропустить за один запуск:
+# если получатель недоступен целиком, очередь не сливается в недоставленные разом
+DEAD_SKIPS_PER_RUN = 5
+
+def _forward_batches(groups: List[PostUnit], size: int = FORWARD_BATCH_SIZE) -> List[List[PostUnit]]:
+    """Разбить посты на пакеты до size сообщений, не разрывая альбомы"""
+    batches = []
+    current = []
+    count = 0
+    for group in groups:
+        if current and count + len(group) > size:
+            batches.append(current)
+            current = []
+            count = 0
+        current.append(group)
+        count += len(group)
+    if current:
+        batches.append(current)
+    return batches
+
 class ChannelReposter:
-    def __init__(self):
-        self.db = Database(DATABASE_NAME)
-        self.client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
-        self.active_tasks: Dict[int, asyncio.Task] = {}
+    def __init__(self, client_factory=TelegramClient, db_name: str = DATABASE_NAME,
+                 session_names: Optional[List[str]] = None, clock: Optional[Callable[[], float]] = None,
+                 metrics_port: Optional[int] = METRICS_PORT):
+        """client_factory(name, api_id, api_hash) создаёт клиента сессии, clock
+        подменяет часы всех компонентов (нагрузочные тесты идут на виртуальном времени)"""
+        self.client_factory = client_factory
+        self.clock = clock or time.time
+        self.monotonic = clock or time.monotonic
+        self.metrics_port = metrics_port
+        self.metrics = Metrics()
+        self.profiler = Profiler()
+        self.sent_recently = WindowCounter(86400, self.clock)
+        self.db = AsyncDatabase(db_name, metrics=self.metrics)
+        names = session_names or SESSION_NAMES or [SESSION_NAME]
+        self.pool = ClientPool(
+            [self._make_session(name, primary=index == 0, pooled=len(names) > 1) for index, name in enumerate(names)],
+            failover_after=SESSION_FAILOVER_FLOOD_SECONDS,
+            clock=self.monotonic
+        )
+        # Основная сессия: команды, живые обновления, отчёты
+        self.client = self.pool.primary.client
+        self.entities = self.pool.primary.entities
+        self.scheduler = RepostScheduler(self._process_channel, clock=self.clock)
+        self.route_scheduler = RepostScheduler(self._process_route, clock=self.clock, key=lambda route: route.key)
+        # Каналы после старта запускаются пачками, чтобы не получить flood wait
+        self.warmup = Warmup(STARTUP_BATCH_SIZE, STARTUP_BATCH_INTERVAL, STARTUP_JITTER, clock=self.clock)
+        self.sources = SourceBuffer(
+            self._fetch_source_page,
+            page_size=FORWARD_BATCH_SIZE,
+            max_posts=SOURCE_BUFFER_POSTS,
+            tail_ttl=SOURCE_TAIL_TTL,
+            clock=self.monotonic
+        )
+        self.restricted_sources = set()
+        self.media = MediaCache(
+            self.db,
+            DiskLRU(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES),
+            part_size=MEDIA_PART_SIZE,
+            parallel=MEDIA_DOWNLOAD_PARTS,
+            clock=self.clock
+        )
+        self.ledger = RepostLedger(self.db, retention_days=REPOSTED_RETENTION_DAYS)
+        self.similar = SimilarityIndex(
+            self.db,
+            max_distance=SIMILARITY_MAX_DISTANCE,
+            window_days=SIMILARITY_WINDOW_DAYS,
+            max_per_destination=SIMILARITY_MAX_PER_DESTINATION,
+            clock=self.clock
+        )
+        # Правила фильтров и замен подписей по получателям
+        self.filters = ContentFilters(self.db, media_size=_media_size)
+        self.live = LiveFeed(LIVE_QUEUE_SIZE)
+        self.jobs = JobManager(self.db, self._run_job, concurrency=JOB_CONCURRENCY, clock=self.clock)
+        # Неудачные отправки повторяются отдельно от расписания каналов
+        self.outbox = Outbox(
+            self.db,
+            self._retry_outbox,
+            policies=OUTBOX_POLICIES,
+            default=RetryPolicy('other', *OUTBOX_RETRY_OTHER),
+            defer_seconds=OUTBOX_DEFER_SECONDS,
+            clock=self.clock
+        )
+        # При шардировании каналы этого процесса определяются арендой в общей базе
+        self.leases = None
+        if SHARDING:
+            self.leases = LeaseManager(
+                self.db, SHARD_OWNER or f"{socket.gethostname()}:{os.getpid()}", ttl=LEASE_TTL, clock=self.clock
+            )
+        self._register_metrics()
+
+    def _make_session(self, name: str, primary: bool, pooled: bool) -> Session:
+        """Клиент с собственными лимитом отправок и кешем сущностей.
+
+        access_hash у каждого аккаунта свой, поэтому в базе сохраняется
+        только кеш основной сессии.
+        """
+        client = self.client_factory(name, API_ID, API_HASH)
+        entities = EntityCache(
+            client.get_entity,
+            self.db if primary else None,
+            ttl=ENTITY_CACHE_TTL,
+            persist_ttl=ENTITY_CACHE_PERSIST_DAYS * 86400,
+            to_row=_peer_to_row,
+            from_row=_row_to_peer,
+            clock=self.clock
+        )
+        governor = RateGovernor(
+            rate=SEND_RATE_PER_SECOND,
+            burst=SEND_BURST,
+            destination_rate=DESTINATION_SENDS_PER_MINUTE / 60,
+            destination_burst=DESTINATION_BURST,
+            flood_errors=(FloodWaitError,),
+            # В пуле долгий флуд не пережидаем: канал переедет на другую сессию
+            max_flood_wait=SESSION_FAILOVER_FLOOD_SECONDS if pooled else None,
+            clock=self.monotonic
+        )
+        return Session(name, client, governor, entities)
+
+    def _now(self) -> datetime:
+        return datetime.fromtimestamp(self.clock(), timezone.utc)
+
+    @property
+    def session(self) -> Session:
+        """Сессия текущей задачи; вне обработки каналов — основная"""
+        return current_session.get() or self.pool.primary
+
+    def _use_session(self, key: int, required: bool = True, ready: bool = False) -> Optional[Session]:
+        """Выбрать сессию для канала и закрепить её за текущей задачей"""
+        session = self.pool.session_for(key, ready)
+        if session is None:
+            if required:
+                logger.warning(f"Нет доступных сессий для {key}")
+                return None
+            session = self.pool.primary
+        current_session.set(session)
+        bind(session=session.name)
+        return session
+
+    def _register_metrics(self):
+        """Датчики, которые вычисляются в момент выгрузки метрик"""
+        gauge = self.metrics.gauge
+        total = self.metrics.total
+        sessions = lambda attr: {s.name: getattr(s.governor, attr) for s in self.pool}
+        total('repost_sends', 'Успешных вызовов API отправки', lambda: sessions('sends'), label='session')
+        total('repost_flood_waits', 'Сколько раз получен flood wait', lambda: sessions('flood_waits'), label='session')
+        total('repost_flood_wait_seconds', 'Суммарное время flood wait', lambda: sessions('flood_seconds'),
+              label='session')
+        gauge('repost_send_rate', 'Текущий лимит отправок в секунду',
+              lambda: {s.name: s.governor.account.rate for s in self.pool}, label='session')
+        gauge('repost_session_available', 'Сессия доступна для отправок',
+              lambda: {s.name: int(self.pool.is_available(s)) for s in self.pool}, label='session')
+        gauge('repost_session_channels', 'Каналов и маршрутов на сессии', self._session_assignments, label='session')
+        total('repost_session_failovers', 'Переездов каналов между сессиями', lambda: self.pool.failovers)
+        total('repost_ledger_cache_hits', 'Проверок журнала репостов без запроса к базе', lambda: self.ledger.hits)
+        total('repost_ledger_db_lookups', 'Проверок журнала репостов через базу', lambda: self.ledger.db_lookups)
+        total('repost_entity_cache_hits', 'Попаданий в кеш сущностей',
+              lambda: {s.name: s.entities.hits for s in self.pool}, label='session')
+        total('repost_entity_cache_misses', 'Промахов кеша сущностей',
+              lambda: {s.name: s.entities.misses for s in self.pool}, label='session')
+        total('repost_similarity_checks', 'Проверок постов на похожие', lambda: self.similar.checks)
+        total('repost_similarity_duplicates', 'Пропущено похожих постов', lambda: self.similar.duplicates)
+        total('repost_media_upload_hits', 'Медиа отправлено по ссылке без загрузки', lambda: self.media.upload_hits)
+        total('repost_media_disk_hits', 'Медиа взято из кеша на диске', lambda: self.media.disk_hits)
+        total('repost_media_downloads', 'Скачиваний медиа', lambda: self.media.downloads)
+        total('repost_media_downloaded_bytes', 'Скачано байт медиа', lambda: self.media.downloaded_bytes)
+        gauge('repost_media_cache_bytes', 'Размер кеша медиа на диске', lambda: self.media.store.size)
+        total('repost_db_commits', 'Групповых коммитов базы', lambda: self.db.commits)
+        total('repost_db_writes', 'Записей в базу', lambda: self.db.writes)
+        total('repost_source_fetches', 'Загрузок страниц истории источников', lambda: self.sources.fetches)
+        gauge('repost_source_buffer_posts', 'Постов в общем буфере источников', lambda: len(self.sources))
+        gauge('repost_scheduled_channels', 'Каналов в расписании', lambda: len(self.scheduler.configs))
+        gauge('repost_scheduled_routes', 'Маршрутов в расписании', lambda: len(self.route_scheduler.configs))
+        gauge('repost_outbox_pending', 'Постов, ожидающих повтора отправки', lambda: len(self.outbox))
+        total('repost_outbox_retries', 'Повторных попыток отправки', lambda: self.outbox.retries)
+        gauge('repost_outbox_dead', 'Недоставленных постов', lambda: self.outbox.dead)
+        total('repost_filter_blocked', 'Постов, отброшенных фильтрами', lambda: self.filters.blocked)
+        total('repost_filter_rewritten', 'Постов с подписью, изменённой фильтрами', lambda: self.filters.rewritten)
+        gauge('repost_warmup_pending', 'Каналов и маршрутов в очереди запуска', lambda: len(self.warmup))
+        gauge('repost_startup_ready_seconds', 'Время от старта до запуска всех каналов',
+              lambda: {} if self.warmup.ready_seconds is None else self.warmup.ready_seconds)
+        gauge('repost_channel_backlog', 'Загруженных, но ещё не отправленных постов', self._backlog)
+        gauge('repost_channel_overdue_seconds', 'Насколько канал отстаёт от дедлайна', self._overdue)
+        gauge('repost_posts_sent_24h', 'Постов отправлено за сутки', self.sent_recently.counts)
+        gauge('repost_posts_target_per_day', 'Целевое число постов в сутки', self._daily_targets)
+
+    def _schedule_entries(self):
+        """(метка, конфигурация, планировщик) для всех каналов и маршрутов в расписании"""
+        for channel_id, config in list(self.scheduler.configs.items()):
+            yield str(channel_id), config, self.scheduler
+        for key, route in list(self.route_scheduler.configs.items()):
+            yield f"{key[0]}:{key[1]}", route, self.route_scheduler
+
+    def _session_assignments(self) -> Dict[str, int]:
+        keys = list(self.scheduler.configs) + [destination for _, destination in self.route_scheduler.configs]
+        return self.pool.assignments(keys)
+
+    def _backlog(self) -> Dict[str, int]:
+        backlog = {}
+        for label, config, _ in self._schedule_entries():
+            if isinstance(config, RouteConfig):
+                backlog[label] = self.sources.pending(config.source_id, config.last_seen_message_id)
+            else:
+                backlog[label] = (self.live.pending(config.channel_id)
+                                  + self.sources.pending(config.channel_id, config.last_seen_message_id))
+        return backlog
+
+    def _overdue(self) -> Dict[str, float]:
+        now = self.clock()
+        overdue = {}
+        for label, config, scheduler in self._schedule_entries():
+            deadline = scheduler.deadline_of(scheduler.key(config))
+            overdue[label] = max(0.0, now - deadline) if deadline is not None else 0.0
+        return overdue
+
+    def _daily_targets(self) -> Dict[str, float]:
+        return {label: 86400 / channel_interval(config) for label, config, _ in self._schedule_entries()}
+
+    def _record_sent(self, label: str):
+        self.sent_recently.add(label)
+        self.metrics.counter('repost_posts_sent_total', 'Отправлено постов по расписанию').inc(channel=label)
 
     async def start(self):
-        await self.client.start()
-        logger.info("Бот успешно запущен")
+        for session in self.pool:
+            await session.client.start()
+            await session.entities.load()
+        logger.info(f"Бот успешно запущен, сессий: {len(self.pool)}")
         self._register_handlers()
-        await self._restart_active_channels()
-        await self.client.run_until_disconnected()
+        await self.ledger.load()
+        await self.media.load()
+        await self.outbox.restore()
+        await self.filters.load()
+        lease_task = None
+        if self.leases is not None:
+            await self._sync_leases()
+            lease_task = asyncio.create_task(self._lease_loop())
+        # Каналы поднимаются в фоне: команды обслуживаются сразу
+        warmup_task = asyncio.create_task(self._warm_start())
+        await self.jobs.restore()
+        self.jobs.start()
+        scheduler_task = asyncio.create_task(self.scheduler.run())
+        route_scheduler_task = asyncio.create_task(self.route_scheduler.run())
+        outbox_task = asyncio.create_task(self.outbox.run())
+        maintenance_task = asyncio.create_task(self._maintenance_loop())
+        watchdog_task = asyncio.create_task(self._connection_watchdog())
+        lag_task = asyncio.create_task(watch_loop_lag(self.metrics))
+        exporter = None
+        if self.metrics_port:
+            try:
+                exporter = await start_exporter(self.metrics, METRICS_HOST, self.metrics_port)
+            except OSError as e:
+                logger.error(f"Не удалось запустить эндпоинт метрик: {str(e)}")
+        try:
+            await self.client.run_until_disconnected()
+        finally:
+            lag_task.cancel()
+            warmup_task.cancel()
+            if exporter is not None:
+                exporter.close()
+            scheduler_task.cancel()
+            route_scheduler_task.cancel()
+            outbox_task.cancel()
+            maintenance_task.cancel()
+            watchdog_task.cancel()
+            await self.jobs.stop()
+            if lease_task is not None:
+                lease_task.cancel()
+                # Отдаём каналы сразу, не дожидаясь истечения аренды
+                await self.leases.release_all()
+            for session in self.pool:
+                if session is not self.pool.primary:
+                    await session.client.disconnect()
+            await self.db.close()
+
+    async def _warm_start(self):
+        if self.leases is None:
+            await self._restart_active_channels()
+        await self.warmup.run()
 
     async def _restart_active_channels(self):
-        channels = self.db.get_all_channels()
-        for config in channels:
+        """Поставить в очередь запуска все активные каналы и маршруты"""
+        channels = {config.channel_id: config for config in await self.db.get_all_channels()}
+        for config in channels.values():
             if config.is_active:
-                logger.info(f"Перезапуск канала {config.channel_id}")
-                self._start_channel_task(config)
-
-    def _start_channel_task(self, config: ChannelConfig):
-        if config.channel_id in self.active_tasks:
-            self.active_tasks[config.channel_id].cancel()
-        self.active_tasks[config.channel_id] = asyncio.create_task(
-            self._channel_worker(config)
+                self._submit_channel(config)
+        for route in await self.db.get_routes():
+            if route.is_active:
+                self._submit_route(route, channels.get(route.source_id))
+        logger.info(f"К запуску каналов и маршрутов: {len(self.warmup)}")
+
+    def _submit_channel(self, config: ChannelConfig):
+        async def activate():
+            self._activate_channel(config)
+        self.warmup.submit(config.channel_id, next_deadline(config), activate)
+
+    def _submit_route(self, route: RouteConfig, source: Optional[ChannelConfig]):
+        # Без своего расписания и без настроек источника очередь не угадать: запускаем первым
+        deadline = next_deadline(self._effective_route(route, source)) if source or route.has_schedule else 0.0
+        self.warmup.submit(route.key, deadline, lambda: self._activate_route(route))
+
+    def _activate_channel(self, config: ChannelConfig):
+        """Поставить канал в расписание и (от)подписать его на живые обновления"""
+        self.warmup.discard(config.channel_id)
+        if not config.is_active:
+            return self._deactivate_channel(config.channel_id)
+        if self.leases is not None and not self.leases.owns(channel_resource(config.channel_id)):
+            # Чужой канал: владелец подхватит изменения при продлении аренды
+            return
+        if config.live_mode:
+            self.live.subscribe(config.channel_id)
+        else:
+            self.live.unsubscribe(config.channel_id)
+        self.sources.advance(config.channel_id, config.channel_id, config.last_seen_message_id)
+        self.scheduler.schedule(config)
+
+    def _deactivate_channel(self, channel_id: int):
+        self.warmup.discard(channel_id)
+        self.scheduler.remove(channel_id)
+        self.live.unsubscribe(channel_id)
+        self.sources.forget(channel_id, channel_id)
+
+    async def _activate_route(self, route: RouteConfig):
+        """Поставить маршрут в расписание; без своего расписания — как у источника"""
+        self.warmup.discard(route.key)
+        if not route.is_active:
+            return self._deactivate_route(route.key)
+        if self.leases is not None and not self.leases.owns(route_resource(*route.key)):
+            return
+        route = self._effective_route(route, await self._copy_settings(route.source_id))
+        self.sources.advance(route.source_id, route.key, route.last_seen_message_id)
+        self.route_scheduler.schedule(route)
+
+    @staticmethod
+    def _effective_route(route: RouteConfig, source: ChannelConfig) -> RouteConfig:
+        if route.has_schedule:
+            return route
+        return dataclasses.replace(
+            route, posts_per_day=source.posts_per_day, interval_seconds=source.interval_seconds
         )
 
-    async def _channel_worker(self, config: ChannelConfig):
-        logger.info(f"Запуск воркера для канала {config.channel_id}")
-        while config.is_active:
+    def _deactivate_route(self, key: Tuple[int, int]):
+        self.warmup.discard(key)
+        self.route_scheduler.remove(key)
+        self.sources.forget(key[0], key)
+
+    async def _lease_loop(self):
+        while True:
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
             try:
-                config = self.db.get_channel(config.channel_id)
-                if not config or not config.is_active:
-                    break
-                await self._process_channel(config)
-                await asyncio.sleep(300)
-            except FloodWaitError as e:
-                logger.warning(f"Flood wait на {e.seconds} секунд")
-                await asyncio.sleep(e.seconds)
+                await self._sync_leases()
             except Exception as e:
-                logger.error(f"Ошибка воркера канала: {str(e)}")
-                await asyncio.sleep(60)
-        logger.info(f"Воркер остановлен для канала {config.channel_id}")
-
-    async def _process_channel(self, config: ChannelConfig):
-        now = datetime.now(timezone.utc)
-        start_date = ensure_utc(config.start_date)
-        last_repost_date = ensure_utc(config.last_repost_date)
-        if now < start_date:
-            logger.info(f"Канал {config.channel_id} ещё не начал работу")
-            return
-        time_diff = now - last_repost_date
-        posts_needed = int((time_diff.total_seconds() / 86400) * config.posts_per_day)
-        if posts_needed < 1:
-            return
-        logger.info(f"Обработка канала {config.channel_id}, требуется {posts_needed} постов")
+                logger.error(f"Ошибка продления аренды: {str(e)}")
+            try:
+                # Правила могли поменять командой в другом процессе
+                if await self.filters.refresh():
+                    logger.info(f"Правила фильтров перечитаны: {len(self.filters)}")
+            except Exception as e:
+                logger.error(f"Ошибка загрузки правил фильтров: {str(e)}")
+
+    async def _sync_leases(self):
+        """Продлить аренду и привести расписание процесса в соответствие с ней.
+
+        Каналы, аренду которых забрали или отдали, снимаются с расписания;
+        новые ставятся с настройками из базы, а у своих подхватываются
+        изменения, сделанные командами в других процессах.
+        """
+        channels = {config.channel_id: config for config in await self.db.get_all_channels()}
+        routes = {route.key: route for route in await self.db.get_routes()}
+        wanted = [channel_resource(channel_id) for channel_id, config in channels.items() if config.is_active]
+        wanted += [route_resource(*key) for key, route in routes.items() if route.is_active]
+        acquired, lost = await self.leases.sync(wanted)
+        for resource in lost:
+            kind, ids = parse_resource(resource)
+            if kind == 'channel':
+                self._deactivate_channel(ids[0])
+            else:
+                self._deactivate_route(ids)
+        if acquired:
+            logger.info(f"Получена аренда: {', '.join(acquired)}")
+        for resource in self.leases.held:
+            kind, ids = parse_resource(resource)
+            if kind == 'channel':
+                fresh = channels[ids[0]]
+                current = self.scheduler.configs.get(ids[0])
+                if current is None:
+                    # Новый для процесса канал (в т.ч. все каналы при старте) — через очередь запуска
+                    self._submit_channel(fresh)
+                elif _settings_changed(current, fresh):
+                    self._activate_channel(fresh)
+            else:
+                current = self.route_scheduler.configs.get(ids)
+                if current is None:
+                    self._submit_route(routes[ids], channels.get(ids[0]))
+                    continue
+                source = channels.get(ids[0]) or await self._copy_settings(ids[0])
+                if _settings_changed(current, self._effective_route(routes[ids], source)):
+                    await self._activate_route(routes[ids])
+
+    def _lease_lost(self, resource: str) -> bool:
+        """Аренда истекает или потеряна: отправлять больше нельзя"""
+        if self.leases is None or self.leases.holds(resource):
+            return False
+        logger.warning(f"Нет действующей аренды {resource}, канал снимается с расписания процесса")
+        return True
+
+    async def _governed(self, session: Session, destination, func, *args, **kwargs):
+        """Вызов API отправки через регулятор сессии.
+
+        Регулятор может ждать сколько угодно (флуд без ограничения), и за
+        это время аренда истечёт и перейдёт к другому процессу. Поэтому
+        аренда проверяется ещё раз уже после ожидания, прямо перед вызовом.
+        """
+        async def fenced(*args, **kwargs):
+            resource = current_lease.get()
+            if resource is not None and self.leases is not None and not self.leases.holds(resource):
+                raise Deferred(f"нет аренды {resource}")
+            return await func(*args, **kwargs)
+        return await session.governor.call(destination, fenced, *args, **kwargs)
+
+    def _fence(self, resource: str):
+        return self.leases.fence(resource) if self.leases is not None else None
+
+    async def _reschedule_routes(self, source_id: int):
+        """Источник сменил расписание — пересчитать маршруты, которые его наследуют"""
+        for route in await self.db.get_routes(source_id):
+            if route.is_active and not route.has_schedule:
+                await self._activate_route(route)
+
+    def _on_live_post(self, channel_id: int, messages: List[Message]):
+        if self.live.push(channel_id, PostUnit.from_messages(messages)) or self.live.needs_catchup(channel_id):
+            self.scheduler.wake(channel_id)
+
+    async def _connection_watchdog(self, period: float = 5):
+        """Следить за соединениями сессий пула.
+
+        Каналы отключившейся сессии переходят к другим; после
+        переподключения основной сессии live каналам нужна догоняющая
+        выборка.
+        """
+        while True:
+            await asyncio.sleep(period)
+            for session in self.pool:
+                if not self.pool.set_connected(session, session.client.is_connected()):
+                    continue
+                if session is self.pool.primary and session.connected:
+                    logger.info("Соединение восстановлено, догоняем live каналы по истории")
+                    self.live.request_catchup()
+                    for channel_id in list(self.live.queues):
+                        self.scheduler.wake(channel_id)
+
+    async def _maintenance_loop(self):
+        """Раз в сутки чистить журнал репостов и индекс похожих постов от старых записей"""
+        while True:
+            try:
+                removed = await self.ledger.prune()
+                if removed:
+                    logger.info(f"Удалено {removed} старых записей о репостах")
+                removed = await self.similar.prune()
+                if removed:
+                    logger.info(f"Удалено {removed} старых отпечатков постов")
+            except Exception as e:
+                logger.error(f"Ошибка очистки журнала репостов: {str(e)}")
+            await asyncio.sleep(86400)
+
+    async def _process_channel(self, config: ChannelConfig) -> Optional[ChannelConfig]:
+        """Отправить один пост канала, когда наступил его дедлайн.
+
+        Вызывается планировщиком; возвращает конфигурацию с обновлённой
+        датой последнего репоста или None, если канал нужно снять.
+        """
+        now = self._now()
+        started = time.perf_counter()
+        channel_id = config.channel_id
+        # Каждый запуск обработчика — своя задача, поля видны только её записям
+        bind(channel_id=channel_id)
+        logger.info(f"Обработка канала {channel_id}")
         try:
-            channel = await self._get_entity(config.channel_id)
-            messages = await self._fetch_messages(channel, last_repost_date, posts_needed)
-            if not messages:
-                logger.info(f"Нет новых сообщений в канале {config.channel_id}")
-                return
-            grouped_messages = self._group_messages(messages)
-            sent_count = 0
-            for message_group in grouped_messages:
-                if sent_count >= posts_needed:
+            live = config.live_mode and not self.live.needs_catchup(channel_id)
+            if live and not self.live.pending(channel_id):
+                # В live режиме без новых постов в API не ходим вовсе
+                return config
+            resource = channel_resource(channel_id)
+            if self._lease_lost(resource):
+                return None
+            current_lease.set(resource)
+            if self._use_session(channel_id) is None:
+                return config
+            channel = await self._get_entity(channel_id)
+            cursor = config.last_seen_message_id
+            posts = self._iter_live_posts(channel_id, cursor) if live else self.sources.posts(channel_id, cursor)
+            sent = False
+            dead = 0
+            async for post in posts:
+                if (not post.has_content
+                        or await self.ledger.is_reposted(channel_id, channel_id, post.key)):
+                    cursor = post.last_id
+                    continue
+                filtered = self._filter_post(channel_id, channel_id, post)
+                if filtered is None:
+                    # Отброшенный фильтром пост не тратит слот расписания
+                    cursor = post.last_id
+                    continue
+                post = filtered
+                fingerprints = _fingerprints(post)
+                if await self._is_similar(channel_id, fingerprints, post):
+                    cursor = post.last_id
+                    continue
+                entry = OutboxEntry(CHANNEL, channel_id, channel_id, post.ids, post.key)
+                copies = await self.outbox.send(
+                    entry, lambda: self._forward_messages(channel, channel, post, config)
+                )
+                # Неудачный пост сохранён в outbox и повторится там, курсор идёт дальше
+                cursor = post.last_id
+                if not copies and entry.status != PENDING:
+                    # Пост сразу ушёл в недоставленные и слот не занял — берём следующий
+                    dead += 1
+                    if dead < DEAD_SKIPS_PER_RUN:
+                        continue
                     break
-                if await self._forward_messages(channel, message_group):
-                    sent_count += 1
-                    self.db.update_last_repost(config.channel_id, now)
-                    delay = getattr(config, 'interval_seconds', None) or (86400 / config.posts_per_day)
-                    await asyncio.sleep(delay)
-            logger.info(f"Отправлено {sent_count} сообщений из канала {config.channel_id}")
+                if copies:
+                    await self._remember_sent(entry, post, copies, fingerprints, started)
+                    sent = True
+                # Слот расписания занят этим постом, даже если он ждёт повтора
+                config.last_repost_date = now
+                if not await self.db.update_last_repost(channel_id, now, self._fence(resource)) and self.leases:
+                    logger.error(f"Канал {channel_id}: аренда перехвачена другим процессом")
+                    return None
+                break
+            else:
+                if config.live_mode and not live:
+                    self.live.caught_up(channel_id, cursor)
+            if cursor > config.last_seen_message_id:
+                config.last_seen_message_id = cursor
+                if not await self.db.update_cursor(channel_id, cursor, self._fence(resource)) and self.leases:
+                    return None
+            self.sources.advance(channel_id, channel_id, cursor)
+            if not sent:
+                logger.info(f"Нет новых сообщений в канале {channel_id}")
+            return config
         except ChannelPrivateError:
             logger.error(f"Канал {config.channel_id} приватный или недоступен")
+            await self.session.entities.invalidate(config.channel_id)
             config.is_active = False
-            self.db.add_channel(config)
-        except Exception as e:
-            logger.error(f"Ошибка обработки канала {config.channel_id}: {str(e)}")
+            await self.db.add_channel(config)
+            self._deactivate_channel(config.channel_id)
+            self.sources.invalidate(config.channel_id)
+            return None
+        except FloodWaitError as e:
+            logger.warning(f"Flood wait на {e.seconds} секунд (сессия {self.session.name})")
+            self.pool.report_flood(self.session, e.seconds)
+            return config
+        except Deferred as e:
+            # Аренду перехватили, пока отправка ждала регулятора: пост уйдёт от нового владельца
+            logger.error(f"Канал {channel_id}: отправка отменена, {str(e)}")
+            return None
+
+    def _filter_post(self, source_id: int, destination_id: int, post: PostUnit) -> Optional[PostUnit]:
+        """Пост после фильтров получателя (возможно, с новой подписью); None — пост отброшен"""
+        result, reason = self.filters.apply(source_id, destination_id, post)
+        if result is None:
+            logger.info(f"Пропущен пост {post.key} для {destination_id}: фильтр, {reason}",
+                        extra={'message_id': post.first_id})
+        return result
+
+    async def _is_similar(self, destination_id: int, fingerprints, post: PostUnit) -> bool:
+        """Похожий пост недавно уже ушёл получателю — не тратим на него слот расписания"""
+        match = await self.similar.find(destination_id, fingerprints)
+        if match is None:
+            return False
+        logger.info(f"Пропущен пост {post.key}: похожий ({match[0]}) уже отправлен в {destination_id}")
+        return True
+
+    async def _process_route(self, route: RouteConfig) -> Optional[RouteConfig]:
+        """Отправить получателю маршрута один пост источника.
+
+        Посты берутся из общего буфера источника, поэтому история
+        загружается один раз для всех получателей.
+        """
+        now = self._now()
+        started = time.perf_counter()
+        source_id, destination_id = route.key
+        bind(source_id=source_id, destination_id=destination_id)
+        resource = route_resource(source_id, destination_id)
+        if self._lease_lost(resource):
+            return None
+        current_lease.set(resource)
+        if self._use_session(destination_id) is None:
+            return route
+        try:
+            source = await self._get_entity(source_id)
+            destination = await self._get_entity(destination_id)
+            settings = await self._copy_settings(destination_id)
+            cursor = route.last_seen_message_id
+            sent = False
+            dead = 0
+            async for post in self.sources.posts(source_id, cursor):
+                if (not post.has_content
+                        or await self.ledger.is_reposted(source_id, destination_id, post.key)):
+                    cursor = post.last_id
+                    continue
+                filtered = self._filter_post(source_id, destination_id, post)
+                if filtered is None:
+                    cursor = post.last_id
+                    continue
+                post = filtered
+                fingerprints = _fingerprints(post)
+                if await self._is_similar(destination_id, fingerprints, post):
+                    cursor = post.last_id
+                    continue
+                entry = OutboxEntry(ROUTE, source_id, destination_id, post.ids, post.key)
+                copies = await self.outbox.send(
+                    entry, lambda: self._forward_messages(source, destination, post, settings)
+                )
+                cursor = post.last_id
+                if not copies and entry.status != PENDING:
+                    dead += 1
+                    if dead < DEAD_SKIPS_PER_RUN:
+                        continue
+                    break
+                if copies:
+                    await self._remember_sent(entry, post, copies, fingerprints, started)
+                    sent = True
+                route.last_repost_date = now
+                break
+            if sent or cursor > route.last_seen_message_id:
+                route.last_seen_message_id = max(route.last_seen_message_id, cursor)
+                stored = await self.db.update_route_progress(
+                    source_id, destination_id, route.last_repost_date, route.last_seen_message_id,
+                    self._fence(resource)
+                )
+                if not stored and self.leases:
+                    logger.error(f"Маршрут {source_id} → {destination_id}: аренда перехвачена другим процессом")
+                    return None
+            self.sources.advance(source_id, route.key, cursor)
+            return route
+        except ChannelPrivateError:
+            logger.error(f"Маршрут {source_id} → {destination_id}: канал приватный или недоступен")
+            await self._forget_entities(source_id, destination_id)
+            self.sources.invalidate(source_id)
+            stored = await self.db.get_route(source_id, destination_id)
+            if stored:
+                stored.is_active = False
+                await self.db.add_route(stored)
+            self.sources.forget(source_id, route.key)
+            return None
+        except FloodWaitError as e:
+            logger.warning(f"Flood wait на {e.seconds} секунд (сессия {self.session.name})")
+            self.pool.report_flood(self.session, e.seconds)
+            return route
+        except Deferred as e:
+            logger.error(f"Маршрут {source_id} → {destination_id}: отправка отменена, {str(e)}")
+            return None
+
+    async def _remember_sent(self, entry: OutboxEntry, post: PostUnit, copies: List[Message], fingerprints=None,
+                             started: Optional[float] = None):
+        """Учесть доставленный пост: журнал репостов, отпечатки, счётчик отправленных"""
+        source_id, destination_id = entry.source_id, entry.destination_id
+        fields = {'message_id': post.first_id}
+        if started is not None:
+            fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        await self.similar.add(destination_id, _fingerprints(post) if fingerprints is None else fingerprints)
+        if entry.kind == ROUTE:
+            await self.ledger.mark(source_id, destination_id, [post.key])
+            self._record_sent(f"{source_id}:{destination_id}")
+            logger.info(f"Отправлен пост из {source_id} в {destination_id}", extra=fields)
+            return
+        # Свои копии в этом же канале не должны репоститься повторно
+        await self.ledger.mark(source_id, source_id, [post.key, post_key(copies)])
+        # ...как и в получатели маршрутов этого канала: это повтор старого поста
+        for route_source, route_destination in list(self.route_scheduler.configs):
+            if route_source == source_id:
+                await self.ledger.mark(source_id, route_destination, [post_key(copies)])
+        self._record_sent(str(source_id))
+        logger.info(f"Отправлен пост из канала {source_id}", extra=fields)
+
+    async def _retry_outbox(self, entry: OutboxEntry) -> List[Message]:
+        """Повтор отправки из outbox: сообщения источника загружаются заново по id"""
+        bind(source_id=entry.source_id, destination_id=entry.destination_id)
+        if entry.kind == ROUTE:
+            resource = route_resource(entry.source_id, entry.destination_id)
+        else:
+            resource = channel_resource(entry.source_id)
+        if self.leases is not None and not self.leases.holds(resource):
+            raise Deferred(f"нет аренды {resource}")
+        current_lease.set(resource)
+        # Повторы идут по одному: сессия на паузе flood wait остановила бы всю очередь
+        if self._use_session(entry.destination_id, ready=True) is None:
+            raise Deferred("нет доступных сессий без паузы flood wait")
+        if await self.ledger.is_reposted(entry.source_id, entry.destination_id, entry.post_key):
+            # Пост успели доставить до перезапуска
+            return []
+        source = await self._get_entity(entry.source_id)
+        destination = source if entry.kind == CHANNEL else await self._get_entity(entry.destination_id)
+        settings = await self._copy_settings(entry.destination_id)
+        try:
+            messages = await self.session.client.get_messages(source, ids=list(entry.message_ids))
+        except FloodWaitError as e:
+            self.pool.report_flood(self.session, e.seconds)
+            raise
+        messages = [msg for msg in messages if msg]
+        if not messages:
+            raise LookupError("сообщения удалены из источника")
+        # Правила могли поменяться, пока пост ждал повтора
+        post = self._filter_post(entry.source_id, entry.destination_id, PostUnit.from_messages(messages))
+        if post is None:
+            return []
+        copies = await self._forward_messages(source, destination, post, settings)
+        await self._remember_sent(entry, post, copies)
+        return copies
+
+    @timed('repost_fetch', 'Загрузка страницы истории источника')
+    async def _fetch_source_page(self, source_id: int, min_id: int, limit: int) -> List[Message]:
+        """Страница истории источника после min_id, от старых к новым"""
+        channel = await self._get_entity(source_id)
+        return await self.session.client.get_messages(channel, limit=limit, min_id=min_id, reverse=True)
 
     async def _get_entity(self, channel_id: int):
         try:
-            return await self.client.get_entity(channel_id)
+            return await self.session.entities.get(channel_id)
         except Exception as e:
             logger.error(f"Ошибка получения entity {channel_id}: {str(e)}")
             raise
 
-    async def _fetch_messages(self, channel, offset_date: datetime, limit: int) -> List[Message]:
-        try:
-            offset_date = ensure_utc(offset_date)
-            return await self.client.get_messages(
-                channel,
-                limit=min(limit * 3, 100),
-                offset_date=offset_date
-            )
-        except Exception as e:
-            logger.error(f"Ошибка получения сообщений: {str(e)}")
+    def _iter_posts(self, channel, min_id: int, max_id: int = 0) -> AsyncIterator[PostUnit]:
+        """Лениво отдаёт посты канала после min_id (и до max_id включительно) от старых к новым.
+
+        Сообщения подгружаются постранично через iter_messages и сразу
+        сворачиваются в компактные посты, поэтому память не зависит от
+        размера отставания.
+        """
+        upper = max_id + 1 if max_id else 0
+        return group_stream(self.session.client.iter_messages(channel, min_id=min_id, max_id=upper, reverse=True))
+
+    async def _iter_live_posts(self, channel_id: int, min_id: int) -> AsyncIterator[PostUnit]:
+        """Посты из очереди живых обновлений новее min_id"""
+        group = self.live.pop(channel_id, min_id)
+        while group is not None:
+            yield group
+            group = self.live.pop(channel_id, min_id)
+
+    @timed('repost_forward', 'Отправка поста получателю')
+    async def _forward_messages(self, source_channel, target_channel, post: PostUnit,
+                                config: ChannelConfig) -> List[Message]:
+        """Отправить пост получателю; вернуть созданные копии.
+
+        Ошибку отправки не глушит: её класс определяет, повторит ли пост outbox.
+        """
+        if not post.has_content:
             return []
+        # Пересылка копирует оригинал, изменённый фильтром пост собирается заново
+        if config.forward_mode and not post.edited:
+            sent: List[Message] = []
+            copied = await self._copy_messages(source_channel, target_channel, [post],
+                                               config.drop_author, sent)
+            if copied is not None:
+                if not sent:
+                    raise LookupError("Telegram не вернул копий: сообщения удалены из источника")
+                return sent
+        send_as = await self._get_send_as_entity(target_channel)
+        if len(post.media) <= 1:
+            return await self._send_single_message(target_channel, post, send_as)
+        return await self._send_album(target_channel, post, send_as)
 
-    def _group_messages(self, messages: List[Message]) -> List[List[Message]]:
-        albums = []
-        single_messages = []
-        grouped = {}
-        for msg in reversed(messages):
-            if not msg:
+    @timed('repost_copy', 'Пакетная серверная пересылка')
+    async def _copy_messages(self, source_channel, target_channel, groups: List[PostUnit],
+                             drop_author: bool, sent: Optional[List[Message]] = None) -> Optional[int]:
+        """Скопировать посты пакетной серверной пересылкой.
+
+        Возвращает число скопированных постов или None, если источник
+        запрещает пересылку и нужно пересобирать сообщения вручную.
+        Созданные копии дописываются в sent, если он передан.
+        """
+        source_key = _peer_key(source_channel)
+        if source_key in self.restricted_sources:
+            return None
+        session = self.session
+        copied = 0
+        for batch in _forward_batches(groups):
+            ids = [message_id for post in batch for message_id in post.ids]
+            try:
+                result = await self._governed(
+                    session,
+                    _peer_key(target_channel),
+                    session.client.forward_messages,
+                    target_channel,
+                    ids,
+                    from_peer=source_channel,
+                    drop_author=drop_author
+                )
+            except ChatForwardsRestrictedError:
+                logger.warning(f"Канал {source_key} запрещает пересылку, используем повторную отправку")
+                self.restricted_sources.add(source_key)
+                return None if not copied else copied
+            if sent is not None:
+                sent.extend(msg for msg in result if msg)
+            copied += len(batch)
+        return copied
+
+    async def _copy_settings(self, channel_id: int) -> ChannelConfig:
+        """Настройки копирования для канала-получателя (по умолчанию — из ChannelConfig)"""
+        config = await self.db.get_channel(channel_id)
+        if config:
+            return config
+        return ChannelConfig(channel_id=channel_id, posts_per_day=1, start_date=self._now())
+
+    async def _resend_post(self, to_entity, post: PostUnit):
+        """Пересобрать пост вручную (для источников с запретом пересылки)"""
+        # Ошибка отправки останавливает задачу, она продолжится с контрольной точки
+        if len(post.media) <= 1:
+            sent = await self._send_single_message(to_entity, post, None)
+        else:
+            sent = await self._send_album(to_entity, post, None)
+        if not sent:
+            raise RuntimeError(f"не удалось отправить пост {post.key}")
+
+    async def _send_with_media(self, post: PostUnit, send):
+        """Отправить send(files) с медиа поста.
+
+        Медиа обычных источников передаётся ссылкой на исходный файл. Для
+        источников с запретом пересылки файл берётся из кеша медиа: по
+        ссылке на уже загруженную этой сессией копию или с диска (со
+        скачиванием при промахе), а после отправки ссылка на загруженную
+        копию запоминается. Если ссылка устарела, файл загружается заново.
+        """
+        use_uploads = True
+        while True:
+            files, uploaded, digests = await self._media_files(post, use_uploads)
+            try:
+                sent = await send(files)
+            except ChatForwardsRestrictedError:
+                if post.chat_id in self.restricted_sources or not any(map(_media_key, post.media)):
+                    raise
+                logger.warning(f"Источник {post.chat_id} запрещает пересылку медиа, отправляем через кеш медиа")
+                self.restricted_sources.add(post.chat_id)
                 continue
-            if getattr(msg, 'grouped_id', None):
-                grouped.setdefault(msg.grouped_id, []).append(msg)
-            else:
-                single_messages.append(msg)
-        for group in sorted(grouped.values(), key=lambda x: x[0].date):
-            albums.append(sorted(group, key=lambda m: m.id))
-        return albums + [[msg] for msg in single_messages]
+            except FileReferenceExpiredError:
+                if not uploaded:
+                    raise
+                for key in uploaded:
+                    await self.media.forget_upload(self.session.name, key)
+                use_uploads = False
+                continue
+            await self._remember_uploads(digests, sent)
+            return sent
 
-    async def _forward_messages(self, target_channel, messages: List[Message]) -> bool:
-        if not messages or not any(messages):
-            return False
-        try:
-            send_as = await self._get_send_as_entity(target_channel)
-            first_msg = messages[0]
-            if len(messages) == 1:
-                return await self._send_single_message(target_channel, first_msg, send_as)
-            return await self._send_album(target_channel, messages, send_as)
-        except Exception as e:
-            logger.error(f"Ошибка пересылки сообщений: {str(e)}")
-            return False
+    async def _media_files(self, post: PostUnit, use_uploads: bool = True):
+        """(файлы для отправки, ключи медиа, отправляемых по ссылке, {номер: хеш скачанного файла})"""
+        session = self.session
+        files, uploaded, digests = [], [], {}
+        restricted = post.chat_id in self.restricted_sources
+        for index, media in enumerate(post.media):
+            key = _media_key(media)
+            if key is None or not restricted:
+                files.append(media)
+                continue
+            upload = self.media.uploaded(session.name, key) if use_uploads else None
+            if upload is not None:
+                files.append(_upload_to_input(upload))
+                uploaded.append(key)
+                continue
+            digest, path = await self.media.fetch(
+                key, _media_size(media),
+                lambda offset, length, media=media: self._read_media(media, offset, length),
+                suffix=_media_suffix(media)
+            )
+            files.append(path)
+            digests[index] = digest
+        return files, uploaded, digests
+
+    async def _remember_uploads(self, digests: Dict[int, str], sent):
+        if not digests:
+            return
+        sent = sent if isinstance(sent, list) else [sent]
+        for index, digest in digests.items():
+            upload = _upload_from_message(sent[index]) if index < len(sent) else None
+            if upload is not None:
+                await self.media.remember_upload(self.session.name, digest, upload)
+
+    async def _read_media(self, media, offset: int, length: int) -> bytes:
+        """Скачать length байт медиа начиная с offset (0 — до конца файла)"""
+        request_size = min(MEDIA_PART_SIZE, 512 * 1024)
+        limit = -(-length // request_size) if length else None
+        chunks = []
+        async for chunk in self.session.client.iter_download(
+                media, offset=offset, request_size=request_size, limit=limit, file_size=_media_size(media) or None):
+            chunks.append(chunk)
+        data = b''.join(chunks)
+        return data[:length] if length else data
 
     async def _get_send_as_entity(self, channel):
         try:
-            return await self.client.get_entity(channel)
+            return await self.session.entities.get(_peer_key(channel))
         except Exception as e:
             logger.warning(f"Не удалось получить send_as entity: {str(e)}")
             return None
 
-    async def _send_single_message(self, target_channel, message: Message, send_as) -> bool:
-        has_content = bool(message.text or message.media)
-        if not has_content:
+    @timed('repost_send_single', 'Повторная отправка одиночного сообщения')
+    async def _send_single_message(self, target_channel, post: PostUnit, send_as) -> List[Message]:
+        if not post.has_content:
             logger.warning("Пропущено пустое сообщение")
-            return False
-        try:
-            await self.client.send_message(
-                entity=target_channel,
-                message=message.text or "",
-                file=message.media,
-                link_preview=bool(getattr(message, 'web_preview', False)),
-                buttons=getattr(message, 'buttons', None),
-                send_as=send_as
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка отправки одиночного сообщения: {str(e)}")
-            return False
+            return []
+        session = self.session
+        sent = await self._send_with_media(post, lambda files: self._governed(
+            session,
+            _peer_key(target_channel),
+            session.client.send_message,
+            entity=target_channel,
+            message=post.caption,
+            formatting_entities=post.entities,
+            file=files[0] if files else None,
+            attributes=getattr(_media_file(post.media[0]), 'attributes', None) if post.media else None,
+            link_preview=post.link_preview,
+            buttons=post.buttons,
+            send_as=send_as
+        ))
+        return [sent]
 
-    async def _send_album(self, target_channel, messages: List[Message], send_as) -> bool:
-        media = []
-        captions = []
-        for msg in messages:
-            if msg and msg.media:
-                media.append(msg.media)
-                captions.append(msg.text or "")
-        if not media:
+    @timed('repost_send_album', 'Повторная отправка альбома')
+    async def _send_album(self, target_channel, post: PostUnit, send_as) -> List[Message]:
+        if not post.media:
             logger.warning("В альбоме нет медиа")
-            return False
-        try:
-            await self.client.send_file(
-                entity=target_channel,
-                file=media,
-                caption=captions[0] if captions else "",
-                send_as=send_as
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка отправки альбома: {str(e)}")
-            return False
+            return []
+        session = self.session
+        sent = await self._send_with_media(post, lambda files: self._governed(
+            session,
+            _peer_key(target_channel),
+            session.client.send_file,
+            entity=target_channel,
+            file=files,
+            caption=post.caption,
+            formatting_entities=post.entities,
+            send_as=send_as
+        ))
+        return list(sent) if isinstance(sent, list) else [sent]
 
     def _register_handlers(self):
         @self.client.on(events.NewMessage(pattern='/start'))
@@ -211,8 +1109,22 @@ class ChannelReposter:
                 "/start_channel <ID> - Запустить постинг\n"
                 "/stop_channel <ID> - Остановить постинг\n"
                 "/channel_info <ID> - Показать настройки канала\n"
+                "/set_forward <ID> <on|off> [скрыть_автора on|off] - Режим серверной пересылки\n"
+                "/set_live <ID> <on|off> - Брать новые посты из живых обновлений\n"
+                "/add_route <откуда> <куда> [постов/день] [интервал_сек] - Копировать посты в другой канал\n"
+                "/routes [откуда] - Маршруты\n"
+                "/remove_route <откуда> <куда> - Удалить маршрут\n"
                 "/repost_history <откуда> <куда> [лимит] - Быстрый репост\n"
-                "/repost_history_slow <откуда> <куда> <дата> <интервал> [лимит] - Медленный репост"
+                "/repost_history_slow <откуда> <куда> <дата> <интервал> [лимит] - Медленный репост\n"
+                "/jobs - Задачи репоста истории\n"
+                "/stats - Метрики производительности\n"
+                "/profile <on|off> - Профилирование на ходу\n"
+                "/pause_job, /resume_job, /cancel_job <номер> - Управление задачей\n"
+                "/outbox - Посты, ожидающие повтора, и недоставленные\n"
+                "/replay_dead, /drop_dead <номер|all> - Отправить заново / удалить недоставленные\n"
+                "/add_filter <откуда|*> <куда> <тип> [значение] - Правило фильтра постов получателя\n"
+                "/filters <куда> - Правила фильтров\n"
+                "/remove_filter <номер|all> [куда] - Удалить правило (all — все правила получателя)"
             )
             await event.reply(help_text)
 
@@ -230,12 +1142,12 @@ class ChannelReposter:
                     channel_id=channel_id,
                     posts_per_day=params['limit'],
                     start_date=ensure_utc(params['date']),
-                    last_repost_date=datetime.now(timezone.utc),
+                    last_repost_date=self._now(),
                     is_active=True,
                     interval_seconds=params['interval']
                 )
-                self.db.add_channel(config)
-                self._start_channel_task(config)
+                await self.db.add_channel(config)
+                self._activate_channel(config)
                 response = (
                     f"✅ Канал добавлен:\n"
                     f"ID: {channel_id}\n"
@@ -255,11 +1167,14 @@ class ChannelReposter:
                     return await event.reply("❌ Формат: /set_limit <ID> <постов_в_день>")
                 channel_id = int(args[1])
                 posts_per_day = int(args[2])
-                config = self.db.get_channel(channel_id)
+                config = await self.db.get_channel(channel_id)
                 if not config:
                     return await event.reply("❌ Канал не найден")
                 config.posts_per_day = posts_per_day
-                self.db.add_channel(config)
+                await self.db.add_channel(config)
+                if config.is_active:
+                    self._activate_channel(config)
+                await self._reschedule_routes(channel_id)
                 await event.reply(f"✅ Для канала {channel_id} установлен лимит {posts_per_day} постов/день")
             except Exception as e:
                 await event.reply(f"❌ Ошибка: {str(e)}")
@@ -271,7 +1186,7 @@ class ChannelReposter:
                 if len(args) < 2:
                     return await event.reply("❌ Формат: /channel_info <ID>")
                 channel_id = int(args[1])
-                config = self.db.get_channel(channel_id)
+                config = await self.db.get_channel(channel_id)
                 if not config:
                     return await event.reply("❌ Канал не найден")
                 info = (
@@ -281,12 +1196,133 @@ class ChannelReposter:
                     f"Дата старта: {config.start_date.strftime('%Y-%m-%d')}\n"
                     f"Постов/день: {config.posts_per_day}\n"
                     f"Интервал: {config.interval_seconds or 'авто'} сек\n"
+                    f"Пересылка: {'Да' if config.forward_mode else 'Нет'}"
+                    f"{' (без автора)' if config.drop_author else ''}\n"
+                    f"Live режим: {'Да' if config.live_mode else 'Нет'}\n"
+                    f"Кеш сущностей: {self.entities.stats()}\n"
                     f"Последний репост: {config.last_repost_date.strftime('%Y-%m-%d %H:%M:%S')}"
                 )
                 await event.reply(info)
             except Exception as e:
                 await event.reply(f"❌ Ошибка: {str(e)}")
 
+        @self.client.on(events.NewMessage(pattern='/set_forward'))
+        async def set_forward_handler(event):
+            try:
+                args = event.text.split()
+                if len(args) < 3 or args[2] not in ('on', 'off'):
+                    return await event.reply("❌ Формат: /set_forward <ID> <on|off> [скрыть_автора on|off]")
+                channel_id = int(args[1])
+                config = await self.db.get_channel(channel_id)
+                if not config:
+                    return await event.reply("❌ Канал не найден")
+                config.forward_mode = args[2] == 'on'
+                if len(args) > 3:
+                    config.drop_author = args[3] != 'off'
+                await self.db.add_channel(config)
+                if config.is_active:
+                    self._activate_channel(config)
+                await event.reply(
+                    f"✅ Пересылка для канала {channel_id}: {'вкл' if config.forward_mode else 'выкл'}, "
+                    f"автор {'скрыт' if config.drop_author else 'виден'}"
+                )
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/set_live'))
+        async def set_live_handler(event):
+            try:
+                args = event.text.split()
+                if len(args) < 3 or args[2] not in ('on', 'off'):
+                    return await event.reply("❌ Формат: /set_live <ID> <on|off>")
+                channel_id = int(args[1])
+                config = await self.db.get_channel(channel_id)
+                if not config:
+                    return await event.reply("❌ Канал не найден")
+                config.live_mode = args[2] == 'on'
+                await self.db.add_channel(config)
+                if config.is_active:
+                    self._activate_channel(config)
+                await event.reply(f"✅ Live режим для канала {channel_id}: {'вкл' if config.live_mode else 'выкл'}")
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/add_route'))
+        async def add_route_handler(event):
+            try:
+                args = event.text.split()
+                if len(args) < 3:
+                    return await event.reply("❌ Формат: /add_route <откуда> <куда> [постов/день] [интервал_сек]")
+                source_id = int(args[1])
+                destination_id = int(args[2])
+                if source_id == destination_id:
+                    return await event.reply("❌ Источник и получатель совпадают")
+                for channel_id in (source_id, destination_id):
+                    if not await self._validate_channel(channel_id):
+                        return await event.reply(f"❌ Канал {channel_id} не найден или нет доступа")
+                now = self._now().replace(microsecond=0)
+                route = await self.db.get_route(source_id, destination_id) or RouteConfig(
+                    source_id, destination_id, start_date=now, last_repost_date=now
+                )
+                route.posts_per_day = max(1, int(args[3])) if len(args) > 3 else None
+                route.interval_seconds = max(1, int(args[4])) if len(args) > 4 else None
+                route.is_active = True
+                await self.db.add_route(route)
+                await self._activate_route(route)
+                schedule = (
+                    f"{route.posts_per_day} постов/день, интервал {route.interval_seconds or 'авто'} сек"
+                    if route.has_schedule else "по расписанию источника"
+                )
+                await event.reply(f"✅ Маршрут {source_id} → {destination_id} добавлен ({schedule})")
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/routes'))
+        async def routes_handler(event):
+            try:
+                args = event.text.split()
+                routes = await self.db.get_routes(int(args[1]) if len(args) > 1 else None)
+                if not routes:
+                    return await event.reply("ℹ️ Маршрутов нет")
+                lines = ["🔀 Маршруты:"]
+                for route in routes:
+                    schedule = (
+                        f"{route.posts_per_day or '-'} постов/день, интервал {route.interval_seconds or 'авто'} сек"
+                        if route.has_schedule else "расписание источника"
+                    )
+                    lines.append(
+                        f"{route.source_id} → {route.destination_id}: "
+                        f"{'активен' if route.is_active else 'остановлен'}, {schedule}, "
+                        f"курсор {route.last_seen_message_id}"
+                    )
+                lines.append(f"Постов в общем буфере: {len(self.sources)}, загрузок истории: {self.sources.fetches}")
+                await event.reply("\n".join(lines))
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/remove_route'))
+        async def remove_route_handler(event):
+            try:
+                args = event.text.split()
+                if len(args) < 3:
+                    return await event.reply("❌ Формат: /remove_route <откуда> <куда>")
+                route = await self.db.get_route(int(args[1]), int(args[2]))
+                if not route:
+                    return await event.reply("❌ Маршрут не найден")
+                self._deactivate_route(route.key)
+                await self.db.delete_route(route.source_id, route.destination_id)
+                await event.reply(f"🗑 Маршрут {route.source_id} → {route.destination_id} удалён")
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(func=lambda e: e.chat_id in self.live and not e.message.grouped_id))
+        async def live_message_handler(event):
+            self._on_live_post(event.chat_id, [event.message])
+
+        @self.client.on(events.Album(func=lambda e: e.chat_id in self.live))
+        async def live_album_handler(event):
+            self._on_live_post(event.chat_id, sorted(event.messages, key=lambda m: m.id))
+
         @self.client.on(events.NewMessage(pattern='/repost_history '))
         async def repost_history_handler(event):
             try:
@@ -296,7 +1332,11 @@ class ChannelReposter:
                 from_channel = int(args[1])
                 to_channel = int(args[2])
                 limit = int(args[3]) if len(args) > 3 else 10
-                await self._fast_repost(from_channel, to_channel, limit, event)
+                job = await self.jobs.submit(RepostJob(
+                    kind='fast', from_channel=from_channel, to_channel=to_channel,
+                    limit=limit, chat_id=event.chat_id
+                ))
+                await event.reply(f"🆕 Задача #{job.job_id} поставлена в очередь (/jobs — прогресс)")
             except Exception as e:
                 await event.reply(f"❌ Ошибка: {str(e)}")
 
@@ -311,7 +1351,168 @@ class ChannelReposter:
                 date = ensure_utc(datetime.strptime(args[3], "%Y-%m-%d"))
                 interval = int(args[4])
                 limit = int(args[5]) if len(args) > 5 else 10
-                await self._slow_repost(from_channel, to_channel, date, interval, limit, event)
+                job = await self.jobs.submit(RepostJob(
+                    kind='slow', from_channel=from_channel, to_channel=to_channel,
+                    limit=limit, interval=interval, offset_date=date.timestamp(),
+                    chat_id=event.chat_id
+                ))
+                await event.reply(f"🆕 Задача #{job.job_id} поставлена в очередь (/jobs — прогресс)")
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/jobs'))
+        async def jobs_handler(event):
+            try:
+                jobs = await self.jobs.active_jobs()
+                if not jobs:
+                    return await event.reply("ℹ️ Активных задач нет")
+                lines = ["📋 Задачи репоста:"]
+                for job in jobs:
+                    total = job.total if job.total is not None else job.limit
+                    eta = job.eta_seconds()
+                    lines.append(
+                        f"#{job.job_id} {job.kind} {job.from_channel} → {job.to_channel}: {job.status}, "
+                        f"{job.sent_count}/{total}, {job.throughput():.1f} сообщ/мин, "
+                        f"ETA {str(timedelta(seconds=int(eta))) if eta is not None else '?'}"
+                    )
+                await event.reply("\n".join(lines))
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern=r'/(pause|resume|cancel)_job'))
+        async def job_control_handler(event):
+            try:
+                args = event.text.split()
+                action = args[0].lstrip('/').split('_')[0]
+                if len(args) < 2:
+                    return await event.reply(f"❌ Формат: /{action}_job <номер>")
+                job_id = int(args[1].lstrip('#'))
+                handler = {'pause': self.jobs.pause, 'resume': self.jobs.resume, 'cancel': self.jobs.cancel}[action]
+                if not await handler(job_id):
+                    return await event.reply(f"❌ Задача #{job_id} не найдена или уже в этом состоянии")
+                done = {'pause': '⏸ приостановлена', 'resume': '▶️ продолжена', 'cancel': '🛑 отменена'}[action]
+                await event.reply(f"Задача #{job_id} {done}")
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/outbox'))
+        async def outbox_handler(event):
+            try:
+                lines = [f"📮 Outbox: к повтору {len(self.outbox)}, недоставленных {self.outbox.dead}"]
+                now = self.clock()
+                for entry in sorted(self.outbox.entries.values(), key=lambda entry: entry.next_attempt)[:10]:
+                    lines.append(
+                        f"⏳ {entry.describe()}: попыток {entry.attempts}, повтор через "
+                        f"{max(0, entry.next_attempt - now):.0f} с — {(entry.error or '')[:200]}"
+                    )
+                dead = await self.outbox.dead_letters()
+                for entry in dead[-10:]:
+                    lines.append(f"☠️ {entry.describe()}: попыток {entry.attempts} — {(entry.error or '')[:200]}")
+                if dead:
+                    lines.append("/replay_dead <номер|all> — отправить заново, /drop_dead <номер|all> — удалить")
+                await event.reply("\n".join(lines))
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern=r'/(replay|drop)_dead'))
+        async def dead_letter_handler(event):
+            try:
+                args = event.text.split()
+                action = args[0].lstrip('/').split('_')[0]
+                if len(args) < 2:
+                    return await event.reply(f"❌ Формат: /{action}_dead <номер|all>")
+                entry_id = None if args[1] == 'all' else int(args[1].lstrip('#'))
+                handler = self.outbox.replay if action == 'replay' else self.outbox.discard
+                count = await handler(entry_id)
+                if not count:
+                    return await event.reply("❌ Недоставленные посты не найдены")
+                done = '🔁 возвращено в очередь повторов' if action == 'replay' else '🗑 удалено'
+                await event.reply(f"Недоставленных постов {done}: {count}")
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/add_filter'))
+        async def add_filter_handler(event):
+            try:
+                args = event.text.split(maxsplit=4)
+                if len(args) < 4:
+                    return await event.reply(
+                        "❌ Формат: /add_filter <откуда|*> <куда> <тип> [значение]\n"
+                        f"Типы: {', '.join(RULE_KINDS)}; для {REPLACE} значение — <регулярка> => <замена>"
+                    )
+                value = args[4] if len(args) > 4 else ''
+                replacement = ''
+                if args[3] == REPLACE:
+                    value, _, replacement = value.partition('=>')
+                    value, replacement = value.strip(), replacement.strip()
+                rule = await self.filters.add(FilterRule(
+                    source_id=None if args[1] == '*' else int(args[1]),
+                    destination_id=int(args[2]),
+                    kind=args[3],
+                    pattern=value.strip(),
+                    replacement=replacement
+                ))
+                await event.reply(f"✅ Правило добавлено: {rule.describe()}")
+            except ValueError as e:
+                await event.reply(f"❌ {str(e)}")
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/filters'))
+        async def filters_handler(event):
+            try:
+                args = event.text.split()
+                if len(args) < 2:
+                    return await event.reply("❌ Формат: /filters <куда>")
+                rules = self.filters.rules_for(int(args[1]))
+                if not rules:
+                    return await event.reply("ℹ️ Правил нет")
+                lines = [f"🧹 Правила фильтров ({len(rules)}):"]
+                lines.extend(rule.describe()[:200] for rule in rules[:50])
+                if len(rules) > 50:
+                    lines.append(f"...и ещё {len(rules) - 50}")
+                await event.reply("\n".join(lines))
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/remove_filter'))
+        async def remove_filter_handler(event):
+            try:
+                args = event.text.split()
+                if len(args) < 2 or (args[1] == 'all' and len(args) < 3):
+                    return await event.reply("❌ Формат: /remove_filter <номер> или /remove_filter all <куда>")
+                if args[1] == 'all':
+                    removed = await self.filters.remove(destination_id=int(args[2]))
+                else:
+                    removed = await self.filters.remove(int(args[1].lstrip('#')))
+                if not removed:
+                    return await event.reply("❌ Правило не найдено")
+                await event.reply(f"🗑 Удалено правил: {removed}")
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/stats'))
+        async def stats_handler(event):
+            try:
+                await event.reply(self._stats_text())
+            except Exception as e:
+                await event.reply(f"❌ Ошибка: {str(e)}")
+
+        @self.client.on(events.NewMessage(pattern='/profile'))
+        async def profile_handler(event):
+            try:
+                args = event.text.split()
+                if len(args) < 2 or args[1] not in ('on', 'off'):
+                    return await event.reply("❌ Формат: /profile <on|off>")
+                if args[1] == 'on':
+                    if not self.profiler.start():
+                        return await event.reply("ℹ️ Профилирование уже включено")
+                    return await event.reply("🔬 Профилирование включено, /profile off — отчёт")
+                report = self.profiler.stop()
+                if report is None:
+                    return await event.reply("ℹ️ Профилирование не было включено")
+                # Сообщение Telegram ограничено 4096 символами
+                await event.reply(f"🔬 Профиль:\n{report[:3900]}")
             except Exception as e:
                 await event.reply(f"❌ Ошибка: {str(e)}")
 
@@ -319,12 +1520,12 @@ class ChannelReposter:
         async def start_channel_handler(event):
             try:
                 channel_id = int(event.text.split()[1])
-                config = self.db.get_channel(channel_id)
+                config = await self.db.get_channel(channel_id)
                 if not config:
                     return await event.reply("❌ Канал не найден")
                 config.is_active = True
-                self.db.add_channel(config)
-                self._start_channel_task(config)
+                await self.db.add_channel(config)
+                self._activate_channel(config)
                 await event.reply(f"✅ Канал {channel_id} запущен")
             except Exception as e:
                 await event.reply(f"❌ Ошибка: {str(e)}")
@@ -333,21 +1534,90 @@ class ChannelReposter:
         async def stop_channel_handler(event):
             try:
                 channel_id = int(event.text.split()[1])
-                config = self.db.get_channel(channel_id)
+                config = await self.db.get_channel(channel_id)
                 if not config:
                     return await event.reply("❌ Канал не найден")
                 config.is_active = False
-                self.db.add_channel(config)
-                if channel_id in self.active_tasks:
-                    self.active_tasks[channel_id].cancel()
-                    del self.active_tasks[channel_id]
+                await self.db.add_channel(config)
+                self._deactivate_channel(channel_id)
                 await event.reply(f"⏸ Канал {channel_id} остановлен")
             except Exception as e:
                 await event.reply(f"❌ Ошибка: {str(e)}")
 
+    def _stats_text(self) -> str:
+        """Сводка метрик для команды /stats"""
+        uptime = int(datetime.now(timezone.utc).timestamp() - self.metrics.started_at)
+        lines = [f"📊 Статистика за {timedelta(seconds=uptime)}:"]
+        for name, title in (
+            ('repost_fetch', 'Загрузка истории'),
+            ('repost_forward', 'Отправка поста'),
+            ('repost_copy', 'Пересылка пачки'),
+            ('repost_send_single', 'Отправка сообщения'),
+            ('repost_send_album', 'Отправка альбома'),
+        ):
+            histogram = self.metrics.histogram(f'{name}_seconds')
+            count = histogram.count()
+            if count:
+                lines.append(
+                    f"{title}: {count} вызовов, p50 {histogram.quantile(0.5):.2f} с, "
+                    f"p95 {histogram.quantile(0.95):.2f} с"
+                )
+        db = self.metrics.histogram('db_call_seconds')
+        slowest = sorted(
+            ((db.quantile(0.95, **dict(labels)), dict(labels)['method']) for labels in db.series),
+            reverse=True
+        )[:3]
+        if slowest:
+            lines.append("База, p95: " + ", ".join(f"{method} {p95 * 1000:.1f} мс" for p95, method in slowest))
+        lag = self.metrics.histogram('event_loop_lag_seconds')
+        if lag.count():
+            lines.append(f"Задержка event loop: p50 {lag.quantile(0.5) * 1000:.0f} мс, "
+                         f"p99 {lag.quantile(0.99) * 1000:.0f} мс")
+        if self.media.downloads or self.media.upload_hits or self.media.disk_hits:
+            lines.append(f"Кеш медиа: {self.media.stats()}")
+        assignments = self._session_assignments()
+        for session in self.pool:
+            governor = session.governor
+            state = 'доступна' if self.pool.is_available(session) else (
+                'отключена' if not session.connected else 'flood wait')
+            lines.append(
+                f"Сессия {session.name} ({state}): каналов {assignments.get(session.name, 0)}, "
+                f"flood wait {governor.flood_waits} раз / {governor.flood_seconds:.0f} с, "
+                f"лимит {governor.account.rate:.2f} отправок/с"
+            )
+        backlog = self._backlog()
+        sent = self.sent_recently.counts()
+        for label, target in sorted(self._daily_targets().items()):
+            lines.append(
+                f"{label}: {sent.get(label, 0)}/{target:.0f} за сутки, в очереди {backlog.get(label, 0)}"
+            )
+        if self.outbox.entries or self.outbox.dead or self.outbox.retries:
+            lines.append(
+                f"Outbox: к повтору {len(self.outbox)}, повторов {self.outbox.retries}, "
+                f"доставлено повтором {self.outbox.delivered}, недоставленных {self.outbox.dead}"
+            )
+        if self.filters.blocked or self.filters.rewritten:
+            lines.append(
+                f"Фильтры: правил {len(self.filters)}, отброшено {self.filters.blocked}, "
+                f"изменено {self.filters.rewritten}, компиляция {self.filters.compile_seconds * 1000:.0f} мс"
+            )
+        if self.warmup.ready_seconds is None:
+            lines.append(f"Идёт запуск каналов: в очереди {len(self.warmup)}")
+        else:
+            lines.append(f"Каналы запущены за {self.warmup.ready_seconds:.1f} с")
+        if self.leases is not None:
+            lines.append(
+                f"Процесс {self.leases.owner}: аренд {len(self.leases.held)}, "
+                f"процессов {self.leases.processes}"
+            )
+        if self.profiler.active:
+            lines.append("🔬 Идёт профилирование")
+        return "\n".join(lines)
+
     def _parse_channel_params(self, args: List[str]) -> Dict:
         params = {
-            'date': datetime.now(timezone.utc),
+            # База хранит даты с точностью до секунды
+            'date': self._now().replace(microsecond=0),
             'limit': 5,
             'interval': None
         }
@@ -374,59 +1644,144 @@ class ChannelReposter:
 
     async def _validate_channel(self, channel_id: int) -> bool:
         try:
-            entity = await self.client.get_entity(channel_id)
-            return hasattr(entity, 'title')
+            entity = await self.entities.get(channel_id)
+            # Из сохранённого кеша приходит InputPeerChannel без title
+            return hasattr(entity, 'title') or isinstance(entity, InputPeerChannel)
+        except ChannelPrivateError:
+            await self.entities.invalidate(channel_id)
+            return False
         except Exception as e:
             logger.error(f"Ошибка валидации: {str(e)}")
             return False
 
-    async def _fast_repost(self, from_channel: int, to_channel: int, limit: int, event):
+    async def _forget_entities(self, *channel_ids: int):
+        for channel_id in channel_ids:
+            await self.session.entities.invalidate(channel_id)
+
+    async def _run_job(self, job: RepostJob):
+        """Выполнить задачу репоста истории (вызывается JobManager)"""
+        bind(job_id=job.job_id, source_id=job.from_channel, destination_id=job.to_channel)
+        self._use_session(job.to_channel, required=False)
         try:
-            from_entity = await self._get_entity(from_channel)
-            to_entity = await self._get_entity(to_channel)
-            messages = await self.client.get_messages(from_entity, limit=limit)
-            count = 0
-            for msg in reversed(messages):
-                if not msg or (not msg.text and not msg.media):
-                    continue
-                await self.client.send_message(
-                    entity=to_entity,
-                    message=msg.text or "",
-                    file=msg.media,
-                    link_preview=bool(getattr(msg, 'web_preview', False)),
-                    buttons=getattr(msg, 'buttons', None)
-                )
-                count += 1
-                await asyncio.sleep(1)
-            await event.reply(f"✅ Быстро переслано {count} сообщений из {from_channel} в {to_channel}")
+            if job.kind == 'slow':
+                await self._slow_repost(job)
+            else:
+                await self._fast_repost(job)
+        except ChannelPrivateError:
+            await self._forget_entities(job.from_channel, job.to_channel)
+            await self._notify_job(job, f"❌ Задача #{job.job_id}: канал приватный или недоступен")
+            raise
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            await event.reply(f"❌ Ошибка при быстром репосте: {str(e)}")
+            await self._notify_job(job, f"❌ Задача #{job.job_id}: ошибка при репосте: {str(e)}")
+            raise
 
-    async def _slow_repost(self, from_channel: int, to_channel: int, date: datetime, interval: int, limit: int, event):
+    async def _notify_job(self, job: RepostJob, text: str):
+        if job.chat_id is None:
+            return
         try:
-            from_entity = await self._get_entity(from_channel)
-            to_entity = await self._get_entity(to_channel)
-            messages = await self.client.get_messages(from_entity, limit=limit, offset_date=date)
-            count = 0
-            for msg in reversed(messages):
-                if not msg or (not msg.text and not msg.media):
-                    continue
-                await self.client.send_message(
-                    entity=to_entity,
-                    message=msg.text or "",
-                    file=msg.media,
-                    link_preview=bool(getattr(msg, 'web_preview', False)),
-                    buttons=getattr(msg, 'buttons', None)
-                )
-                count += 1
-                await asyncio.sleep(interval)
-            await event.reply(f"✅ Медленно переслано {count} сообщений из {from_channel} в {to_channel} с интервалом {interval} сек")
+            await self.client.send_message(job.chat_id, text)
         except Exception as e:
-            await event.reply(f"❌ Ошибка при медленном репосте: {str(e)}")
+            logger.warning(f"Не удалось отправить отчёт по задаче #{job.job_id}: {str(e)}")
+
+    async def _prepare_job_window(self, job: RepostJob, from_entity):
+        """При первом запуске зафиксировать окно сообщений задачи"""
+        if job.max_id is not None:
+            return
+        offset_date = None
+        if job.offset_date is not None:
+            offset_date = datetime.fromtimestamp(job.offset_date, tz=timezone.utc)
+        # Границы окна — два запроса по одному сообщению вместо загрузки всех limit
+        client = self.session.client
+        newest = await client.get_messages(from_entity, limit=1, offset_date=offset_date)
+        if not newest:
+            job.min_id = job.max_id = job.total = 0
+            return await self.jobs.checkpoint(job, 0, 0)
+        oldest = await client.get_messages(
+            from_entity, limit=1, offset_date=offset_date, add_offset=job.limit - 1
+        )
+        job.max_id = newest[0].id
+        job.min_id = oldest[0].id - 1 if oldest else 0
+        job.total = min(job.limit, job.max_id - job.min_id)
+        await self.jobs.checkpoint(job, job.min_id, 0)
+
+    async def _job_posts(self, job: RepostJob, from_entity) -> AsyncIterator[PostUnit]:
+        """Посты задачи после контрольной точки"""
+        if not job.max_id:
+            return
+        async for group in self._iter_posts(from_entity, job.checkpoint, job.max_id):
+            yield group
+
+    async def _deliver_job_groups(self, job: RepostJob, from_entity, to_entity,
+                                  groups: List[PostUnit], settings: ChannelConfig) -> int:
+        """Отправить пачку постов задачи и сохранить контрольную точку"""
+        end_id = max(post.last_id for post in groups)
+        groups = [post for post in groups if post.has_content]
+        groups = await self.ledger.filter_new(job.from_channel, job.to_channel, groups)
+        count = 0
+        if groups and settings.forward_mode:
+            copied = await self._copy_messages(from_entity, to_entity, groups, settings.drop_author)
+            if copied is not None:
+                await self.ledger.mark(job.from_channel, job.to_channel, [post.key for post in groups[:copied]])
+                count = sum(len(post) for post in groups[:copied])
+                groups = groups[copied:]
+        for post in groups:
+            await self._resend_post(to_entity, post)
+            count += len(post)
+            await self.ledger.mark(job.from_channel, job.to_channel, [post.key])
+        await self.jobs.checkpoint(job, end_id, count)
+        return count
+
+    async def _fast_repost(self, job: RepostJob):
+        from_entity = await self._get_entity(job.from_channel)
+        to_entity = await self._get_entity(job.to_channel)
+        settings = await self._copy_settings(job.to_channel)
+        await self._prepare_job_window(job, from_entity)
+
+        async def deliver(batch: List[PostUnit]):
+            await self._deliver_job_groups(job, from_entity, to_entity, batch, settings)
+
+        # Загрузка следующих пачек идёт параллельно с отправкой текущей;
+        # темп отправки задаёт регулятор скорости, а не фиксированная пауза
+        await run_pipeline(
+            batch_posts(self._job_posts(job, from_entity), FORWARD_BATCH_SIZE),
+            deliver,
+            depth=PIPELINE_DEPTH
+        )
+        await self._notify_job(
+            job, f"✅ Задача #{job.job_id}: быстро переслано {job.sent_count} сообщений "
+                 f"из {job.from_channel} в {job.to_channel}"
+        )
+
+    async def _slow_repost(self, job: RepostJob):
+        from_entity = await self._get_entity(job.from_channel)
+        to_entity = await self._get_entity(job.to_channel)
+        settings = await self._copy_settings(job.to_channel)
+        await self._prepare_job_window(job, from_entity)
+        async for group in self._job_posts(job, from_entity):
+            if await self._deliver_job_groups(job, from_entity, to_entity, [group], settings):
+                await asyncio.sleep(job.interval)
+        await self._notify_job(
+            job, f"✅ Задача #{job.job_id}: медленно переслано {job.sent_count} сообщений "
+                 f"из {job.from_channel} в {job.to_channel} с интервалом {job.interval} сек"
+        )
 
 async def main():
     reposter = ChannelReposter()
     await reposter.start()
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    logs = LogPipeline(
+        LOG_FILE,
+        max_bytes=LOG_MAX_BYTES,
+        backups=LOG_BACKUPS,
+        when=LOG_ROTATE_WHEN,
+        json_format=LOG_JSON,
+        sample_limit=LOG_SAMPLE_LIMIT,
+        sample_window=LOG_SAMPLE_WINDOW
+    ).start()
+    try:
+        asyncio.run(main())
+    finally:
+        logs.stop()
\ No newline at end of file
@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Сохранённая загрузка: (тип 'photo'|'document', id, access_hash, file_reference)
+Upload = Tuple[str, int, int, bytes]
+ReadRange = Callable[[int, int], Awaitable[bytes]]
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_at(f, lock: threading.Lock, offset: int, data: bytes):
+    """Записать часть файла по смещению (в потоке пула: части пишутся параллельно)"""
+    with lock:
+        f.seek(offset)
+        f.write(data)
+
+
+class DiskLRU:
+    """Ограниченное по размеру хранилище файлов на диске, адресуемое хешем содержимого.
+
+    Файл называется sha256 содержимого (плюс расширение, чтобы при
+    отправке угадывался тип), одинаковые файлы хранятся один раз. При
+    превышении max_bytes удаляются давно не использованные файлы.
+
+    Обход каталога (scan) и put работают с диском и вызываются в потоке
+    пула, поэтому индекс защищён блокировкой; сами файловые операции
+    идут вне её.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.files: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()  # хеш -> (путь, размер)
+        self.size = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._created = False
+
+    def _ensure_directory(self):
+        # Каталог создаётся при первом обращении к диску, а не при создании объекта
+        if not self._created:
+            os.makedirs(self.directory, exist_ok=True)
+            self._created = True
+
+    def scan(self):
+        """Подхватить файлы, оставшиеся в каталоге с прошлого запуска"""
+        self._ensure_directory()
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.part'):
+                # Недокачанный файл прошлого запуска
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name.split('.', 1)[0], path, stat.st_size))
+        with self._lock:
+            for _, digest, path, size in sorted(entries):
+                if digest not in self.files:
+                    self.files[digest] = (path, size)
+                    self.size += size
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            entry = self.files.get(digest)
+            if entry is None:
+                return None
+            self.files.move_to_end(digest)
+        try:
+            os.utime(entry[0])
+        except OSError:
+            # Файл удалили снаружи или вытеснили между поиском и обращением
+            with self._lock:
+                if self.files.get(digest) == entry:
+                    self._drop(digest)
+            return None
+        return entry[0]
+
+    def temp_path(self) -> str:
+        self._ensure_directory()
+        return os.path.join(self.directory, f'{uuid.uuid4().hex}.part')
+
+    def put(self, temp_path: str, digest: str, suffix: str = '') -> str:
+        """Переместить скачанный файл в хранилище под именем его хеша"""
+        existing = self.get(digest)
+        if existing is not None:
+            os.remove(temp_path)
+            return existing
+        path = os.path.join(self.directory, digest + suffix)
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if digest in self.files:
+                # Тот же файл параллельно положили под другим ключом медиа
+                self._drop(digest)
+            self.files[digest] = (path, size)
+            self.size += size
+            victims = self._evict(keep=digest)
+        for victim in victims:
+            try:
+                os.remove(victim)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить файл кеша медиа {victim}: {str(e)}")
+        return path
+
+    def _evict(self, keep: str) -> List[str]:
+        """Убрать из индекса давно не использованные файлы сверх max_bytes; вернуть их пути"""
+        victims = []
+        while self.size > self.max_bytes and len(self.files) > 1:
+            digest = next(iter(self.files))
+            if digest == keep:
+                self.files.move_to_end(digest)
+                continue
+            victims.append(self.files[digest][0])
+            self._drop(digest)
+            self.evictions += 1
+        return victims
+
+    def _drop(self, digest: str):
+        _, size = self.files.pop(digest)
+        self.size -= size
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.files
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+
+class MediaCache:
+    """Кеш медиа для повторной отправки из каналов с запретом пересылки.
+
+    Медиа источника (ключ вида 'document:<id>') скачивается один раз,
+    частями в несколько потоков, в DiskLRU и адресуется хешем содержимого.
+    После отправки запоминается ссылка на уже загруженный в Telegram файл
+    (своя для каждой сессии): повторная отправка того же содержимого —
+    в другие каналы, при повторе или из другого источника — идёт по ссылке
+    без скачивания и загрузки. Соответствия ключ -> хеш и хеш -> ссылка
+    хранятся в базе, одновременные запросы одного медиа сводятся к одному
+    скачиванию.
+    """
+
+    def __init__(
+        self,
+        db,
+        store: DiskLRU,
+        part_size: int = 1 << 20,
+        parallel: int = 4,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.db = db
+        self.store = store
+        self.part_size = part_size
+        self.parallel = parallel
+        self.clock = clock
+        self.digests: Dict[str, str] = {}  # ключ медиа -> хеш содержимого
+        self.uploads: Dict[Tuple[str, str], Upload] = {}  # (сессия, хеш) -> загрузка
+        self.upload_hits = 0
+        self.disk_hits = 0
+        self.downloads = 0
+        self.downloaded_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def load(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.store.scan)
+        for key, digest in await self.db.get_media_files():
+            self.digests[key] = digest
+        for session, digest, kind, file_id, access_hash, file_reference in await self.db.get_media_uploads():
+            self.uploads[(session, digest)] = (kind, file_id, access_hash, file_reference)
+        logger.info(f"Кеш медиа: {len(self.digests)} файлов, {len(self.uploads)} загрузок, "
+                    f"{len(self.store)} на диске")
+
+    def uploaded(self, session: str, key: str) -> Optional[Upload]:
+        """Ссылка на уже загруженную сессией копию медиа, если есть"""
+        digest = self.digests.get(key)
+        upload = self.uploads.get((session, digest)) if digest else None
+        if upload is not None:
+            self.upload_hits += 1
+        return upload
+
+    async def remember_upload(self, session: str, digest: str, upload: Upload):
+        self.uploads[(session, digest)] = upload
+        try:
+            await self.db.save_media_upload(session, digest, *upload, int(self.clock()))
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить ссылку на загрузку {digest}: {str(e)}")
+
+    async def forget_upload(self, session: str, key: str):
+        """Ссылка устарела (FileReferenceExpired) — следующая отправка загрузит файл заново"""
+        digest = self.digests.get(key)
+        if digest and self.uploads.pop((session, digest), None) is not None:
+            await self.db.delete_media_upload(session, digest)
+
+    async def fetch(self, key: str, size: int, read_range: ReadRange, suffix: str = '') -> Tuple[str, str]:
+        """Локальная копия медиа: (хеш, путь). Скачивает, если её нет на диске"""
+        digest = self.digests.get(key)
+        path = self.store.get(digest) if digest else None
+        if path is not None:
+            self.disk_hits += 1
+            return digest, path
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._download(key, size, read_range, suffix)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _download(self, key: str, size: int, read_range: ReadRange, suffix: str) -> Tuple[str, str]:
+        temp_path = self.store.temp_path()
+        loop = asyncio.get_running_loop()
+        try:
+            with open(temp_path, 'wb') as f:
+                if size > 0:
+                    await self._download_parts(f, size, read_range)
+                else:
+                    # Размер неизвестен — одним запросом до конца файла
+                    data = await read_range(0, 0)
+                    await loop.run_in_executor(None, f.write, data)
+            digest = await loop.run_in_executor(None, _file_digest, temp_path)
+            self.downloads += 1
+            self.downloaded_bytes += os.path.getsize(temp_path)
+            path = await loop.run_in_executor(None, self.store.put, temp_path, digest, suffix)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.digests[key] = digest
+        try:
+            await self.db.save_media_file(key, digest, os.path.getsize(path))
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить запись кеша медиа {key}: {str(e)}")
+        return digest, path
+
+    async def _download_parts(self, f, size: int, read_range: ReadRange):
+        """Скачать файл частями по part_size, не больше parallel частей одновременно"""
+        offsets = iter(range(0, size, self.part_size))
+        loop = asyncio.get_running_loop()
+        lock = threading.Lock()
+
+        async def worker():
+            for offset in offsets:
+                length = min(self.part_size, size - offset)
+                data = await read_range(offset, length)
+                if len(data) != length:
+                    raise IOError(f"Часть {offset}: получено {len(data)} байт из {length}")
+                # Запись на диск — в потоке пула, чтобы не задерживать event loop
+                await loop.run_in_executor(None, _write_at, f, lock, offset, data)
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, self.parallel))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> str:
+        mb = self.downloaded_bytes / (1 << 20)
+        return (f"по ссылке {self.upload_hits}, с диска {self.disk_hits}, скачано {self.downloads} "
+                f"({mb:.1f} МБ), на диске {self.store.size / (1 << 20):.1f} МБ")
@@ -0,0 +1,324 @@
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Границы корзин гистограмм задержек, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    body = ','.join(f'{key}="{value}"' for key, value in labels)
+    return '{' + body + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(_labels(labels), 0)
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [(self.name, labels, value) for labels, value in self.values.items()]
+
+
+class Gauge:
+    """Значение на момент чтения; func позволяет вычислять его при выгрузке.
+
+    func возвращает число или словарь {значение метки label: число}.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, func: Optional[Callable[[], Any]] = None, label: str = 'channel'):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.label = label
+        self.values: Dict[Labels, float] = {}
+
+    def set(self, value: float, **labels):
+        self.values[_labels(labels)] = value
+
+    def collect(self) -> Dict[Labels, float]:
+        if self.func is None:
+            return dict(self.values)
+        try:
+            result = self.func()
+        except Exception as e:
+            logger.warning(f"Не удалось вычислить метрику {self.name}: {str(e)}")
+            return {}
+        if isinstance(result, dict):
+            return {((self.label, str(key)),): value for key, value in result.items()}
+        return {(): result}
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [(self.name, labels, value) for labels, value in self.collect().items()]
+
+
+class Total(Gauge):
+    """Нарастающий итог, который ведёт сам компонент (число отправок, попаданий в кеш).
+
+    Вычисляется при выгрузке, как Gauge, но выгружается счётчиком с
+    суффиксом _total: rate() и increase() в Prometheus правильно
+    переживают его обнуление при перезапуске.
+    """
+    kind = 'counter'
+
+
+class _Series:
+    __slots__ = ('buckets', 'count', 'sum', 'max')
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(buckets) + (float('inf'),)
+        self.series: Dict[Labels, _Series] = {}
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _Series(len(self.bounds))
+        series.buckets[bisect_left(self.bounds, value)] += 1
+        series.count += 1
+        series.sum += value
+        series.max = max(series.max, value)
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        series = self.series.get(_labels(labels))
+        if series is None or not series.count:
+            return None
+        rank = q * series.count
+        seen = 0
+        for bound, count in zip(self.bounds, series.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, series.max)
+        return series.max
+
+    def count(self, **labels) -> int:
+        series = self.series.get(_labels(labels))
+        return series.count if series else 0
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        samples = []
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds, series.buckets):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', labels + (('le', _format_value(bound)),), cumulative))
+            samples.append((f'{self.name}_sum', labels, series.sum))
+            samples.append((f'{self.name}_count', labels, series.count))
+        return samples
+
+
+Metric = Union[Counter, Gauge, Total, Histogram]
+
+
+class Metrics:
+    """Реестр метрик бота: счётчики, гистограммы задержек и датчики.
+
+    Выгружается в текстовом формате Prometheus (render) и сводкой для
+    команды /stats. Работает в одном потоке с event loop, поэтому без
+    блокировок.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.started_at = time.time()
+
+    def _get(self, cls, name: str, help: str, **kwargs) -> Any:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, **kwargs)
+        elif help and not metric.help:
+            metric.help = help
+        return metric
+
+    def counter(self, name: str, help: str = '') -> Counter:
+        return self._get(Counter, name, help)
+
+    def histogram(self, name: str, help: str = '', buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def gauge(self, name: str, help: str = '', func: Optional[Callable[[], Any]] = None,
+              label: str = 'channel') -> Gauge:
+        return self._get(Gauge, name, help, func=func, label=label)
+
+    def total(self, name: str, help: str = '', func: Optional[Callable[[], Any]] = None,
+              label: str = 'channel') -> Total:
+        """Вычисляемый счётчик; к имени добавляется суффикс _total"""
+        if not name.endswith('_total'):
+            name = f'{name}_total'
+        return self._get(Total, name, help, func=func, label=label)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def timed(name: str, help: str = ''):
+    """Декоратор async-метода объекта с атрибутом metrics.
+
+    Пишет длительность вызова в гистограмму {name}_seconds и исход в
+    счётчик {name}_total: ok, empty (метод вернул пустой результат —
+    так отправка сообщает о неудаче) или error.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            metrics: Metrics = self.metrics
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = await func(self, *args, **kwargs)
+                outcome = 'ok' if result or result is None else 'empty'
+                return result
+            finally:
+                metrics.histogram(f'{name}_seconds', help).observe(time.perf_counter() - started)
+                metrics.counter(f'{name}_total', help).inc(outcome=outcome)
+        return wrapper
+    return decorator
+
+
+class WindowCounter:
+    """Число событий по ключу за последние window секунд"""
+
+    def __init__(self, window: float = 86400, clock: Callable[[], float] = time.time):
+        self.window = window
+        self.clock = clock
+        self.events: Dict[Any, Deque[float]] = {}
+
+    def add(self, key: Any):
+        self.events.setdefault(key, deque()).append(self.clock())
+
+    def count(self, key: Any) -> int:
+        events = self.events.get(key)
+        if not events:
+            return 0
+        horizon = self.clock() - self.window
+        while events and events[0] < horizon:
+            events.popleft()
+        return len(events)
+
+    def counts(self) -> Dict[Any, int]:
+        return {key: self.count(key) for key in list(self.events)}
+
+
+async def watch_loop_lag(metrics: Metrics, interval: float = 0.5):
+    """Мерить, насколько позже срока просыпается event loop"""
+    histogram = metrics.histogram('event_loop_lag_seconds', 'Задержка пробуждения event loop')
+    gauge = metrics.gauge('event_loop_lag_last_seconds', 'Последняя измеренная задержка event loop')
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        histogram.observe(lag)
+        gauge.set(lag)
+
+
+class Profiler:
+    """Включаемый на ходу cProfile для всего, что выполняется в event loop"""
+
+    def __init__(self):
+        self._profile: Optional[cProfile.Profile] = None
+        self.started_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self._profile is not None
+
+    def start(self) -> bool:
+        if self._profile is not None:
+            return False
+        self._profile = cProfile.Profile()
+        self.started_at = time.time()
+        self._profile.enable()
+        return True
+
+    def stop(self, top: int = 15) -> Optional[str]:
+        """Выключить профилирование и вернуть самые затратные функции"""
+        if self._profile is None:
+            return None
+        self._profile.disable()
+        out = io.StringIO()
+        pstats.Stats(self._profile, stream=out).sort_stats('cumulative').print_stats(top)
+        self._profile = None
+        return out.getvalue()
+
+
+async def start_exporter(metrics: Metrics, host: str, port: int) -> asyncio.AbstractServer:
+    """HTTP-эндпоинт /metrics в текстовом формате Prometheus"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', metrics.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode('latin-1') + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"Ошибка запроса метрик: {str(e)}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,323 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column(conn, table: str, column: str, definition: str):
+    """Добавить колонку в существующую таблицу, если её ещё нет"""
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _rebuild(conn, table: str, schema: str, select: str):
+    """Пересоздать таблицу с новой схемой, переложив строки запросом select"""
+    conn.execute(f'CREATE TABLE {table}_new {schema}')
+    conn.execute(f'INSERT INTO {table}_new {select}')
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+
+def _iso_to_epoch(value, naive_tz) -> Optional[int]:
+    if value is None or isinstance(value, (int, float)):
+        return None if value is None else int(value)
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=naive_tz)
+    return int(dt.timestamp())
+
+
+def _register_functions(conn):
+    # Даты настроек без пояса записывались как UTC (так их читает планировщик),
+    # время репостов — как локальное datetime.now()
+    conn.create_function('utc_epoch', 1, lambda value: _iso_to_epoch(value, timezone.utc), deterministic=True)
+    conn.create_function('local_epoch', 1, lambda value: _iso_to_epoch(value, None), deterministic=True)
+
+
+def _baseline(conn):
+    """Схема до появления версий (её же приводят в порядок старые базы)"""
+    # Таблица для хранения настроек каналов
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS channels (
+            channel_id INTEGER PRIMARY KEY,
+            posts_per_day INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            last_repost_date TEXT NOT NULL
+        )
+    ''')
+
+    _add_column(conn, 'channels', 'forward_mode', 'BOOLEAN NOT NULL DEFAULT 1')
+    _add_column(conn, 'channels', 'drop_author', 'BOOLEAN NOT NULL DEFAULT 1')
+    _add_column(conn, 'channels', 'last_seen_message_id', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'channels', 'live_mode', 'BOOLEAN NOT NULL DEFAULT 0')
+
+    # Таблица для отслеживания пересланных сообщений:
+    # ключ — пара источник/получатель и id сообщения или альбома
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(reposted_messages)')}
+    if columns and 'source_id' not in columns:
+        conn.execute('ALTER TABLE reposted_messages RENAME TO reposted_messages_old')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reposted_messages (
+            source_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            repost_date TEXT NOT NULL,
+            PRIMARY KEY (source_id, channel_id, message_id)
+        )
+    ''')
+    if columns and 'source_id' not in columns:
+        conn.execute('''
+            INSERT OR IGNORE INTO reposted_messages
+            SELECT channel_id, channel_id, message_id, repost_date FROM reposted_messages_old
+        ''')
+        conn.execute('DROP TABLE reposted_messages_old')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reposted_date ON reposted_messages (repost_date)
+    ''')
+
+    # Задачи репоста истории (переживают перезапуск)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            from_channel INTEGER NOT NULL,
+            to_channel INTEGER NOT NULL,
+            job_limit INTEGER NOT NULL,
+            interval INTEGER NOT NULL DEFAULT 0,
+            offset_date REAL,
+            chat_id INTEGER,
+            status TEXT NOT NULL,
+            min_id INTEGER,
+            max_id INTEGER,
+            checkpoint INTEGER NOT NULL DEFAULT 0,
+            sent_count INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            run_seconds REAL NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            error TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+
+    # Кеш InputPeer: позволяет не резолвить каналы после перезапуска
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entities (
+            peer_id INTEGER PRIMARY KEY,
+            peer_type TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            access_hash INTEGER NOT NULL,
+            cached_at INTEGER NOT NULL
+        )
+    ''')
+
+    # Кеш медиа: хеш содержимого медиа источника и загруженные копии по сессиям
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS media_files (
+            media_key TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            size INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS media_uploads (
+            session TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            file_id INTEGER NOT NULL,
+            access_hash INTEGER NOT NULL,
+            file_reference BLOB NOT NULL,
+            uploaded_at INTEGER NOT NULL,
+            PRIMARY KEY (session, digest)
+        )
+    ''')
+
+    # Отпечатки недавно отправленных постов по полосам для поиска похожих
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS similarity (
+            destination_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            fingerprint INTEGER NOT NULL,
+            seen_at INTEGER NOT NULL
+        )
+    ''')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_similarity_bucket '
+        'ON similarity (destination_id, kind, bucket, seen_at, fingerprint)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_similarity_seen ON similarity (seen_at)')
+
+    # Маршруты источник → получатель с необязательным своим расписанием
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS routes (
+            source_id INTEGER NOT NULL,
+            destination_id INTEGER NOT NULL,
+            posts_per_day INTEGER,
+            interval_seconds INTEGER,
+            start_date TEXT NOT NULL,
+            last_repost_date TEXT NOT NULL,
+            last_seen_message_id INTEGER NOT NULL DEFAULT 0,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            PRIMARY KEY (source_id, destination_id)
+        )
+    ''')
+
+    # Аренда каналов процессами при шардировании
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            resource TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            token INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+
+
+def _epoch_timestamps(conn):
+    """Целые секунды epoch вместо ISO-строк, interval_seconds каналов, компактный журнал репостов"""
+    _rebuild(conn, 'channels', '''(
+            channel_id INTEGER PRIMARY KEY,
+            posts_per_day INTEGER NOT NULL,
+            start_date INTEGER NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            last_repost_date INTEGER NOT NULL,
+            forward_mode BOOLEAN NOT NULL DEFAULT 1,
+            drop_author BOOLEAN NOT NULL DEFAULT 1,
+            last_seen_message_id INTEGER NOT NULL DEFAULT 0,
+            live_mode BOOLEAN NOT NULL DEFAULT 0,
+            interval_seconds INTEGER
+        )''', '''
+        SELECT channel_id, posts_per_day, utc_epoch(start_date), is_active, utc_epoch(last_repost_date),
+               forward_mode, drop_author, last_seen_message_id, live_mode, NULL
+        FROM channels
+    ''')
+
+    _rebuild(conn, 'routes', '''(
+            source_id INTEGER NOT NULL,
+            destination_id INTEGER NOT NULL,
+            posts_per_day INTEGER,
+            interval_seconds INTEGER,
+            start_date INTEGER NOT NULL,
+            last_repost_date INTEGER NOT NULL,
+            last_seen_message_id INTEGER NOT NULL DEFAULT 0,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            PRIMARY KEY (source_id, destination_id)
+        )''', '''
+        SELECT source_id, destination_id, posts_per_day, interval_seconds, utc_epoch(start_date),
+               utc_epoch(last_repost_date), last_seen_message_id, is_active
+        FROM routes
+    ''')
+
+    # Проверка «уже переслано» идёт по первичному ключу: без rowid он и есть
+    # таблица, отдельный индекс ключа не нужен. Индекс по времени хранит и
+    # ключ, поэтому покрывает и загрузку окна журнала, и чистку
+    _rebuild(conn, 'reposted_messages', '''(
+            source_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            repost_date INTEGER NOT NULL,
+            PRIMARY KEY (source_id, channel_id, message_id)
+        ) WITHOUT ROWID''', '''
+        SELECT source_id, channel_id, message_id, local_epoch(repost_date) FROM reposted_messages
+    ''')
+    conn.execute('CREATE INDEX idx_reposted_date ON reposted_messages (repost_date)')
+
+
+def _outbox(conn):
+    """Неудачные отправки: очередь повторов и недоставленные посты"""
+    conn.execute('''
+        CREATE TABLE outbox (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            destination_id INTEGER NOT NULL,
+            message_ids TEXT NOT NULL,
+            post_key INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            next_attempt REAL NOT NULL,
+            error TEXT,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_outbox_status ON outbox (status)')
+
+
+def _content_filters(conn):
+    """Правила фильтров и замен в подписях постов по получателям"""
+    conn.execute('''
+        CREATE TABLE filter_rules (
+            rule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_id INTEGER,
+            destination_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            pattern TEXT NOT NULL,
+            replacement TEXT NOT NULL DEFAULT '',
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_filter_rules_destination ON filter_rules (destination_id)')
+
+
+# (версия, название, функция); новые миграции только дописываются в конец
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'baseline', _baseline),
+    (2, 'epoch_timestamps', _epoch_timestamps),
+    (3, 'outbox', _outbox),
+    (4, 'content_filters', _content_filters),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, target: int = LATEST_VERSION) -> List[int]:
+    """Применить недостающие миграции до версии target; вернуть применённые.
+
+    Каждая миграция идёт в своей транзакции вместе с записью версии, так
+    что прерванный запуск оставляет базу на последней целой версии.
+    BEGIN IMMEDIATE сразу берёт блокировку записи: если несколько
+    процессов стартуют одновременно, миграцию выполнит один, остальные
+    дождутся его и увидят новую версию.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at INTEGER NOT NULL
+        )
+    ''')
+    version = current_version(conn)
+    if version > LATEST_VERSION:
+        raise RuntimeError(f"Версия схемы базы {version} новее поддерживаемой {LATEST_VERSION}")
+    _register_functions(conn)
+    applied = []
+    for number, name, func in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if number <= current_version(conn):
+                conn.execute('ROLLBACK')
+                continue
+            func(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                (number, name, int(time.time()))
+            )
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        applied.append(number)
+        logger.info(f"Схема базы обновлена до версии {number} ({name})")
+    return applied
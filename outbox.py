@@ -0,0 +1,234 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DEAD = 'dead'
+
+# Чья запись: канал репостит сам в себя или маршрут источник → получатель
+CHANNEL = 'channel'
+ROUTE = 'route'
+
+
+@dataclass
+class RetryPolicy:
+    """Сколько раз и с какими паузами повторять отправку после ошибок одного класса"""
+    name: str
+    max_attempts: int
+    base_delay: float = 10.0
+    max_delay: float = 3600.0
+
+    def delay(self, attempt: int, rng: random.Random) -> float:
+        """Пауза после неудачной попытки attempt: экспонента до max_delay, вторая половина — случайная.
+
+        Джиттер разводит по времени повторы постов, упавших одновременно
+        (обрыв связи), чтобы они не вернулись к Telegram одной пачкой.
+        """
+        capped = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return capped / 2 + rng.uniform(0, capped / 2)
+
+
+class Deferred(Exception):
+    """Отправка сейчас невозможна (нет сессии, чужая аренда): отложить, не считая попытку.
+
+    На первой попытке запись не сохраняется, исключение уходит вызывающему.
+    """
+
+
+@dataclass
+class OutboxEntry:
+    kind: str  # CHANNEL или ROUTE
+    source_id: int
+    destination_id: int
+    message_ids: Tuple[int, ...]
+    post_key: int
+    entry_id: Optional[int] = None
+    status: str = PENDING
+    attempts: int = 0
+    next_attempt: float = 0.0
+    error: Optional[str] = None
+    created_at: float = 0.0
+
+    def log_fields(self) -> dict:
+        return {'message_id': self.message_ids[0], 'attempt': self.attempts}
+
+    def describe(self) -> str:
+        route = str(self.source_id) if self.kind == CHANNEL else f"{self.source_id} → {self.destination_id}"
+        return f"#{self.entry_id} {route}, сообщения {', '.join(map(str, self.message_ids))}"
+
+
+class Outbox:
+    """Очередь неудачных отправок с повторами и списком недоставленных.
+
+    Первая попытка идёт сразу и в базу ничего не пишет: при успехе
+    outbox не стоит ни одного запроса. При ошибке пост сохраняется в
+    таблице outbox, и вызывающий может сдвинуть курсор источника — пост
+    уже не потеряется ни при повторе, ни при перезапуске. Пауза и число
+    попыток зависят от класса ошибки (policies: список пар (типы
+    исключений, RetryPolicy), первая подходящая); исчерпавшие попытки
+    записи остаются в базе со статусом dead, их можно посмотреть и
+    отправить заново командой.
+
+    Повтор выполняет resend(entry): он сам загружает сообщения по id и
+    возвращает результат отправки или бросает исключение.
+    """
+
+    def __init__(
+        self,
+        db,
+        resend: Callable[[OutboxEntry], Awaitable[Any]],
+        policies: Sequence[Tuple[Tuple[Type[BaseException], ...], RetryPolicy]] = (),
+        default: RetryPolicy = RetryPolicy('other', 3, 60, 3600),
+        defer_seconds: float = 60,
+        clock: Callable[[], float] = time.time,
+        rng: Optional[random.Random] = None,
+    ):
+        self.db = db
+        self.resend = resend
+        self.policies = list(policies)
+        self.default = default
+        self.defer_seconds = defer_seconds
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.entries: Dict[int, OutboxEntry] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._wake = asyncio.Event()
+        self.retries = 0
+        self.delivered = 0
+        self.dead = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def policy_for(self, error: BaseException) -> RetryPolicy:
+        for errors, policy in self.policies:
+            if isinstance(error, errors):
+                return policy
+        return self.default
+
+    async def restore(self):
+        """Загрузить записи, ожидающие повтора, и число недоставленных"""
+        for entry in await self.db.get_outbox(PENDING):
+            self._push(entry)
+        self.dead = await self.db.count_outbox(DEAD)
+        if self.entries or self.dead:
+            logger.info(f"В outbox: к повтору {len(self.entries)}, недоставленных {self.dead}")
+
+    async def send(self, entry: OutboxEntry, send: Callable[[], Awaitable[Any]]) -> Optional[Any]:
+        """Первая попытка отправки; None — не удалось, запись сохранена (см. entry.status)"""
+        entry.created_at = entry.created_at or self.clock()
+        entry.attempts += 1
+        try:
+            return await send()
+        except Deferred:
+            entry.attempts -= 1
+            raise
+        except Exception as e:
+            await self._fail(entry, e)
+            return None
+
+    async def run(self):
+        """Цикл повторов: сон до ближайшей записи"""
+        while True:
+            self._wake.clear()
+            entry = self._peek()
+            timeout = None if entry is None else entry.next_attempt - self.clock()
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            await self._retry(entry)
+
+    async def dead_letters(self) -> List[OutboxEntry]:
+        return await self.db.get_outbox(DEAD)
+
+    async def replay(self, entry_id: Optional[int] = None) -> int:
+        """Вернуть недоставленные записи (все или одну) в очередь повторов"""
+        entries = [entry for entry in await self.db.get_outbox(DEAD)
+                   if entry_id is None or entry.entry_id == entry_id]
+        for entry in entries:
+            entry.status = PENDING
+            entry.attempts = 0
+            entry.error = None
+            entry.next_attempt = self.clock()
+            await self.db.update_outbox(entry)
+            self._push(entry)
+        self.dead -= len(entries)
+        return len(entries)
+
+    async def discard(self, entry_id: Optional[int] = None) -> int:
+        """Удалить недоставленные записи (все или одну)"""
+        removed = await self.db.delete_outbox(entry_id, DEAD)
+        self.dead -= removed
+        return removed
+
+    def _peek(self) -> Optional[OutboxEntry]:
+        # Устаревшие позиции кучи (перенесённые или удалённые записи) пропускаются здесь
+        while self._heap:
+            at, entry_id = self._heap[0]
+            entry = self.entries.get(entry_id)
+            if entry is not None and entry.next_attempt == at:
+                return entry
+            heapq.heappop(self._heap)
+        return None
+
+    def _push(self, entry: OutboxEntry):
+        self.entries[entry.entry_id] = entry
+        heapq.heappush(self._heap, (entry.next_attempt, entry.entry_id))
+        self._wake.set()
+
+    async def _retry(self, entry: OutboxEntry):
+        # Запись могли удалить (доставил другой процесс, команда) — сверяемся с базой
+        if not await self.db.get_outbox(PENDING, entry.entry_id):
+            self.entries.pop(entry.entry_id, None)
+            return
+        self.retries += 1
+        entry.attempts += 1
+        try:
+            await self.resend(entry)
+        except Deferred as e:
+            entry.attempts -= 1
+            entry.next_attempt = self.clock() + self.defer_seconds
+            logger.info(f"Повтор {entry.describe()} отложен: {str(e)}", extra=entry.log_fields())
+            self._push(entry)
+            return
+        except Exception as e:
+            await self._fail(entry, e)
+            return
+        self.entries.pop(entry.entry_id, None)
+        self.delivered += 1
+        await self.db.delete_outbox(entry.entry_id)
+        logger.info(f"Пост {entry.describe()} доставлен с попытки {entry.attempts}", extra=entry.log_fields())
+
+    async def _fail(self, entry: OutboxEntry, error: Exception):
+        policy = self.policy_for(error)
+        entry.error = f"{type(error).__name__}: {str(error)}"
+        if entry.attempts >= policy.max_attempts:
+            entry.status = DEAD
+            self.entries.pop(entry.entry_id, None)
+            self.dead += 1
+        else:
+            # Если Telegram сам назвал срок (flood wait), раньше него не повторяем
+            delay = max(policy.delay(entry.attempts, self.rng), getattr(error, 'seconds', None) or 0)
+            entry.next_attempt = self.clock() + delay
+        if entry.entry_id is None:
+            entry.entry_id = await self.db.add_outbox(entry)
+        else:
+            await self.db.update_outbox(entry)
+        if entry.status == DEAD:
+            logger.error(f"Пост {entry.describe()} не доставлен, попыток {entry.attempts} ({policy.name}): "
+                         f"{entry.error}", extra=entry.log_fields())
+        else:
+            logger.warning(f"Ошибка отправки {entry.describe()} ({policy.name}, попытка {entry.attempts} "
+                           f"из {policy.max_attempts}), повтор через {entry.next_attempt - self.clock():.0f} с: "
+                           f"{entry.error}", extra=entry.log_fields())
+            self._push(entry)
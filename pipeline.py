@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Sized
+
+_DONE = object()
+
+
+async def batch_posts(posts: AsyncIterator[Sized], size: int) -> AsyncIterator[List[Sized]]:
+    """Собирать посты в пачки до size сообщений, не разрывая альбомы"""
+    batch: List[Sized] = []
+    count = 0
+    async for post in posts:
+        if batch and count + len(post) > size:
+            yield batch
+            batch = []
+            count = 0
+        batch.append(post)
+        count += len(post)
+    if batch:
+        yield batch
+
+
+async def run_pipeline(source: AsyncIterator[Any], sink: Callable[[Any], Awaitable[Any]], depth: int = 2) -> int:
+    """Производитель/потребитель через ограниченную очередь.
+
+    Пока sink отправляет очередную пачку, source уже загружает следующие,
+    но не больше depth вперёд — память ограничена при любом объёме.
+    Ошибка любой стороны останавливает обе и пробрасывается наружу.
+    Возвращает число обработанных элементов.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+
+    async def produce():
+        try:
+            async for item in source:
+                await queue.put(item)
+        except asyncio.CancelledError:
+            # Потребитель уже остановлен и очередь не читает: ждать места в ней нельзя
+            raise
+        except BaseException:
+            await queue.put(_DONE)
+            raise
+        await queue.put(_DONE)
+
+    producer = asyncio.create_task(produce())
+    processed = 0
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            await sink(item)
+            processed += 1
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+    return processed
@@ -0,0 +1,139 @@
+from typing import Any, AsyncIterator, Iterable, List, Optional, Tuple
+
+# Больше сообщений в альбоме Telegram не бывает
+MAX_ALBUM = 10
+
+
+class PostUnit:
+    """Пост (одиночное сообщение или альбом) в компактной форме.
+
+    Вместо объектов Message хранится только то, что нужно для отправки
+    и учёта: id сообщений, медиа, подпись с разметкой. Объекты Message
+    тянут за собой клиента, реакции, репосты и прочее и могут быть
+    освобождены сразу после группировки. edited — подпись изменена
+    фильтром, и серверная пересылка (она копирует оригинал) не подходит.
+    """
+    __slots__ = ('chat_id', 'grouped_id', 'ids', 'date', 'caption', 'entities', 'media', 'link_preview', 'buttons',
+                 'edited')
+
+    def __init__(self, chat_id: Optional[int], grouped_id: Optional[int], ids: Tuple[int, ...], date: Any = None,
+                 caption: str = '', entities: Optional[list] = None, media: Tuple[Any, ...] = (),
+                 link_preview: bool = False, buttons: Any = None, edited: bool = False):
+        self.chat_id = chat_id
+        self.grouped_id = grouped_id
+        self.ids = ids
+        self.date = date
+        self.caption = caption
+        self.entities = entities
+        self.media = media
+        self.link_preview = link_preview
+        self.buttons = buttons
+        self.edited = edited
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Any]) -> 'PostUnit':
+        """Собрать пост из сообщений (от старых к новым)"""
+        messages = sorted((msg for msg in messages if msg), key=lambda msg: msg.id)
+        first = messages[0]
+        caption, entities = '', None
+        media = []
+        link_preview = False
+        for msg in messages:
+            text = getattr(msg, 'message', None)
+            if text and not caption:
+                # У альбома одна подпись — первая непустая, как её показывает Telegram
+                caption, entities = text, getattr(msg, 'entities', None)
+            item = getattr(msg, 'media', None)
+            if item is None:
+                continue
+            if getattr(item, 'webpage', None) is not None:
+                # Превью ссылки — не файл, его пересоберёт Telegram
+                link_preview = True
+            else:
+                media.append(item)
+        return cls(
+            chat_id=getattr(first, 'chat_id', None),
+            grouped_id=getattr(first, 'grouped_id', None),
+            ids=tuple(msg.id for msg in messages),
+            date=getattr(first, 'date', None),
+            caption=caption,
+            entities=entities,
+            media=tuple(media),
+            link_preview=link_preview,
+            buttons=getattr(first, 'reply_markup', None),
+        )
+
+    @property
+    def key(self) -> int:
+        """Ключ поста для журнала репостов: grouped_id альбома или id сообщения"""
+        return self.grouped_id or self.ids[0]
+
+    @property
+    def first_id(self) -> int:
+        return self.ids[0]
+
+    @property
+    def last_id(self) -> int:
+        return self.ids[-1]
+
+    @property
+    def has_content(self) -> bool:
+        return bool(self.caption or self.media)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __repr__(self) -> str:
+        return f"PostUnit({self.chat_id}, {list(self.ids)})"
+
+
+class AlbumGrouper:
+    """Потоковая группировка сообщений (от старых к новым) в посты.
+
+    Посты выходят в том же порядке, что и сообщения. Задерживается только
+    открытый альбом: он закрывается следующим сообщением не из него или
+    когда в нём набралось MAX_ALBUM сообщений, поэтому альбом на границе
+    страниц истории не разрывается, а в памяти одновременно не больше
+    одного альбома объектов Message.
+    """
+
+    def __init__(self):
+        self._album: List[Any] = []
+
+    @property
+    def pending(self) -> int:
+        """Сколько сообщений открытого альбома ждёт продолжения"""
+        return len(self._album)
+
+    def feed(self, msg: Any) -> List[PostUnit]:
+        """Добавить сообщение; вернуть посты, которые оно завершило"""
+        if not msg:
+            return []
+        ready = []
+        grouped_id = getattr(msg, 'grouped_id', None)
+        if self._album and grouped_id != self._album[0].grouped_id:
+            ready.extend(self.flush())
+        if grouped_id:
+            self._album.append(msg)
+            if len(self._album) >= MAX_ALBUM:
+                ready.extend(self.flush())
+        else:
+            ready.append(PostUnit.from_messages([msg]))
+        return ready
+
+    def flush(self) -> List[PostUnit]:
+        """Отдать открытый альбом как есть (конец потока)"""
+        if not self._album:
+            return []
+        album, self._album = self._album, []
+        return [PostUnit.from_messages(album)]
+
+
+async def group_stream(messages: AsyncIterator[Any]) -> AsyncIterator[PostUnit]:
+    """Посты из асинхронного потока сообщений от старых к новым"""
+    grouper = AlbumGrouper()
+    async for msg in messages:
+        for post in grouper.feed(msg):
+            yield post
+    for post in grouper.flush():
+        yield post
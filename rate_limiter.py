@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Классическое ведро токенов с изменяемой скоростью"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def reserve(self) -> float:
+        """Забрать токен; вернуть, сколько секунд нужно подождать до его появления"""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateGovernor:
+    """Общий регулятор скорости отправок для всего аккаунта.
+
+    Каждая отправка проходит через три ограничения: ведро аккаунта,
+    ведро конкретного получателя и глобальную заморозку после
+    FloodWaitError. Скорость аккаунта подстраивается по AIMD: после
+    флуда уменьшается вдвое, после серии успешных отправок плавно растёт
+    обратно до настроенного максимума.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: int = 5,
+        destination_rate: float = 20 / 60,
+        destination_burst: int = 3,
+        flood_errors: Tuple[Type[BaseException], ...] = (),
+        max_retries: int = 3,
+        min_rate: float = 0.05,
+        recovery_step: float = 0.05,
+        recovery_after: int = 20,
+        max_flood_wait: Optional[float] = None,
+        on_flood: Optional[Callable[[float], Any]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.flood_errors = flood_errors
+        self.max_retries = max_retries
+        self.recovery_step = recovery_step
+        self.recovery_after = recovery_after
+        # Флуд дольше этого не пережидаем, а сразу отдаём вызывающему
+        self.max_flood_wait = max_flood_wait
+        # Узнаёт о флуде, который регулятор не пережидает, до того как ошибку заглушат выше
+        self.on_flood = on_flood
+        self.clock = clock
+        self.sleep = sleep
+        self.account = TokenBucket(rate, burst, clock)
+        self.destinations: Dict[Hashable, TokenBucket] = {}
+        self.frozen_until = 0.0
+        self.sends = 0
+        self.flood_waits = 0
+        self.flood_seconds = 0.0
+        self._streak = 0
+
+    def _destination(self, destination: Hashable) -> TokenBucket:
+        bucket = self.destinations.get(destination)
+        if bucket is None:
+            bucket = TokenBucket(self.destination_rate, self.destination_burst, self.clock)
+            self.destinations[destination] = bucket
+        return bucket
+
+    def freeze(self, seconds: float):
+        """Заморозить все отправки на seconds секунд"""
+        until = self.clock() + seconds
+        if until > self.frozen_until:
+            self.frozen_until = until
+            logger.warning(f"Глобальная пауза отправок на {seconds} секунд")
+        self.flood_waits += 1
+        self.flood_seconds += seconds
+        self._streak = 0
+        self.account.rate = max(self.min_rate, self.account.rate / 2)
+
+    def frozen_for(self) -> float:
+        """Сколько секунд ещё длится пауза после флуда"""
+        return max(0.0, self.frozen_until - self.clock())
+
+    def _on_success(self):
+        self.sends += 1
+        self._streak += 1
+        if self._streak >= self.recovery_after and self.account.rate < self.max_rate:
+            self.account.rate = min(self.max_rate, self.account.rate + self.recovery_step)
+            self._streak = 0
+
+    async def acquire(self, destination: Optional[Hashable] = None):
+        """Дождаться права на одну отправку"""
+        while True:
+            frozen = self.frozen_until - self.clock()
+            if frozen > 0:
+                await self.sleep(frozen)
+                continue
+            wait = self.account.reserve()
+            if destination is not None:
+                wait = max(wait, self._destination(destination).reserve())
+            if wait > 0:
+                await self.sleep(wait)
+            # Пока ждали, мог прилететь флуд — проверяем снова
+            if self.frozen_until <= self.clock():
+                return
+
+    async def call(self, destination: Optional[Hashable], func: Callable[..., Awaitable], *args, **kwargs):
+        """Выполнить отправку через регулятор с повтором после флуда"""
+        attempt = 0
+        while True:
+            await self.acquire(destination)
+            try:
+                result = await func(*args, **kwargs)
+            except self.flood_errors as e:
+                attempt += 1
+                seconds = getattr(e, 'seconds', 0) or 1
+                self.freeze(seconds)
+                if attempt > self.max_retries or (
+                        self.max_flood_wait is not None and seconds > self.max_flood_wait):
+                    if self.on_flood is not None:
+                        self.on_flood(seconds)
+                    raise
+                continue
+            self._on_success()
+            return result
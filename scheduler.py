@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+from config import ChannelConfig
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд повторить попытку, если постить было нечего
+IDLE_RETRY_SECONDS = 300
+
+
+def _to_epoch(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def channel_interval(config: ChannelConfig) -> float:
+    """Интервал между постами канала в секундах"""
+    if config.interval_seconds:
+        return float(config.interval_seconds)
+    return 86400 / max(1, config.posts_per_day)
+
+
+def next_deadline(config: ChannelConfig) -> float:
+    """Момент (epoch) следующего поста канала"""
+    start = _to_epoch(config.start_date)
+    due = _to_epoch(config.last_repost_date) + channel_interval(config)
+    return max(start, due)
+
+
+class DeadlineHeap:
+    """Бинарная min-куча дедлайнов с индексом позиций.
+
+    Позволяет менять дедлайн канала на месте за O(log n) без
+    накопления устаревших записей.
+    """
+
+    def __init__(self):
+        self._heap: List[List] = []  # [deadline, channel_id]
+        self._pos: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._pos
+
+    def peek(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+    def get(self, channel_id: int) -> Optional[float]:
+        idx = self._pos.get(channel_id)
+        return None if idx is None else self._heap[idx][0]
+
+    def push(self, channel_id: int, deadline: float):
+        """Добавить канал или перевыставить его дедлайн"""
+        idx = self._pos.get(channel_id)
+        if idx is None:
+            self._heap.append([deadline, channel_id])
+            self._pos[channel_id] = len(self._heap) - 1
+            self._sift_up(len(self._heap) - 1)
+            return
+        old = self._heap[idx][0]
+        self._heap[idx][0] = deadline
+        if deadline < old:
+            self._sift_up(idx)
+        else:
+            self._sift_down(idx)
+
+    def remove(self, channel_id: int) -> bool:
+        idx = self._pos.pop(channel_id, None)
+        if idx is None:
+            return False
+        last = self._heap.pop()
+        if idx < len(self._heap):
+            self._heap[idx] = last
+            self._pos[last[1]] = idx
+            self._sift_up(idx)
+            self._sift_down(self._pos[last[1]])
+        return True
+
+    def pop_due(self, now: float) -> List[int]:
+        """Извлечь все каналы с наступившим дедлайном"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            channel_id = self._heap[0][1]
+            self.remove(channel_id)
+            due.append(channel_id)
+        return due
+
+    def _swap(self, i: int, j: int):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._pos[heap[i][1]] = i
+        self._pos[heap[j][1]] = j
+
+    def _sift_up(self, idx: int):
+        heap = self._heap
+        while idx > 0:
+            parent = (idx - 1) >> 1
+            if heap[idx][0] >= heap[parent][0]:
+                break
+            self._swap(idx, parent)
+            idx = parent
+
+    def _sift_down(self, idx: int):
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = idx
+            left = 2 * idx + 1
+            right = left + 1
+            if left < size and heap[left][0] < heap[smallest][0]:
+                smallest = left
+            if right < size and heap[right][0] < heap[smallest][0]:
+                smallest = right
+            if smallest == idx:
+                break
+            self._swap(idx, smallest)
+            idx = smallest
+
+
+class RepostScheduler:
+    """Центральный планировщик репостов.
+
+    Держит конфигурации активных каналов в памяти и кучу их дедлайнов,
+    спит ровно до ближайшего дедлайна и запускает обработчик для
+    каждого наступившего канала. Обработчик возвращает обновлённую
+    конфигурацию (или None, чтобы снять канал с расписания).
+
+    Ключ записи по умолчанию — channel_id; планировщик маршрутов передаёт
+    свою функцию key, т.к. у маршрута ключ — пара источник/получатель.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Optional[Any]]],
+        clock: Callable[[], float] = time.time,
+        key: Callable[[Any], Hashable] = lambda config: config.channel_id,
+    ):
+        self.handler = handler
+        self.clock = clock
+        self.key = key
+        self.configs: Dict[Hashable, ChannelConfig] = {}
+        self.heap = DeadlineHeap()
+        self.running: Set[int] = set()
+        self.wakeups = 0
+        self._wake = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, config: ChannelConfig, deadline: Optional[float] = None):
+        """Поставить канал в расписание или пересчитать его дедлайн"""
+        channel_id = self.key(config)
+        if not config.is_active:
+            self.remove(channel_id)
+            return
+        self.configs[channel_id] = config
+        if channel_id in self.running:
+            # Дедлайн выставится по завершении текущей обработки
+            return
+        if deadline is None:
+            deadline = next_deadline(config)
+        previous = self.heap.peek()
+        self.heap.push(channel_id, deadline)
+        if previous is None or deadline < previous:
+            self._wake.set()
+
+    def remove(self, channel_id: int):
+        """Снять канал с расписания"""
+        self.configs.pop(channel_id, None)
+        if self.heap.remove(channel_id):
+            self._wake.set()
+
+    def wake(self, channel_id: int):
+        """Появился новый пост: не ждать холостой паузы, а постить по расписанию"""
+        config = self.configs.get(channel_id)
+        current = self.heap.get(channel_id)
+        if config is None or current is None:
+            return
+        deadline = max(next_deadline(config), self.clock())
+        if deadline < current:
+            self.schedule(config, deadline)
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.configs
+
+    def deadline_of(self, channel_id: int) -> Optional[float]:
+        return self.heap.get(channel_id)
+
+    def dispatch_due(self) -> List[int]:
+        """Запустить обработку всех каналов с наступившим дедлайном"""
+        due = self.heap.pop_due(self.clock())
+        for channel_id in due:
+            config = self.configs.get(channel_id)
+            if config is None:
+                continue
+            self.running.add(channel_id)
+            task = asyncio.create_task(self._run_handler(config))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return due
+
+    async def _run_handler(self, config: ChannelConfig):
+        channel_id = self.key(config)
+        retry_at = None
+        try:
+            updated = await self.handler(config)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка обработки канала {channel_id} в планировщике: {str(e)}")
+            updated = config
+            retry_at = self.clock() + IDLE_RETRY_SECONDS
+        finally:
+            self.running.discard(channel_id)
+        # Канал могли остановить или перенастроить, пока шла обработка
+        if channel_id not in self.configs:
+            return
+        if updated is None or not updated.is_active:
+            self.remove(channel_id)
+            return
+        current = self.configs[channel_id]
+        if current is not config:
+            # Команда поменяла настройки — берём их, но сохраняем прогресс
+            current.last_repost_date = max(
+                current.last_repost_date, updated.last_repost_date, key=_to_epoch
+            )
+            current.last_seen_message_id = max(
+                current.last_seen_message_id, updated.last_seen_message_id
+            )
+            updated = current
+        deadline = next_deadline(updated)
+        if retry_at is None and deadline <= self.clock():
+            # Постить было нечего: не крутимся вхолостую
+            retry_at = self.clock() + IDLE_RETRY_SECONDS
+        self.schedule(updated, max(deadline, retry_at or 0))
+
+    async def run(self):
+        """Основной цикл: сон до ближайшего дедлайна"""
+        try:
+            while True:
+                self._wake.clear()
+                deadline = self.heap.peek()
+                timeout = None if deadline is None else max(0.0, deadline - self.clock())
+                if timeout is None or timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout)
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+                self.wakeups += 1
+                self.dispatch_due()
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
@@ -0,0 +1,164 @@
+import hashlib
+import io
+import logging
+import re
+import time
+from itertools import combinations
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow сравниваются только тексты
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+# Отпечаток поста: ('text' | 'image', 64-битный хеш)
+Fingerprint = Tuple[str, int]
+
+_LINK = re.compile(r'(?:https?://|www\.|t\.me/)\S+|@\w+', re.IGNORECASE)
+_WORD = re.compile(r'\w+')
+
+
+def normalize_text(text: str) -> List[str]:
+    """Слова текста без регистра, ссылок и упоминаний (подписи источников отличаются)"""
+    text = _LINK.sub(' ', text or '').lower().replace('ё', 'е')
+    return _WORD.findall(text)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(tokens: Sequence[str], shingle: int = 1) -> int:
+    """SimHash по шинглам из shingle слов: похожие тексты дают близкие хеши.
+
+    Для коротких постов лучше отдельные слова: лишнее слово подписи
+    сдвигает хеш на несколько бит, а шингл из двух слов — вдвое сильнее.
+    """
+    if len(tokens) > shingle:
+        features = [' '.join(tokens[i:i + shingle]) for i in range(len(tokens) - shingle + 1)]
+    else:
+        features = [' '.join(tokens)]
+    weights = [0] * BITS
+    for feature in features:
+        value = _hash64(feature)
+        for bit in range(BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def dhash(pixels: Sequence[Sequence[int]]) -> int:
+    """Разностный хеш изображения 9x8 в оттенках серого: бит — ярче ли пиксель соседа справа"""
+    value = 0
+    for row in pixels:
+        for left, right in zip(row, row[1:]):
+            value = value << 1 | (left > right)
+    return value
+
+
+def image_hash(jpeg: bytes) -> Optional[int]:
+    """Перцептивный хеш миниатюры; None без Pillow или для неразборчивого файла"""
+    if Image is None:
+        return None
+    try:
+        image = Image.open(io.BytesIO(jpeg)).convert('L').resize((9, 8))
+    except Exception as e:
+        logger.debug(f"Не удалось разобрать миниатюру: {str(e)}")
+        return None
+    data = list(image.getdata())
+    return dhash([data[row * 9:(row + 1) * 9] for row in range(8)])
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def post_fingerprints(texts: Iterable[str], thumbnails: Iterable[bytes], min_tokens: int = 5) -> List[Fingerprint]:
+    """Отпечатки поста: текст целиком (если он не слишком короткий) и каждая картинка"""
+    fingerprints = []
+    tokens = [token for text in texts for token in normalize_text(text)]
+    if len(tokens) >= min_tokens:
+        fingerprints.append(('text', simhash(tokens)))
+    for thumbnail in thumbnails:
+        value = image_hash(thumbnail)
+        if value is not None:
+            fingerprints.append(('image', value))
+    return fingerprints
+
+
+def _signed(value: int) -> int:
+    """64-битный хеш в диапазон INTEGER SQLite"""
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+class SimilarityIndex:
+    """Индекс похожих постов, недавно отправленных в каждый канал-получатель.
+
+    Отпечаток (SimHash текста или хеш картинки) делится на BANDS полос по
+    16 бит. У отпечатков, отличающихся не больше чем в max_distance
+    битах, хотя бы одна полоса отличается не больше чем в
+    max_distance // BANDS битах (принцип Дирихле). Поэтому при поиске
+    перебираются только такие соседи полос, выборка идёт по индексу
+    полос в SQLite, и сравнивать приходится лишь с кандидатами, а не со
+    всеми записями. Записи живут window_days и не больше
+    max_per_destination отпечатков на получателя.
+    """
+
+    def __init__(self, db, max_distance: int = 6, window_days: float = 7, max_per_destination: int = 10_000,
+                 clock: Callable[[], float] = time.time):
+        self.db = db
+        self.max_distance = max_distance
+        self.bands = BANDS
+        self.radius = max_distance // BANDS
+        self.window = window_days * 86400
+        self.max_per_destination = max_per_destination
+        self.clock = clock
+        self.checks = 0
+        self.duplicates = 0
+
+    @staticmethod
+    def buckets(fingerprint: int) -> List[int]:
+        """Корзины полос отпечатка: номер полосы в старших битах, значение — в младших"""
+        mask = (1 << BAND_BITS) - 1
+        return [band << BAND_BITS | (fingerprint >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+    def probes(self, fingerprint: int) -> List[int]:
+        """Корзины, в которых может лежать отпечаток не дальше max_distance"""
+        flips = [0]
+        for distance in range(1, self.radius + 1):
+            flips += [sum(1 << bit for bit in bits) for bits in combinations(range(BAND_BITS), distance)]
+        return [bucket ^ flip for bucket in self.buckets(fingerprint) for flip in flips]
+
+    async def find(self, destination_id: int, fingerprints: List[Fingerprint]) -> Optional[Fingerprint]:
+        """Похожий отпечаток, недавно отправленный получателю, или None"""
+        if not fingerprints:
+            return None
+        self.checks += 1
+        since = int(self.clock() - self.window)
+        for kind, value in fingerprints:
+            candidates = await self.db.find_fingerprints(destination_id, kind, self.probes(value), since)
+            for candidate in candidates:
+                if hamming(candidate % (1 << BITS), value) <= self.max_distance:
+                    self.duplicates += 1
+                    return kind, candidate % (1 << BITS)
+        return None
+
+    async def add(self, destination_id: int, fingerprints: List[Fingerprint]):
+        now = int(self.clock())
+        rows = [
+            (destination_id, kind, bucket, _signed(value), now)
+            for kind, value in fingerprints
+            for bucket in self.buckets(value)
+        ]
+        if rows:
+            await self.db.add_fingerprints(rows)
+
+    async def prune(self) -> int:
+        """Удалить отпечатки старше окна и сверх лимита на получателя"""
+        return await self.db.prune_fingerprints(
+            int(self.clock() - self.window), self.max_per_destination * self.bands
+        )
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Методы Database, которые меняют данные, и методы только для чтения
+WRITE_METHODS = frozenset({
+    'add_channel',
+    'update_last_repost',
+    'update_cursor',
+    'mark_reposted',
+    'mark_reposted_many',
+    'prune_reposted',
+    'save_entity',
+    'delete_entity',
+    'add_job',
+    'update_job',
+    'add_route',
+    'update_route_progress',
+    'delete_route',
+    'acquire_lease',
+    'renew_lease',
+    'release_lease',
+    'save_media_file',
+    'save_media_upload',
+    'delete_media_upload',
+    'add_fingerprints',
+    'prune_fingerprints',
+    'add_outbox',
+    'update_outbox',
+    'delete_outbox',
+    'add_filter_rule',
+    'delete_filter_rules',
+})
+READ_METHODS = frozenset({
+    'get_all_channels',
+    'get_channel',
+    'is_reposted',
+    'get_reposted_since',
+    'get_entities',
+    'get_media_files',
+    'get_media_uploads',
+    'find_fingerprints',
+    'get_job',
+    'get_jobs',
+    'get_routes',
+    'get_route',
+    'get_leases',
+    'get_outbox',
+    'count_outbox',
+    'get_filter_rules',
+    'filter_rules_stamp',
+})
+
+_STOP = object()
+
+
+class AsyncDatabase:
+    """Асинхронная обёртка над Database, не блокирующая event loop.
+
+    Все записи уходят в очередь выделенного потока-писателя, который
+    собирает накопившиеся вызовы в одну транзакцию (group commit);
+    каждый вызов внутри выполняется в своём SAVEPOINT, так что ошибка
+    одного не откатывает остальные. Чтения идут через пул потоков, у
+    каждого из которых своё соединение; база открывается в режиме WAL,
+    поэтому читатели не ждут писателя.
+
+    Набор методов тот же, что у Database, только их нужно await-ить.
+    Если передан реестр metrics, время каждого вызова (вместе с ожиданием
+    в очереди) пишется в гистограмму db_call_seconds.
+    """
+
+    def __init__(self, db_name: str, readers: int = 4, batch_size: int = 256, metrics=None):
+        self.metrics = metrics
+        self.db_name = db_name
+        self.batch_size = batch_size
+        # In-memory база у каждого соединения своя — читаем через писателя
+        self._shared_reads = db_name == ':memory:'
+        self._writes: "queue.Queue" = queue.Queue()
+        self._local = threading.local()
+        self._reader_conns: List[Database] = []
+        self._reader_lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+        self.commits = 0
+        self.writes = 0
+        # Вызовов, ожидающих ответа потока базы
+        self.pending = 0
+        self._init_error: Optional[BaseException] = None
+        ready = threading.Event()
+        self._writer = threading.Thread(target=self._writer_loop, args=(ready,), name='db-writer', daemon=True)
+        self._writer.start()
+        ready.wait()
+        if self._init_error:
+            raise self._init_error
+
+    def __getattr__(self, name: str):
+        if name in WRITE_METHODS or (name in READ_METHODS and self._shared_reads):
+            async def write(*args, **kwargs):
+                started = time.perf_counter()
+                self.pending += 1
+                try:
+                    return await self._submit(name, args, kwargs)
+                finally:
+                    self.pending -= 1
+                    self._observe(name, started)
+            write.__name__ = name
+            return write
+        if name in READ_METHODS:
+            async def read(*args, **kwargs):
+                loop = asyncio.get_running_loop()
+                started = time.perf_counter()
+                self.pending += 1
+                try:
+                    return await loop.run_in_executor(self._readers, self._read, name, args, kwargs)
+                finally:
+                    self.pending -= 1
+                    self._observe(name, started)
+            read.__name__ = name
+            return read
+        raise AttributeError(name)
+
+    def _observe(self, name: str, started: float):
+        if self.metrics is not None:
+            self.metrics.histogram('db_call_seconds', 'Время вызова базы данных').observe(
+                time.perf_counter() - started, method=name
+            )
+
+    async def _submit(self, name: str, args: Tuple, kwargs: dict) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._writes.put((loop, future, name, args, kwargs))
+        return await future
+
+    def _read(self, name: str, args: Tuple, kwargs: dict) -> Any:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = Database(self.db_name, check_same_thread=False, create_tables=False)
+            self._local.db = db
+            with self._reader_lock:
+                self._reader_conns.append(db)
+        return getattr(db, name)(*args, **kwargs)
+
+    def _writer_loop(self, ready: threading.Event):
+        try:
+            db = Database(self.db_name, wal=True)
+        except BaseException as e:
+            self._init_error = e
+            ready.set()
+            return
+        ready.set()
+        stopping = False
+        while not stopping:
+            batch = [self._writes.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            if any(item is _STOP for item in batch):
+                stopping = True
+                batch = [item for item in batch if item is not _STOP]
+            if batch:
+                self._run_batch(db, batch)
+        db.close()
+
+    def _run_batch(self, db: Database, batch: List[Tuple]):
+        results = []
+        try:
+            with db.transaction():
+                for loop, future, name, args, kwargs in batch:
+                    try:
+                        with db.transaction():
+                            results.append((True, getattr(db, name)(*args, **kwargs)))
+                    except Exception as e:
+                        results.append((False, e))
+            self.commits += 1
+            self.writes += len(batch)
+        except Exception as e:
+            logger.error(f"Ошибка группового коммита: {str(e)}")
+            results = [(False, e)] * len(batch)
+        for (loop, future, _, _, _), (ok, value) in zip(batch, results):
+            loop.call_soon_threadsafe(_resolve, future, ok, value)
+
+    async def close(self):
+        """Дождаться записи очереди и закрыть соединения"""
+        self._writes.put(_STOP)
+        await asyncio.get_running_loop().run_in_executor(None, self._writer.join)
+        self._readers.shutdown(wait=True)
+        with self._reader_lock:
+            for db in self._reader_conns:
+                db.close()
+            self._reader_conns.clear()
+
+
+def _resolve(future: asyncio.Future, ok: bool, value: Any):
+    if future.cancelled():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
@@ -0,0 +1,124 @@
+import asyncio
+import unittest
+from client_pool import ClientPool, HashRing, Session
+from rate_limiter import RateGovernor
+from test_support import FakeClock
+
+
+class FakeFloodWaitError(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"A wait of {seconds} seconds is required")
+        self.seconds = seconds
+
+
+class FakeGovernor:
+    def __init__(self):
+        self.frozen = []
+
+    def freeze(self, seconds):
+        self.frozen.append(seconds)
+
+
+def make_pool(names, clock, failover_after=300):
+    sessions = [Session(name, client=None, governor=FakeGovernor(), entities=None) for name in names]
+    return ClientPool(sessions, failover_after=failover_after, clock=clock)
+
+
+class TestHashRing(unittest.TestCase):
+    def test_adding_node_moves_only_its_share(self):
+        keys = range(-1001000000000, -1001000000000 + 3000)
+        ring = HashRing(['a', 'b', 'c'])
+        before = {key: next(ring.nodes_for(key)) for key in keys}
+        ring.add('d')
+        after = {key: next(ring.nodes_for(key)) for key in keys}
+        moved = [key for key in keys if before[key] != after[key]]
+        self.assertTrue(all(after[key] == 'd' for key in moved))
+        # Новому узлу достаётся примерно четверть ключей
+        self.assertTrue(500 < len(moved) < 1000)
+
+    def test_preference_lists_every_node_once(self):
+        ring = HashRing(['a', 'b', 'c'])
+        self.assertEqual(sorted(ring.nodes_for(42)), ['a', 'b', 'c'])
+
+
+class TestClientPool(unittest.TestCase):
+    def test_long_flood_moves_channels_until_it_expires(self):
+        clock = FakeClock()
+        pool = make_pool(['main', 'extra1', 'extra2'], clock)
+        channels = range(1, 301)
+        owners = {channel: pool.session_for(channel) for channel in channels}
+        flooded = pool.sessions['extra1']
+
+        self.assertFalse(pool.report_flood(flooded, 30))
+        self.assertIs(pool.session_for(next(c for c in channels if owners[c] is flooded)), flooded)
+
+        self.assertTrue(pool.report_flood(flooded, 3600))
+        moved = {channel: pool.session_for(channel) for channel in channels}
+        for channel in channels:
+            if owners[channel] is flooded:
+                self.assertIsNot(moved[channel], flooded)
+            else:
+                self.assertIs(moved[channel], owners[channel])
+        self.assertEqual(flooded.governor.frozen, [30, 3600])
+
+        clock.now += 3601
+        self.assertEqual({c: pool.session_for(c) for c in channels}, owners)
+
+    def test_flood_on_send_fails_over(self):
+        clock = FakeClock()
+        sessions = [
+            Session(name, client=None, entities=None, governor=RateGovernor(
+                flood_errors=(FakeFloodWaitError,), max_flood_wait=300, clock=clock, sleep=clock.sleep
+            ))
+            for name in ('main', 'extra')
+        ]
+        pool = ClientPool(sessions, failover_after=300, clock=clock)
+        flooded = pool.session_for(7)
+
+        async def send():
+            raise FakeFloodWaitError(1000)
+
+        async def scenario():
+            # Ошибку глушит вызывающий (как outbox), пул узнаёт о флуде от регулятора
+            try:
+                await flooded.governor.call(7, send)
+            except FakeFloodWaitError:
+                pass
+
+        asyncio.run(scenario())
+        self.assertEqual(pool.failovers, 1)
+        self.assertIsNot(pool.session_for(7), flooded)
+        self.assertEqual((flooded.governor.flood_waits, clock.now), (1, 0.0))
+
+    def test_ready_session_skips_short_flood_pause(self):
+        clock = FakeClock()
+        sessions = [Session(name, client=None, entities=None, governor=RateGovernor(clock=clock))
+                    for name in ('main', 'extra')]
+        pool = ClientPool(sessions, failover_after=300, clock=clock)
+        owner = pool.session_for(7)
+        self.assertFalse(pool.report_flood(owner, 30))
+        # Короткий флуд канал не переносит, но отправке «прямо сейчас» нужна другая сессия
+        self.assertIs(pool.session_for(7), owner)
+        self.assertIsNot(pool.session_for(7, ready=True), owner)
+        pool.set_connected(pool.sessions['extra' if owner.name == 'main' else 'main'], False)
+        self.assertIsNone(pool.session_for(7, ready=True))
+        clock.now += 31
+        self.assertIs(pool.session_for(7, ready=True), owner)
+
+    def test_disconnect_and_primary(self):
+        clock = FakeClock()
+        pool = make_pool(['main', 'extra'], clock)
+        self.assertEqual(pool.primary.name, 'main')
+        pool.set_connected(pool.sessions['extra'], False)
+        self.assertEqual(pool.assignments(range(100)), {'main': 100, 'extra': 0})
+        pool.set_connected(pool.sessions['main'], False)
+        self.assertIsNone(pool.session_for(1))
+
+    def test_single_session_never_fails_over(self):
+        pool = make_pool(['main'], FakeClock())
+        self.assertFalse(pool.report_flood(pool.primary, 3600))
+        self.assertIs(pool.session_for(5), pool.primary)
+
+
+if __name__ == '__main__':
+    unittest.main()
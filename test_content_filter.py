@@ -0,0 +1,154 @@
+import asyncio
+import random
+import unittest
+from types import SimpleNamespace
+from content_filter import (
+    MAX_SIZE, MEDIA, REGEX, REPLACE, STRIP_LINKS, WORD, CompiledFilter, ContentFilters, FilterRule,
+    KeywordAutomaton, media_kind, required_literal
+)
+from posts import PostUnit
+from storage import AsyncDatabase
+
+
+class MessageEntityBold:
+    def __init__(self, offset, length):
+        self.offset = offset
+        self.length = length
+
+
+class MessageEntityTextUrl(MessageEntityBold):
+    pass
+
+
+class DocumentAttributeVideo:
+    pass
+
+
+class DocumentAttributeAudio:
+    def __init__(self, voice):
+        self.voice = voice
+
+
+def photo():
+    return SimpleNamespace(photo=SimpleNamespace(id=1))
+
+
+def document(*attributes, size=100):
+    return SimpleNamespace(document=SimpleNamespace(attributes=list(attributes), size=size))
+
+
+def post(caption='', media=(), entities=None, buttons=None):
+    return PostUnit(1, None, (10,), caption=caption, media=tuple(media), entities=entities, buttons=buttons)
+
+
+def rule(kind, pattern='', replacement='', source_id=None, destination_id=2):
+    return FilterRule(source_id, destination_id, kind, pattern, replacement)
+
+
+class TestKeywordAutomaton(unittest.TestCase):
+    def test_matches_like_naive_search(self):
+        rng = random.Random(3)
+        words = {''.join(rng.choice('абв') for _ in range(rng.randint(2, 5))) for _ in range(40)}
+        automaton = KeywordAutomaton(words)
+        self.assertEqual(len(automaton), len(words))
+        for _ in range(300):
+            text = ''.join(rng.choice('абвг') for _ in range(rng.randint(0, 30)))
+            self.assertEqual(set(automaton.find_all(text)), {word for word in words if word in text}, text)
+
+    def test_finds_suffix_word_inside_longer_prefix(self):
+        # «акция» обнаруживается через ссылку неудачи из «реклакц...», «кция» — как её суффикс
+        automaton = KeywordAutomaton(['реклама', 'акция', 'кция'])
+        self.assertEqual(automaton.find_all('реклакция'), ['акция', 'кция'])
+        self.assertEqual(automaton.find_all('рекла'), [])
+
+    def test_required_literal_of_regex(self):
+        self.assertEqual(
+            [required_literal(pattern) for pattern in
+             (r'Скидк[аи] \d+%', r'(?:промо)код\s+\w+', r'казино|ставки', r'\d{3,}', r'(?P<a>ёлки)(?P=a)')],
+            ['скидк', 'промокод', '', '', 'елки']
+        )
+
+
+class TestCompiledFilter(unittest.TestCase):
+    def test_blocklists(self):
+        compiled = CompiledFilter([
+            rule(WORD, 'Реклама'), rule(WORD, 'промокод'), rule(REGEX, r'скидк[аи] \d+%'),
+            rule(MEDIA, 'voice, sticker'), rule(MAX_SIZE, '1K')
+        ], media_size=lambda media: media.document.size if getattr(media, 'document', None) else 0)
+        cases = [
+            (post('Это РЕКЛАМА канала'), "слово «реклама»"),
+            (post('Скидка 50% только сегодня'), "шаблон «Скидка 50%»"),
+            (post('голос', [document(DocumentAttributeAudio(voice=True))]), "тип voice"),
+            (post('видео', [document(DocumentAttributeVideo(), size=5000)]), "файл 5000 байт больше 1024"),
+            (post('Новости дня', [photo(), document(DocumentAttributeAudio(voice=False))]), None),
+        ]
+        for item, reason in cases:
+            result, got = compiled.apply(item)
+            self.assertEqual(got, reason)
+            self.assertIs(result, None if reason else item)
+
+    def test_media_kinds(self):
+        self.assertEqual([media_kind(photo()), media_kind(document(DocumentAttributeVideo())), media_kind(document())],
+                         ['photo', 'video', 'document'])
+        blocked, reason = CompiledFilter([rule(MEDIA, 'text')]).apply(post('только текст'))
+        self.assertEqual((blocked, reason), (None, 'тип text'))
+
+    def test_rewrite_shifts_markup_in_utf16(self):
+        caption = '🔥 Подпишись: https://t.me/ads Новость дня'
+        # 🔥 занимает две единицы UTF-16: «Новость» начинается с 31-й
+        entities = [MessageEntityBold(31, 7), MessageEntityTextUrl(3, 10), MessageEntityBold(14, 16)]
+        compiled = CompiledFilter([rule(REPLACE, r'Подпишись:\s*', ''), rule(STRIP_LINKS)])
+        original = post(caption, entities=entities, buttons=['кнопка'])
+        result, reason = compiled.apply(original)
+        self.assertIsNone(reason)
+        self.assertTrue(result.edited)
+        self.assertEqual(result.caption, '🔥  Новость дня')
+        self.assertEqual([(type(e).__name__, e.offset, e.length) for e in result.entities],
+                         [('MessageEntityBold', 4, 7)])
+        self.assertEqual(result.caption.encode('utf-16-le')[8:22].decode('utf-16-le'), 'Новость')
+        self.assertIsNone(result.buttons)
+        # Исходный пост и его разметка не меняются
+        self.assertEqual((original.caption, entities[0].offset, original.edited), (caption, 31, False))
+
+    def test_untouched_post_is_returned_as_is(self):
+        compiled = CompiledFilter([rule(REPLACE, 'реклама', 'р*'), rule(STRIP_LINKS)])
+        item = post('Обычный пост')
+        self.assertIs(compiled.apply(item)[0], item)
+
+
+class TestContentFilters(unittest.TestCase):
+    def test_rules_are_scoped_stored_and_hot_reloaded(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            filters = ContentFilters(db)
+            await filters.load()
+            await filters.add(rule(WORD, 'реклама'))
+            specific = await filters.add(rule(WORD, 'спорт', source_id=7))
+            with self.assertRaises(ValueError):
+                await filters.add(rule(REGEX, '(незакрытая'))
+            item = post('Спорт')
+            results = [
+                filters.apply(7, 2, item)[1],
+                filters.apply(8, 2, item)[1],
+                filters.apply(7, 3, item)[1],
+            ]
+            # Второй процесс с той же базой замечает удаление по отметке
+            other = ContentFilters(db)
+            await other.load()
+            await filters.remove(specific.rule_id)
+            refreshed = await other.refresh()
+            results.append(other.apply(7, 2, item)[1])
+            results.append(filters.apply(7, 2, post('РЕКЛАМА'))[1])
+            stored = await db.get_filter_rules()
+            await db.close()
+            return results, refreshed, stored, filters
+
+        results, refreshed, stored, filters = asyncio.run(scenario())
+        self.assertEqual(results, ["слово «спорт»", None, None, None, "слово «реклама»"])
+        self.assertTrue(refreshed)
+        self.assertEqual([(r.source_id, r.kind, r.pattern) for r in stored], [(None, WORD, 'реклама')])
+        self.assertEqual((filters.blocked, len(filters)), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 from database import Database
-from config import ChannelConfig
+from config import ChannelConfig, RouteConfig
 from datetime import datetime
 
 class TestDatabaseMethods(unittest.TestCase):
@@ -24,5 +24,34 @@ class TestDatabaseMethods(unittest.TestCase):
         self.assertIsInstance(channels, list)
         self.assertTrue(any(c.channel_id == 123 for c in channels))
 
+    def test_forward_settings_roundtrip(self):
+        self.config.forward_mode = False
+        self.config.drop_author = False
+        self.db.add_channel(self.config)
+        channel = self.db.get_channel(123)
+        self.assertFalse(channel.forward_mode)
+        self.assertFalse(channel.drop_author)
+
+    def test_cursor_only_moves_forward(self):
+        self.db.update_cursor(123, 50)
+        stale = self.db.get_channel(123)
+        self.db.update_cursor(123, 80)
+        # Устаревшая копия настроек не откатывает курсор
+        self.db.add_channel(stale)
+        self.assertEqual(self.db.get_channel(123).last_seen_message_id, 80)
+
+    def test_routes_roundtrip(self):
+        now = datetime.now()
+        self.db.add_route(RouteConfig(123, 456, now, last_repost_date=now))
+        self.db.add_route(RouteConfig(123, 789, now, last_repost_date=now, posts_per_day=3))
+        self.db.update_route_progress(123, 456, now, 40)
+        routes = {route.destination_id: route for route in self.db.get_routes(123)}
+        self.assertEqual(set(routes), {456, 789})
+        self.assertEqual(routes[456].last_seen_message_id, 40)
+        self.assertFalse(routes[456].has_schedule)
+        self.assertEqual(routes[789].posts_per_day, 3)
+        self.assertTrue(self.db.delete_route(123, 789))
+        self.assertIsNone(self.db.get_route(123, 789))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from database import Database
+from dedup import BloomFilter, RepostLedger, post_key
+from storage import AsyncDatabase
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        keys = [(1, 2, i) for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum((3, 4, i) in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestRepostLedger(unittest.TestCase):
+    def test_post_key_uses_album_id(self):
+        album = [SimpleNamespace(id=5, grouped_id=77), SimpleNamespace(id=6, grouped_id=77)]
+        self.assertEqual(post_key(album), 77)
+        self.assertEqual(post_key([SimpleNamespace(id=9, grouped_id=None)]), 9)
+
+    def test_marks_and_filters_without_db_for_new_keys(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            ledger = RepostLedger(db, bloom_capacity=1000)
+            await ledger.load()
+            groups = [[SimpleNamespace(id=i, grouped_id=None)] for i in range(10)]
+            fresh = await ledger.filter_new(1, 2, groups)
+            lookups_before_mark = ledger.db_lookups
+            await ledger.mark(1, 2, [post_key(group) for group in fresh[:4]])
+            remaining = await ledger.filter_new(1, 2, groups)
+            other_route = await ledger.filter_new(1, 3, groups)
+            await db.close()
+            return fresh, lookups_before_mark, remaining, other_route
+
+        fresh, lookups, remaining, other_route = asyncio.run(scenario())
+        self.assertEqual(len(fresh), 10)
+        self.assertEqual(lookups, 0)
+        self.assertEqual([group[0].id for group in remaining], [4, 5, 6, 7, 8, 9])
+        self.assertEqual(len(other_route), 10)
+
+    def test_survives_restart_and_prunes(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            await db.mark_reposted_many([(1, 2, 10)])
+            ledger = RepostLedger(db, bloom_capacity=1000)
+            await ledger.load()
+            seen = await ledger.is_reposted(1, 2, 10)
+            ledger.retention = timedelta(days=-1)
+            removed = await ledger.prune()
+            after = await ledger.is_reposted(1, 2, 10)
+            await db.close()
+            return seen, removed, after
+
+        seen, removed, after = asyncio.run(scenario())
+        self.assertTrue(seen)
+        self.assertEqual(removed, 1)
+        self.assertFalse(after)
+
+    def test_old_table_is_migrated(self):
+        # База прежних версий: таблица без source_id, версий схемы ещё нет
+        db = Database(':memory:', create_tables=False)
+        db.conn.execute('''
+            CREATE TABLE reposted_messages (
+                message_id INTEGER, channel_id INTEGER, repost_date TEXT NOT NULL,
+                PRIMARY KEY (message_id, channel_id)
+            )
+        ''')
+        db.conn.execute("INSERT INTO reposted_messages VALUES (5, 7, ?)", (datetime.now().isoformat(),))
+        db._create_tables()
+        self.assertTrue(db.is_reposted(5, 7))
+        self.assertTrue(db.is_reposted(5, 7, source_id=7))
+
+
+if __name__ == '__main__':
+    unittest.main()
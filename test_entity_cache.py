@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from storage import AsyncDatabase
+from entity_cache import EntityCache
+from test_support import FakeClock
+
+
+class Resolver:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, key):
+        self.calls.append(key)
+        await asyncio.sleep(0)
+        return ('entity', key)
+
+
+def make_cache(db, resolver, clock, ttl=60):
+    return EntityCache(
+        resolver, db, ttl=ttl, persist_ttl=3600,
+        to_row=lambda entity: ('channel', entity[1], 42),
+        from_row=lambda row: ('peer', row[1]),
+        clock=clock
+    )
+
+
+class TestEntityCache(unittest.TestCase):
+    def test_hits_misses_and_ttl(self):
+        clock = FakeClock(1_000_000.0)
+        resolver = Resolver()
+
+        async def scenario():
+            cache = EntityCache(resolver, ttl=60, clock=clock)
+            await cache.get(1)
+            await cache.get(1)
+            clock.now += 61
+            await cache.get(1)
+            return cache
+
+        cache = asyncio.run(scenario())
+        self.assertEqual(resolver.calls, [1, 1])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_concurrent_misses_resolve_once(self):
+        resolver = Resolver()
+
+        async def scenario():
+            cache = EntityCache(resolver)
+            return await asyncio.gather(*(cache.get(5) for _ in range(10)))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(resolver.calls, [5])
+        self.assertEqual(set(results), {('entity', 5)})
+
+    def test_cancelled_persist_keeps_its_error(self):
+        class CancellingDb:
+            async def save_entity(self, *row):
+                raise asyncio.CancelledError()
+
+        async def scenario():
+            cache = make_cache(CancellingDb(), Resolver(), FakeClock(1_000_000.0))
+            with self.assertRaises(asyncio.CancelledError):
+                await cache.get(-1001)
+            return cache
+
+        cache = asyncio.run(scenario())
+        self.assertEqual(cache.peek(-1001), ('entity', -1001))
+        self.assertEqual(cache._inflight, {})
+
+    def test_warm_restart_needs_no_resolution(self):
+        clock = FakeClock(1_000_000.0)
+
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            first = make_cache(db, Resolver(), clock)
+            await first.get(-1001)
+            restarted_resolver = Resolver()
+            restarted = make_cache(db, restarted_resolver, clock)
+            await restarted.load()
+            entity = await restarted.get(-1001)
+            await restarted.invalidate(-1001)
+            rows = await db.get_entities()
+            await db.close()
+            return entity, restarted_resolver.calls, rows
+
+        entity, calls, rows = asyncio.run(scenario())
+        self.assertEqual(entity, ('peer', -1001))
+        self.assertEqual(calls, [])
+        self.assertEqual(rows, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
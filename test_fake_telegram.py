@@ -0,0 +1,129 @@
+import asyncio
+import re
+import time
+import unittest
+from fake_telegram import FakeTelegram, run_virtual
+from posts import group_stream
+
+
+class NewMessage:
+    """Как events.NewMessage Telethon: pattern хранится как метод match"""
+
+    def __init__(self, pattern=None, func=None):
+        self.pattern = re.compile(pattern).match if pattern else None
+        self.func = func
+
+
+class Album:
+    def __init__(self, func=None):
+        self.func = func
+
+
+class TestVirtualClock(unittest.TestCase):
+    def test_sleep_advances_virtual_time_only(self):
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await asyncio.sleep(86400)
+            return loop.time() - started
+
+        real = time.perf_counter()
+        self.assertAlmostEqual(run_virtual(scenario(), start=0), 86400, places=3)
+        self.assertLess(time.perf_counter() - real, 1)
+
+    def test_clock_stands_while_threads_work(self):
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            timer = asyncio.create_task(asyncio.sleep(1000))
+            await asyncio.to_thread(time.sleep, 0.05)
+            during = loop.time() - started
+            await timer
+            return during
+
+        self.assertLess(run_virtual(scenario(), start=0), 1)
+
+
+class TestFakeTelegram(unittest.TestCase):
+    def run_backend(self, scenario, **kwargs):
+        async def main():
+            backend = FakeTelegram(clock=asyncio.get_running_loop().time, **kwargs)
+            return backend, await scenario(backend)
+        return run_virtual(main(), start=1_700_000_000)
+
+    def test_history_pages_and_forward(self):
+        async def scenario(backend):
+            source = backend.add_channel(1, posts=150, album_ratio=0.3)
+            target = backend.add_channel(2)
+            client = backend.client('main')
+            entity = await client.get_entity(source)
+            posts = [post async for post in group_stream(client.iter_messages(entity, min_id=0, reverse=True))]
+            page = await client.get_messages(entity, limit=5, min_id=posts[10].last_id, reverse=True)
+            album = next(post for post in posts if post.grouped_id)
+            copies = await client.forward_messages(target, list(album.ids), from_peer=entity)
+            return posts, page, album, copies
+
+        backend, (posts, page, album, copies) = self.run_backend(scenario)
+        self.assertEqual(len(posts), 150)
+        self.assertEqual([msg.id for msg in page], list(range(posts[10].last_id + 1, posts[10].last_id + 6)))
+        self.assertEqual([copy.id for copy in copies], list(range(1, len(album) + 1)))
+        self.assertEqual(len({copy.grouped_id for copy in copies}), 1)
+        self.assertNotEqual(copies[0].grouped_id, album.grouped_id)
+        history = len(backend.history(posts[0].chat_id))
+        self.assertEqual(backend.calls['get_messages'], -(-history // 100) + 1)
+        self.assertEqual(backend.calls['forward_messages'], 1)
+
+    def test_latency_and_flood_injection(self):
+        async def scenario(backend):
+            loop = asyncio.get_running_loop()
+            target = backend.add_channel(2)
+            client = backend.client('main')
+            started = loop.time()
+            backend.inject_flood('send_message', 42)
+            try:
+                await client.send_message(target, 'раз')
+                error = None
+            except Exception as e:
+                error = e
+            await client.send_message(target, 'два')
+            return error, loop.time() - started
+
+        backend, (error, elapsed) = self.run_backend(scenario, latency=0.25)
+        self.assertEqual(error.seconds, 42)
+        self.assertAlmostEqual(elapsed, 0.5, places=3)
+        self.assertEqual(backend.floods['send_message'], 1)
+        self.assertEqual([msg.message for msg in backend.history(-10 ** 12 - 2)], ['два'])
+
+    def test_event_dispatch(self):
+        async def scenario(backend):
+            source = backend.add_channel(1)
+            client = backend.client('main')
+            seen = []
+
+            @client.on(NewMessage(pattern='/ping'))
+            async def ping(event):
+                await event.reply(f"pong {event.pattern_match.group(0)}")
+
+            @client.on(NewMessage(func=lambda e: e.chat_id == source and not e.message.grouped_id))
+            async def single(event):
+                seen.append(('single', event.message.id))
+
+            @client.on(Album(func=lambda e: e.chat_id == source))
+            async def album(event):
+                seen.append(('album', [msg.id for msg in event.messages]))
+
+            await client.start()
+            replies = await backend.command('/ping')
+            ignored = await backend.command('/other')
+            await backend.publish(1, 'одиночный пост')
+            await backend.publish(1, 'альбом', media_count=3)
+            return replies, ignored, seen
+
+        _, (replies, ignored, seen) = self.run_backend(scenario)
+        self.assertEqual(replies, ['pong /ping'])
+        self.assertEqual(ignored, [])
+        self.assertEqual(seen, [('single', 1), ('album', [2, 3, 4])])
+
+
+if __name__ == '__main__':
+    unittest.main()
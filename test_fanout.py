@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+from fanout import SourceBuffer, group_page
+
+
+class Msg:
+    def __init__(self, id, grouped_id=None):
+        self.id = id
+        self.grouped_id = grouped_id
+
+    def __repr__(self):
+        return f"Msg({self.id})"
+
+
+class FakeHistory:
+    def __init__(self, messages):
+        self.messages = messages
+        self.calls = []
+
+    async def __call__(self, source_id, min_id, limit):
+        self.calls.append((source_id, min_id))
+        await asyncio.sleep(0)
+        return [msg for msg in self.messages if msg.id > min_id][:limit]
+
+
+async def read(buffer, source_id, after_id, count):
+    """Прочитать count постов как один маршрут и сдвинуть его курсор"""
+    ids = []
+    async for post in buffer.posts(source_id, after_id):
+        ids.append(list(post.ids))
+        if len(ids) == count:
+            break
+    return ids
+
+
+class TestSourceBuffer(unittest.TestCase):
+    def test_page_keeps_trailing_album_for_next_page(self):
+        page = [Msg(1), Msg(2, 7), Msg(3, 7)]
+        self.assertEqual([list(p.ids) for p in group_page(page, full=True)], [[1]])
+        self.assertEqual([list(p.ids) for p in group_page(page, full=False)], [[1], [2, 3]])
+
+    def test_many_destinations_share_one_fetch(self):
+        history = FakeHistory([Msg(i) for i in range(1, 51)])
+
+        async def scenario():
+            buffer = SourceBuffer(history, page_size=20)
+            for destination in range(30):
+                buffer.advance(1, destination, 0)
+            results = []
+            for destination in range(30):
+                results.append(await read(buffer, 1, 0, 5))
+                buffer.advance(1, destination, 5)
+            return buffer, results
+
+        buffer, results = asyncio.run(scenario())
+        self.assertEqual(history.calls, [(1, 0)])
+        self.assertTrue(all(ids == [[1], [2], [3], [4], [5]] for ids in results))
+        # Все читатели прошли пятый пост — он и более ранние выброшены
+        self.assertEqual(len(buffer), 15)
+
+    def test_concurrent_readers_and_album_boundaries(self):
+        messages = [Msg(1), Msg(2), Msg(3, 9), Msg(4, 9), Msg(5, 9), Msg(6)]
+        history = FakeHistory(messages)
+
+        async def scenario():
+            buffer = SourceBuffer(history, page_size=4, tail_ttl=60)
+            results = await asyncio.gather(*(read(buffer, 1, 0, 10) for _ in range(5)))
+            again = await read(buffer, 1, 6, 10)
+            return results, again
+
+        results, again = asyncio.run(scenario())
+        for ids in results:
+            self.assertEqual(ids, [[1], [2], [3, 4, 5], [6]])
+        self.assertEqual(again, [])
+        # Две страницы на всех пятерых: альбом на границе страниц не перезагружается,
+        # а неполная вторая страница уже проверила конец истории
+        self.assertEqual(history.calls, [(1, 0), (1, 4)])
+
+    def test_lagging_reader_gets_own_segment(self):
+        history = FakeHistory([Msg(i) for i in range(1, 1001)])
+
+        async def scenario():
+            buffer = SourceBuffer(history, page_size=10, max_posts=20)
+            await read(buffer, 1, 900, 3)
+            buffer.advance(1, 'ahead', 903)
+            behind = await read(buffer, 1, 0, 3)
+            buffer.advance(1, 'behind', 3)
+            ahead = await read(buffer, 1, 903, 3)
+            return behind, ahead, len(buffer.segments[1])
+
+        behind, ahead, segments = asyncio.run(scenario())
+        self.assertEqual(behind, [[1], [2], [3]])
+        self.assertEqual(ahead, [[904], [905], [906]])
+        self.assertEqual(segments, 2)
+        self.assertEqual(len(history.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+from jobs import CANCELLED, DONE, PAUSED, QUEUED, RUNNING, JobManager, RepostJob
+from storage import AsyncDatabase
+
+
+class StepRunner:
+    """Раннер, который отправляет по одному «сообщению» за шаг"""
+
+    def __init__(self):
+        self.manager = None
+        self.active = 0
+        self.max_active = 0
+        self.started = []
+
+    async def __call__(self, job):
+        self.started.append((job.job_id, job.checkpoint))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            for message_id in range(job.checkpoint + 1, job.limit + 1):
+                await asyncio.sleep(0.01)
+                await self.manager.checkpoint(job, message_id, 1)
+        finally:
+            self.active -= 1
+
+
+async def make_manager(db, concurrency=2):
+    runner = StepRunner()
+    manager = JobManager(db, runner, concurrency=concurrency)
+    runner.manager = manager
+    return manager, runner
+
+
+async def wait_for_status(manager, job_id, status):
+    for _ in range(500):
+        job = await manager.get(job_id)
+        if job.status == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not reach {status}")
+
+
+class TestJobManager(unittest.TestCase):
+    def test_runs_with_concurrency_limit(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            manager, runner = await make_manager(db, concurrency=2)
+            manager.start()
+            jobs = [await manager.submit(RepostJob('fast', 1, 2, limit=3)) for _ in range(4)]
+            for job in jobs:
+                await wait_for_status(manager, job.job_id, DONE)
+            await manager.stop()
+            await db.close()
+            return runner, jobs
+
+        runner, jobs = asyncio.run(scenario())
+        self.assertEqual(runner.max_active, 2)
+        self.assertTrue(all(job.sent_count == 3 for job in jobs))
+
+    def test_pause_resume_cancel(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            manager, runner = await make_manager(db)
+            manager.start()
+            job = await manager.submit(RepostJob('slow', 1, 2, limit=50))
+            await asyncio.sleep(0.05)
+            self.assertTrue(await manager.pause(job.job_id))
+            paused_at = job.checkpoint
+            await asyncio.sleep(0.05)
+            self.assertEqual(job.checkpoint, paused_at)
+            self.assertEqual(job.status, PAUSED)
+            self.assertTrue(await manager.resume(job.job_id))
+            await asyncio.sleep(0.05)
+            self.assertTrue(await manager.cancel(job.job_id))
+            stored = await db.get_job(job.job_id)
+            await manager.stop()
+            await db.close()
+            return runner, job, stored, paused_at
+
+        runner, job, stored, paused_at = asyncio.run(scenario())
+        self.assertEqual(runner.started[1], (job.job_id, paused_at))
+        self.assertEqual(stored.status, CANCELLED)
+        self.assertLess(stored.sent_count, 50)
+
+    def test_resume_from_checkpoint_after_restart(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            manager, _ = await make_manager(db)
+            manager.start()
+            job = await manager.submit(RepostJob('fast', 1, 2, limit=30))
+            await asyncio.sleep(0.05)
+            await manager.stop()
+            interrupted = await db.get_job(job.job_id)
+
+            restarted, runner = await make_manager(db)
+            await restarted.restore()
+            restarted.start()
+            finished = await wait_for_status(restarted, job.job_id, DONE)
+            await restarted.stop()
+            await db.close()
+            return interrupted, runner, finished
+
+        interrupted, runner, finished = asyncio.run(scenario())
+        self.assertIn(interrupted.status, (RUNNING, QUEUED))
+        self.assertGreater(interrupted.checkpoint, 0)
+        self.assertEqual(runner.started[0][1], interrupted.checkpoint)
+        self.assertEqual(finished.sent_count, 30)
+        self.assertGreater(finished.throughput(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+from config import ChannelConfig
+from database import Database
+from leases import LeaseManager, channel_resource, parse_resource
+from storage import AsyncDatabase
+from test_support import FakeClock
+
+CHANNELS = 12
+
+
+def make_db(path=':memory:'):
+    db = Database(path, wal=path != ':memory:')
+    now = datetime.now(timezone.utc)
+    for channel_id in range(1, CHANNELS + 1):
+        db.add_channel(ChannelConfig(channel_id=channel_id, posts_per_day=1, start_date=now))
+    return db
+
+
+class TestLeases(unittest.TestCase):
+    def test_token_grows_only_when_owner_changes(self):
+        db = make_db()
+        self.assertEqual(db.acquire_lease('channel:1', 'a', 0, 10), 1)
+        self.assertEqual(db.acquire_lease('channel:1', 'a', 5, 10), 1)
+        self.assertIsNone(db.acquire_lease('channel:1', 'b', 6, 10))
+        # Аренда истекла — другой процесс забирает её с новым токеном
+        self.assertEqual(db.acquire_lease('channel:1', 'b', 20, 10), 2)
+        self.assertFalse(db.renew_lease('channel:1', 'a', 1, 21, 10))
+        db.release_lease('channel:1', 'b')
+        self.assertEqual(db.acquire_lease('channel:1', 'a', 22, 10), 3)
+
+    def test_stale_owner_write_is_rejected(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            await db.add_channel(make_db().get_channel(1))
+            clock = FakeClock(1000.0)
+            first = LeaseManager(db, 'a', ttl=10, clock=clock)
+            second = LeaseManager(db, 'b', ttl=10, clock=clock)
+            await first.sync([channel_resource(1)])
+            stale = first.fence(channel_resource(1))
+            accepted = await db.update_cursor(1, 10, stale)
+            # Первый процесс завис дольше TTL, второй забрал канал
+            clock.now += 11
+            acquired, _ = await second.sync([channel_resource(1)])
+            rejected = await db.update_cursor(1, 20, stale)
+            fresh = await db.update_cursor(1, 30, second.fence(channel_resource(1)))
+            _, lost = await first.sync([channel_resource(1)])
+            cursor = (await db.get_channel(1)).last_seen_message_id
+            await db.close()
+            return accepted, acquired, rejected, fresh, lost, cursor
+
+        accepted, acquired, rejected, fresh, lost, cursor = asyncio.run(scenario())
+        self.assertTrue(accepted)
+        self.assertEqual(acquired, [channel_resource(1)])
+        self.assertFalse(rejected)
+        self.assertTrue(fresh)
+        self.assertEqual(lost, [channel_resource(1)])
+        self.assertEqual(cursor, 30)
+
+    def test_new_process_takes_fair_share(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            clock = FakeClock(1000.0)
+            resources = [channel_resource(i) for i in range(1, CHANNELS + 1)]
+            first = LeaseManager(db, 'a', ttl=10, clock=clock)
+            second = LeaseManager(db, 'b', ttl=10, clock=clock)
+            await first.sync(resources)
+            held_alone = len(first.held)
+            await second.sync(resources)
+            # Первый видит второй процесс и отдаёт лишнее, второй забирает
+            await first.sync(resources)
+            await second.sync(resources)
+            await db.close()
+            return held_alone, set(first.held), set(second.held)
+
+        held_alone, first, second = asyncio.run(scenario())
+        self.assertEqual(held_alone, CHANNELS)
+        self.assertEqual(len(first), CHANNELS // 2)
+        self.assertEqual(len(second), CHANNELS // 2)
+        self.assertFalse(first & second)
+
+
+def _worker(path, owner, duration, results):
+    """Процесс бота в миниатюре: продлевает аренду и пишет курсоры своих каналов"""
+    async def run():
+        db = AsyncDatabase(path)
+        leases = LeaseManager(db, owner, ttl=0.6)
+        resources = [channel_resource(i) for i in range(1, CHANNELS + 1)]
+        deadline = time.time() + duration
+        step = 0
+        while time.time() < deadline:
+            await leases.sync(resources)
+            step += 1
+            for resource in list(leases.held):
+                if not leases.holds(resource):
+                    continue
+                fence = leases.fence(resource)
+                if await db.update_cursor(parse_resource(resource)[1][0], step, fence):
+                    results.put(('write', owner, resource, fence.token))
+            await asyncio.sleep(0.1)
+        results.put(('held', owner, sorted(leases.held)))
+        await leases.release_all()
+        await db.close()
+
+    asyncio.run(run())
+
+
+class TestLeasesAcrossProcesses(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'channels.db')
+        make_db(self.path).conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_crashed_process_channels_move_to_survivors(self):
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        workers = {
+            owner: ctx.Process(target=_worker, args=(self.path, owner, 4.0, results))
+            for owner in ('w1', 'w2', 'w3')
+        }
+        for worker in workers.values():
+            worker.start()
+        time.sleep(2.0)
+        workers['w1'].terminate()
+        workers['w1'].join()
+
+        owners = {}
+        crashed = set()
+        held = {}
+        finished = 0
+        while finished < 2:
+            message = results.get(timeout=30)
+            if message[0] == 'held':
+                held[message[1]] = set(message[2])
+                finished += 1
+                continue
+            _, owner, resource, token = message
+            # Один токен — один владелец: двух хозяев канала не бывает
+            self.assertEqual(owners.setdefault((resource, token), owner), owner)
+            if owner == 'w1':
+                crashed.add(resource)
+        for worker in workers.values():
+            worker.join(timeout=30)
+
+        self.assertTrue(crashed)
+        self.assertFalse(held['w2'] & held['w3'])
+        all_channels = {channel_resource(i) for i in range(1, CHANNELS + 1)}
+        self.assertEqual(held['w2'] | held['w3'], all_channels)
+        survivors = {resource for (resource, _), owner in owners.items() if owner != 'w1'}
+        self.assertTrue(crashed <= survivors)
+
+
+if __name__ == '__main__':
+    unittest.main()
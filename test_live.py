@@ -0,0 +1,57 @@
+import unittest
+from types import SimpleNamespace
+from live import LiveFeed
+from posts import PostUnit
+
+
+def post(*ids):
+    return PostUnit.from_messages([SimpleNamespace(id=i) for i in ids])
+
+
+class TestLiveFeed(unittest.TestCase):
+    def setUp(self):
+        self.feed = LiveFeed(maxlen=3)
+        self.feed.subscribe(1)
+
+    def test_first_pass_is_catchup(self):
+        self.assertTrue(self.feed.needs_catchup(1))
+        self.feed.caught_up(1, 10)
+        self.assertFalse(self.feed.needs_catchup(1))
+
+    def test_queue_in_order_and_skips_seen(self):
+        self.feed.caught_up(1, 10)
+        self.assertTrue(self.feed.push(1, post(11)))
+        self.assertTrue(self.feed.push(1, post(12, 13)))
+        self.assertEqual(self.feed.pop(1, after_id=11).ids, (12, 13))
+        self.assertIsNone(self.feed.pop(1))
+        self.assertFalse(self.feed.needs_catchup(1))
+
+    def test_overflow_requests_catchup(self):
+        self.feed.caught_up(1, 0)
+        for i in range(1, 4):
+            self.assertTrue(self.feed.push(1, post(i)))
+        self.assertFalse(self.feed.push(1, post(4)))
+        self.assertTrue(self.feed.needs_catchup(1))
+
+    def test_id_gap_requests_catchup(self):
+        self.feed.caught_up(1, 10)
+        self.feed.push(1, post(11))
+        self.assertFalse(self.feed.needs_catchup(1))
+        self.feed.push(1, post(15))
+        self.assertTrue(self.feed.needs_catchup(1))
+
+    def test_unsubscribed_channel_is_ignored(self):
+        self.assertFalse(self.feed.push(2, post(1)))
+        self.assertNotIn(2, self.feed)
+
+    def test_reconnect_marks_all_channels(self):
+        self.feed.subscribe(2)
+        self.feed.caught_up(1, 0)
+        self.feed.caught_up(2, 0)
+        self.feed.request_catchup()
+        self.assertTrue(self.feed.needs_catchup(1))
+        self.assertTrue(self.feed.needs_catchup(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
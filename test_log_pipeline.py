@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+from log_pipeline import LogPipeline, SamplingFilter, bind
+
+
+class SlowHandler(logging.Handler):
+    """Обработчик с медленным диском"""
+
+    def emit(self, record):
+        time.sleep(0.02)
+
+
+class Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestLogPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'bot.log')
+        self.level = logging.getLogger().level
+
+    def tearDown(self):
+        logging.getLogger().setLevel(self.level)
+        self.tmp.cleanup()
+
+    def read(self, path=None):
+        with open(path or self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_json_records_carry_task_context(self):
+        logs = LogPipeline(self.path, console=False).start()
+        log = logging.getLogger('test.context')
+
+        async def process(channel_id):
+            bind(channel_id=channel_id)
+            await asyncio.sleep(0)
+            log.info(f"Отправлен пост из канала {channel_id}", extra={'message_id': 7, 'duration_ms': 12.5})
+
+        async def scenario():
+            await asyncio.gather(process(1), process(2))
+            log.warning("вне обработки канала")
+
+        asyncio.run(scenario())
+        logs.stop()
+        records = self.read()
+        self.assertEqual(
+            [(r['message'], r.get('channel_id'), r.get('message_id'), r['level']) for r in records],
+            [('Отправлен пост из канала 1', 1, 7, 'INFO'), ('Отправлен пост из канала 2', 2, 7, 'INFO'),
+             ('вне обработки канала', None, None, 'WARNING')]
+        )
+        self.assertEqual(records[0]['logger'], 'test.context')
+        self.assertEqual(records[0]['duration_ms'], 12.5)
+
+    def test_exception_goes_to_its_own_field(self):
+        logs = LogPipeline(self.path, console=False).start()
+        try:
+            raise ValueError('нет соединения')
+        except ValueError:
+            logging.getLogger('test.exc').exception("Ошибка отправки")
+        logs.stop()
+        record, = self.read()
+        self.assertEqual(record['message'], 'Ошибка отправки')
+        self.assertIn('ValueError: нет соединения', record['exc'])
+
+    def test_repeated_errors_are_sampled_per_call_site(self):
+        now = [0.0]
+        log = logging.Logger('test.sampling')
+        collect = Collect()
+        sampling = SamplingFilter(limit=3, window=60, clock=lambda: now[0])
+        collect.addFilter(sampling)
+        log.addHandler(collect)
+
+        def storm(count):
+            for channel_id in range(count):
+                log.error(f"Ошибка отправки в канал {channel_id}")
+
+        storm(10)
+        log.info("обычная запись не ограничивается")
+        log.error("другое место вызова")
+        now[0] = 61
+        storm(1)
+        messages = [record.getMessage() for record in collect.records]
+        self.assertEqual(messages[:3], [f"Ошибка отправки в канал {i}" for i in range(3)])
+        self.assertEqual(messages[3:], ["обычная запись не ограничивается", "другое место вызова",
+                                        "Ошибка отправки в канал 0"])
+        self.assertEqual(collect.records[-1].suppressed, 7)
+        self.assertEqual(sampling.suppressed, 7)
+
+    def test_file_is_rotated(self):
+        logs = LogPipeline(self.path, max_bytes=2000, backups=2, console=False, sample_limit=0).start()
+        log = logging.getLogger('test.rotation')
+        for index in range(200):
+            log.info(f"запись {index} " + 'x' * 50)
+        logs.stop()
+        names = sorted(os.listdir(self.tmp.name))
+        self.assertEqual(names, ['bot.log', 'bot.log.1', 'bot.log.2'])
+        self.assertTrue(all(os.path.getsize(os.path.join(self.tmp.name, name)) <= 2000 for name in names))
+        self.assertEqual(self.read()[-1]['message'], "запись 199 " + 'x' * 50)
+
+    def test_slow_disk_does_not_block_caller(self):
+        logs = LogPipeline(self.path, console=False, sample_limit=0, queue_size=20)
+        logs.listener.handlers += (SlowHandler(),)
+        logs.start()
+        log = logging.getLogger('test.slow')
+        started = time.perf_counter()
+        for index in range(100):
+            log.error(f"ошибка {index}")
+        elapsed = time.perf_counter() - started
+        logs.stop()
+        # 100 записей по 20 мс — это 2 с; вызывающий не ждёт диск, лишнее отбрасывается
+        self.assertLess(elapsed, 0.5)
+        self.assertGreater(logs.handler.dropped, 0)
+        self.assertEqual(len(self.read()), 100 - logs.handler.dropped)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import unittest
+from media_cache import DiskLRU, MediaCache
+from storage import AsyncDatabase
+
+
+class FakeSource:
+    """Файл в «Telegram»: отдаёт диапазоны байт и считает запросы"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    async def read_range(self, offset, length):
+        self.requests.append((offset, length))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.001)
+        self.active -= 1
+        return self.data[offset:offset + length] if length else self.data[offset:]
+
+
+class TestDiskLRU(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def put(self, store, data: bytes) -> str:
+        temp = store.temp_path()
+        with open(temp, 'wb') as f:
+            f.write(data)
+        digest = hashlib.sha256(data).hexdigest()
+        store.put(temp, digest, '.bin')
+        return digest
+
+    def test_evicts_least_recently_used(self):
+        store = DiskLRU(self.tmp.name, max_bytes=250)
+        first = self.put(store, b'a' * 100)
+        second = self.put(store, b'b' * 100)
+        store.get(first)
+        third = self.put(store, b'c' * 100)
+        self.assertIn(first, store)
+        self.assertNotIn(second, store)
+        self.assertIn(third, store)
+        self.assertEqual(store.size, 200)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 2)
+        # После перезапуска содержимое каталога подхватывается
+        restored = DiskLRU(self.tmp.name, max_bytes=250)
+        restored.scan()
+        self.assertEqual(restored.size, 200)
+
+    def test_directory_is_created_on_first_use(self):
+        directory = os.path.join(self.tmp.name, 'media')
+        store = DiskLRU(directory, max_bytes=250)
+        self.assertFalse(os.path.exists(directory))
+        self.put(store, b'a' * 10)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+
+class TestMediaCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'channels.db')
+        self.media_dir = os.path.join(self.tmp.name, 'media')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parallel_chunked_download_is_shared(self):
+        data = os.urandom(10_000)
+        source = FakeSource(data)
+
+        async def scenario():
+            db = AsyncDatabase(self.db_path)
+            cache = MediaCache(db, DiskLRU(self.media_dir, 1 << 20), part_size=1024, parallel=4)
+            results = await asyncio.gather(*(
+                cache.fetch('document:1', len(data), source.read_range, '.mp4') for _ in range(5)
+            ))
+            again = await cache.fetch('document:1', len(data), source.read_range, '.mp4')
+            await db.close()
+            return cache, results, again
+
+        cache, results, again = asyncio.run(scenario())
+        digest, path = results[0]
+        self.assertEqual(set(results), {(digest, path)})
+        self.assertEqual(again, (digest, path))
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertTrue(path.endswith('.mp4'))
+        # Одно скачивание из 10 частей, не больше 4 одновременно
+        self.assertEqual(cache.downloads, 1)
+        self.assertEqual(len(source.requests), 10)
+        self.assertLessEqual(source.max_active, 4)
+        self.assertGreater(source.max_active, 1)
+        self.assertEqual(cache.disk_hits, 1)
+
+    def test_upload_reused_for_same_content_after_restart(self):
+        data = b'x' * 3000
+
+        async def scenario():
+            db = AsyncDatabase(self.db_path)
+            cache = MediaCache(db, DiskLRU(self.media_dir, 1 << 20), part_size=1024)
+            digest, _ = await cache.fetch('document:1', len(data), FakeSource(data).read_range)
+            await cache.remember_upload('main', digest, ('document', 7, 8, b'ref'))
+            # Тот же файл из другого источника — другой ключ, то же содержимое
+            await cache.fetch('document:2', len(data), FakeSource(data).read_range)
+            await db.close()
+
+            db = AsyncDatabase(self.db_path)
+            restored = MediaCache(db, DiskLRU(self.media_dir, 1 << 20))
+            await restored.load()
+            hits = (
+                restored.uploaded('main', 'document:1'),
+                restored.uploaded('main', 'document:2'),
+                restored.uploaded('other', 'document:1'),
+            )
+            await restored.forget_upload('main', 'document:1')
+            forgotten = restored.uploaded('main', 'document:2')
+            await db.close()
+            return cache, hits, forgotten
+
+        cache, hits, forgotten = asyncio.run(scenario())
+        self.assertEqual(cache.downloads, 2)
+        self.assertEqual(len(cache.store), 1)
+        self.assertEqual(hits[0], ('document', 7, 8, b'ref'))
+        self.assertEqual(hits[1], ('document', 7, 8, b'ref'))
+        # Ссылки привязаны к сессии, загрузившей файл
+        self.assertIsNone(hits[2])
+        self.assertIsNone(forgotten)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from metrics import Metrics, Profiler, WindowCounter, start_exporter, timed
+
+
+class Sender:
+    def __init__(self):
+        self.metrics = Metrics()
+
+    @timed('send', 'Отправка')
+    async def send(self, ok):
+        if ok is None:
+            raise RuntimeError('boom')
+        return ['sent'] if ok else []
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render_prometheus_text(self):
+        metrics = Metrics()
+        metrics.counter('posts_total', 'Посты').inc(channel=1)
+        metrics.counter('posts_total').inc(2, channel=1)
+        metrics.gauge('backlog', 'Очередь', lambda: {10: 3})
+        histogram = metrics.histogram('latency_seconds', 'Задержка', buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        text = metrics.render()
+        self.assertIn('# TYPE posts_total counter', text)
+        self.assertIn('posts_total{channel="1"} 3', text)
+        self.assertIn('backlog{channel="10"} 3', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count 3', text)
+        self.assertEqual(histogram.quantile(0.5), 1)
+        self.assertEqual(histogram.quantile(1.0), 5)
+
+    def test_component_totals_are_counters(self):
+        metrics = Metrics()
+        sends = {'main': 5}
+        metrics.total('sends', 'Отправки', lambda: sends, label='session')
+        metrics.gauge('rate', 'Лимит', lambda: 0.5)
+        text = metrics.render()
+        self.assertIn('# TYPE sends_total counter', text)
+        self.assertIn('sends_total{session="main"} 5', text)
+        self.assertIn('# TYPE rate gauge', text)
+        self.assertIs(metrics.total('sends_total'), metrics.metrics['sends_total'])
+
+    def test_timed_records_outcomes(self):
+        async def scenario():
+            sender = Sender()
+            await sender.send(True)
+            await sender.send(False)
+            with self.assertRaises(RuntimeError):
+                await sender.send(None)
+            return sender.metrics
+
+        metrics = asyncio.run(scenario())
+        calls = metrics.counter('send_total')
+        self.assertEqual([calls.value(outcome=o) for o in ('ok', 'empty', 'error')], [1, 1, 1])
+        self.assertEqual(metrics.histogram('send_seconds').count(), 3)
+        self.assertEqual(metrics.histogram('send_seconds').help, 'Отправка')
+
+    def test_window_counter_forgets_old_events(self):
+        now = [0.0]
+        counter = WindowCounter(60, clock=lambda: now[0])
+        counter.add('a')
+        now[0] = 30
+        counter.add('a')
+        now[0] = 70
+        self.assertEqual(counter.counts(), {'a': 1})
+
+    def test_profiler_toggles_at_runtime(self):
+        profiler = Profiler()
+        self.assertIsNone(profiler.stop())
+        self.assertTrue(profiler.start())
+        self.assertFalse(profiler.start())
+        sum(range(1000))
+        self.assertIn('function calls', profiler.stop())
+        self.assertFalse(profiler.active)
+
+    def test_exporter_serves_metrics(self):
+        async def scenario():
+            metrics = Metrics()
+            metrics.counter('hits_total', 'Попадания').inc()
+            server = await start_exporter(metrics, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            responses = []
+            for path in ('/metrics', '/other'):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+                responses.append((await reader.read()).decode())
+                writer.close()
+            server.close()
+            await server.wait_closed()
+            return responses
+
+        found, missing = asyncio.run(scenario())
+        self.assertTrue(found.startswith('HTTP/1.1 200 OK'))
+        self.assertIn('hits_total 1', found)
+        self.assertTrue(missing.startswith('HTTP/1.1 404'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from config import ChannelConfig
+from database import Database
+from migrations import LATEST_VERSION, MIGRATIONS, current_version, migrate
+
+
+def make_legacy_db(path):
+    """channels.db в том виде, в каком его оставляли версии без миграций"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE channels (
+            channel_id INTEGER PRIMARY KEY,
+            posts_per_day INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            last_repost_date TEXT NOT NULL,
+            forward_mode BOOLEAN NOT NULL DEFAULT 1,
+            drop_author BOOLEAN NOT NULL DEFAULT 1,
+            last_seen_message_id INTEGER NOT NULL DEFAULT 0,
+            live_mode BOOLEAN NOT NULL DEFAULT 0
+        );
+        CREATE TABLE reposted_messages (
+            source_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            repost_date TEXT NOT NULL,
+            PRIMARY KEY (source_id, channel_id, message_id)
+        );
+        CREATE TABLE routes (
+            source_id INTEGER NOT NULL,
+            destination_id INTEGER NOT NULL,
+            posts_per_day INTEGER,
+            interval_seconds INTEGER,
+            start_date TEXT NOT NULL,
+            last_repost_date TEXT NOT NULL,
+            last_seen_message_id INTEGER NOT NULL DEFAULT 0,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            PRIMARY KEY (source_id, destination_id)
+        );
+    ''')
+    conn.execute(
+        'INSERT INTO channels VALUES (1, 4, ?, 1, ?, 0, 1, 77, 1)',
+        ('2024-01-02T00:00:00+00:00', '2024-03-01T12:30:15.250000+00:00')
+    )
+    conn.execute(
+        'INSERT INTO routes VALUES (1, 2, NULL, 600, ?, ?, 5, 1)',
+        ('2024-01-02T00:00:00+03:00', '2024-03-01T12:00:00+00:00')
+    )
+    recent = datetime.now() - timedelta(days=1)
+    conn.executemany('INSERT INTO reposted_messages VALUES (?, ?, ?, ?)', [
+        (1, 1, 10, recent.isoformat()),
+        (1, 2, 11, recent.isoformat()),
+        (1, 1, 12, (recent - timedelta(days=200)).isoformat()),
+    ])
+    conn.commit()
+    conn.close()
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'channels.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_legacy_file_is_migrated_in_place(self):
+        make_legacy_db(self.path)
+        db = Database(self.path)
+        self.assertEqual(current_version(db.conn), LATEST_VERSION)
+
+        channel = db.get_channel(1)
+        self.assertEqual(channel.start_date, datetime(2024, 1, 2, tzinfo=timezone.utc))
+        self.assertEqual(channel.last_repost_date, datetime(2024, 3, 1, 12, 30, 15, tzinfo=timezone.utc))
+        self.assertEqual((channel.posts_per_day, channel.forward_mode, channel.drop_author), (4, False, True))
+        self.assertEqual((channel.last_seen_message_id, channel.live_mode), (77, True))
+        self.assertIsNone(channel.interval_seconds)
+
+        route = db.get_route(1, 2)
+        self.assertEqual(route.start_date, datetime(2024, 1, 1, 21, tzinfo=timezone.utc))
+        self.assertEqual((route.interval_seconds, route.last_seen_message_id), (600, 5))
+
+        self.assertTrue(db.is_reposted(10, 1, source_id=1))
+        since = datetime.now(timezone.utc) - timedelta(days=90)
+        self.assertEqual(sorted(db.get_reposted_since(since)), [(1, 1, 10), (1, 2, 11)])
+        self.assertEqual(db.prune_reposted(since), 1)
+
+        types = {row[1]: row[2] for row in db.conn.execute('PRAGMA table_info(channels)')}
+        self.assertEqual((types['start_date'], types['last_repost_date']), ('INTEGER', 'INTEGER'))
+        plan = db.conn.execute(
+            'EXPLAIN QUERY PLAN SELECT source_id, channel_id, message_id FROM reposted_messages WHERE repost_date >= 0'
+        ).fetchall()
+        self.assertIn('COVERING INDEX idx_reposted_date', plan[0][3])
+        db.close()
+
+        # Повторный запуск ничего не меняет
+        db = Database(self.path)
+        self.assertEqual(migrate(db.conn), [])
+        self.assertEqual(db.get_channel(1).last_seen_message_id, 77)
+        db.close()
+
+    def test_interval_seconds_survives_restart(self):
+        db = Database(self.path)
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        db.add_channel(ChannelConfig(5, 3, now, last_repost_date=now, interval_seconds=900))
+        db.close()
+        db = Database(self.path)
+        channel = db.get_channel(5)
+        self.assertEqual(channel.interval_seconds, 900)
+        self.assertEqual(channel.last_repost_date, now)
+        db.close()
+
+    def test_failed_migration_keeps_previous_version(self):
+        make_legacy_db(self.path)
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        self.assertEqual(migrate(conn, target=1), [1])
+
+        def broken(conn):
+            conn.execute('DROP TABLE channels')
+            raise RuntimeError('сбой посреди миграции')
+
+        MIGRATIONS.append((LATEST_VERSION + 1, 'broken', broken))
+        try:
+            with self.assertRaises(RuntimeError):
+                migrate(conn, target=LATEST_VERSION + 1)
+        finally:
+            MIGRATIONS.pop()
+        # Версия 2 применилась целиком, сломанная откатилась вместе с DROP TABLE
+        self.assertEqual(current_version(conn), LATEST_VERSION)
+        self.assertEqual(conn.execute('SELECT last_seen_message_id FROM channels').fetchone(), (77,))
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
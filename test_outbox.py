@@ -0,0 +1,174 @@
+import asyncio
+import os
+import random
+import tempfile
+import unittest
+from outbox import CHANNEL, DEAD, PENDING, ROUTE, Deferred, Outbox, OutboxEntry, RetryPolicy
+from storage import AsyncDatabase
+
+POLICIES = [
+    ((ConnectionError,), RetryPolicy('network', 3, base_delay=0.02, max_delay=0.05)),
+    ((LookupError,), RetryPolicy('permanent', 1)),
+]
+
+
+class FloodWait(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"wait {seconds}")
+        self.seconds = seconds
+
+
+class Resender:
+    """resend для Outbox: бросает заданные ошибки по очереди, потом отправляет"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def __call__(self, entry):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(entry.message_ids)
+        return ['copy']
+
+
+async def failing(error):
+    raise error
+
+
+async def until(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("условие не выполнилось")
+
+
+class TestOutbox(unittest.TestCase):
+    def test_transient_error_is_retried_without_refetching(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            resend = Resender(ConnectionError('сеть'))
+            outbox = Outbox(db, resend, POLICIES)
+            entry = OutboxEntry(CHANNEL, 1, 1, (10, 11), 5)
+            first = await outbox.send(entry, lambda: failing(ConnectionError('обрыв')))
+            stored = await db.get_outbox(PENDING)
+            runner = asyncio.create_task(outbox.run())
+            await until(lambda: not outbox.entries)
+            runner.cancel()
+            left = await db.get_outbox(PENDING)
+            await db.close()
+            return first, entry, stored, left, resend, outbox
+
+        first, entry, stored, left, resend, outbox = asyncio.run(scenario())
+        self.assertIsNone(first)
+        self.assertEqual([(e.message_ids, e.attempts, e.error) for e in stored],
+                         [((10, 11), 1, 'ConnectionError: обрыв')])
+        # Первая повторная попытка тоже упала, вторая доставила
+        self.assertEqual(resend.sent, [(10, 11)])
+        self.assertEqual((entry.attempts, outbox.retries, outbox.delivered, outbox.dead), (3, 2, 1, 0))
+        self.assertEqual(left, [])
+
+    def test_success_writes_nothing(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            outbox = Outbox(db, Resender(), POLICIES)
+
+            async def send():
+                return ['copy']
+            result = await outbox.send(OutboxEntry(ROUTE, 1, 2, (7,), 7), send)
+            writes = db.writes
+            await db.close()
+            return result, writes
+
+        self.assertEqual(asyncio.run(scenario()), (['copy'], 0))
+
+    def test_deferred_first_attempt_is_not_stored(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            outbox = Outbox(db, Resender(), POLICIES)
+            entry = OutboxEntry(CHANNEL, 1, 1, (7,), 7)
+            with self.assertRaises(Deferred):
+                await outbox.send(entry, lambda: failing(Deferred('нет аренды')))
+            stored = await db.get_outbox(PENDING)
+            await db.close()
+            return entry, stored, outbox
+
+        entry, stored, outbox = asyncio.run(scenario())
+        self.assertEqual((entry.attempts, entry.entry_id, stored, len(outbox)), (0, None, [], 0))
+
+    def test_permanent_error_goes_to_dead_letters_and_replays(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            resend = Resender()
+            outbox = Outbox(db, resend, POLICIES)
+            runner = asyncio.create_task(outbox.run())
+            await outbox.send(OutboxEntry(ROUTE, 1, 2, (7,), 7), lambda: failing(LookupError('удалено')))
+            await outbox.send(OutboxEntry(ROUTE, 1, 3, (8,), 8), lambda: failing(LookupError('удалено')))
+            dead = await outbox.dead_letters()
+            pending_before = len(outbox)
+            replayed = await outbox.replay(dead[0].entry_id)
+            await until(lambda: resend.sent)
+            discarded = await outbox.discard()
+            runner.cancel()
+            left = await db.get_outbox(DEAD) + await db.get_outbox(PENDING)
+            await db.close()
+            return dead, pending_before, replayed, discarded, resend, outbox, left
+
+        dead, pending_before, replayed, discarded, resend, outbox, left = asyncio.run(scenario())
+        self.assertEqual([(e.destination_id, e.attempts, e.error) for e in dead],
+                         [(2, 1, 'LookupError: удалено'), (3, 1, 'LookupError: удалено')])
+        self.assertEqual((pending_before, replayed, discarded), (0, 1, 1))
+        self.assertEqual(resend.sent, [(7,)])
+        self.assertEqual((outbox.dead, left), (0, []))
+
+    def test_restart_restores_pending_and_defers_without_counting(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'outbox.db')
+
+            async def before_restart():
+                db = AsyncDatabase(path)
+                outbox = Outbox(db, Resender(), POLICIES)
+                await outbox.send(OutboxEntry(CHANNEL, 1, 1, (3,), 3), lambda: failing(ConnectionError('обрыв')))
+                await db.close()
+
+            async def after_restart():
+                db = AsyncDatabase(path)
+                resend = Resender(Deferred('нет сессии'), Deferred('нет сессии'))
+                outbox = Outbox(db, resend, POLICIES, defer_seconds=0.01)
+                await outbox.restore()
+                restored = list(outbox.entries.values())
+                runner = asyncio.create_task(outbox.run())
+                await until(lambda: resend.sent)
+                runner.cancel()
+                await db.close()
+                return restored, outbox
+
+            asyncio.run(before_restart())
+            restored, outbox = asyncio.run(after_restart())
+        self.assertEqual([entry.message_ids for entry in restored], [(3,)])
+        # Две отложенные попытки не считаются: доставила вторая попытка из трёх
+        self.assertEqual(restored[0].attempts, 2)
+        self.assertEqual(outbox.retries, 3)
+
+    def test_backoff_grows_with_jitter_and_respects_flood_wait(self):
+        policy = RetryPolicy('network', 10, base_delay=10, max_delay=100)
+        rng = random.Random(1)
+        for attempt, capped in ((1, 10), (2, 20), (3, 40), (4, 80), (5, 100), (9, 100)):
+            delays = [policy.delay(attempt, rng) for _ in range(50)]
+            self.assertTrue(all(capped / 2 <= delay <= capped for delay in delays))
+            self.assertGreater(max(delays) - min(delays), capped / 10)
+
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            outbox = Outbox(db, Resender(), [((FloodWait,), policy)], clock=lambda: 1000.0)
+            entry = OutboxEntry(CHANNEL, 1, 1, (1,), 1)
+            await outbox.send(entry, lambda: failing(FloodWait(500)))
+            await db.close()
+            return entry
+
+        self.assertEqual(asyncio.run(scenario()).next_attempt, 1500.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
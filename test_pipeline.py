@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+from pipeline import batch_posts, run_pipeline
+
+
+async def produce(posts, log=None):
+    for post in posts:
+        if log is not None:
+            log.append(('fetch', post[0]))
+        await asyncio.sleep(0)
+        yield post
+
+
+class TestPipeline(unittest.TestCase):
+    def test_batches_keep_albums_whole(self):
+        async def scenario():
+            posts = [[1], [2, 3, 4], [5], [6, 7]]
+            return [batch async for batch in batch_posts(produce(posts), 3)]
+
+        self.assertEqual(asyncio.run(scenario()), [[[1]], [[2, 3, 4]], [[5], [6, 7]]])
+
+    def test_keeps_order_and_bounds_prefetch(self):
+        log = []
+
+        async def scenario():
+            async def sink(batch):
+                log.append(('send', batch[0]))
+                await asyncio.sleep(0.001)
+
+            return await run_pipeline(produce([[i] for i in range(20)], log), sink, depth=2)
+
+        self.assertEqual(asyncio.run(scenario()), 20)
+        sent = [item for action, item in log if action == 'send']
+        self.assertEqual(sent, list(range(20)))
+        for position, (action, item) in enumerate(log):
+            if action == 'fetch':
+                already_sent = sum(1 for entry in log[:position] if entry[0] == 'send')
+                # Очередь depth=2 плюс пост, ожидающий места в очереди
+                self.assertLessEqual(item - already_sent, 3)
+
+    def test_errors_stop_both_sides(self):
+        async def failing_source():
+            yield 1
+            raise ValueError('fetch failed')
+
+        async def endless_source():
+            i = 0
+            while True:
+                i += 1
+                yield i
+
+        async def failing_sink(item):
+            if item == 3:
+                raise RuntimeError('send failed')
+
+        async def scenario():
+            with self.assertRaises(ValueError):
+                await run_pipeline(failing_source(), lambda item: asyncio.sleep(0))
+            with self.assertRaises(RuntimeError):
+                await run_pipeline(endless_source(), failing_sink)
+            return len(asyncio.all_tasks())
+
+        self.assertEqual(asyncio.run(scenario()), 1)
+
+    def test_slow_sink_error_with_full_queue(self):
+        async def endless_source():
+            i = 0
+            while True:
+                i += 1
+                yield i
+
+        async def slow_failing_sink(item):
+            # Пока sink ждёт, производитель заполняет очередь и встаёт на put()
+            await asyncio.sleep(0.01)
+            raise RuntimeError('send failed')
+
+        async def scenario():
+            with self.assertRaises(RuntimeError):
+                await asyncio.wait_for(run_pipeline(endless_source(), slow_failing_sink, depth=2), 1)
+            return len(asyncio.all_tasks())
+
+        self.assertEqual(asyncio.run(scenario()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
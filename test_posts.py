@@ -0,0 +1,84 @@
+import asyncio
+import random
+import unittest
+from fanout import SourceBuffer
+from posts import MAX_ALBUM, AlbumGrouper, PostUnit, group_stream
+
+RUNS = 200
+
+
+class Msg:
+    def __init__(self, id, grouped_id=None, message='', media=None):
+        self.id = id
+        self.grouped_id = grouped_id
+        self.message = message
+        self.media = media
+        self.chat_id = -100
+
+
+def random_stream(rng, posts):
+    """Случайная история: одиночные сообщения и альбомы по 2..10 сообщений подряд"""
+    messages, expected = [], []
+    next_id = rng.randrange(1, 1000)
+    for _ in range(posts):
+        size = 1 if rng.random() < 0.6 else rng.randint(2, MAX_ALBUM)
+        grouped_id = next_id * 7 if size > 1 else None
+        ids = list(range(next_id, next_id + size))
+        messages.extend(Msg(i, grouped_id, message=rng.choice(['', 'текст']), media=object()) for i in ids)
+        expected.append(ids)
+        # Удалённые сообщения оставляют пропуски в id
+        next_id += size + rng.choice([0, 0, 1, 5])
+    return messages, expected
+
+
+class TestAlbumGrouper(unittest.TestCase):
+    def test_stream_keeps_order_and_albums_whole(self):
+        for seed in range(RUNS):
+            rng = random.Random(seed)
+            messages, expected = random_stream(rng, rng.randint(0, 40))
+            grouper = AlbumGrouper()
+            units = []
+            for msg in messages:
+                units.extend(grouper.feed(msg))
+                # Задерживается не больше одного незавершённого альбома
+                self.assertLess(grouper.pending, MAX_ALBUM)
+            units.extend(grouper.flush())
+            self.assertEqual([list(unit.ids) for unit in units], expected, seed)
+            for unit in units:
+                self.assertEqual(unit.key, unit.grouped_id or unit.ids[0])
+                self.assertEqual(len(unit.media), len(unit))
+
+    def test_source_buffer_matches_direct_grouping_at_any_page_size(self):
+        for seed in range(RUNS // 4):
+            rng = random.Random(seed)
+            messages, expected = random_stream(rng, rng.randint(1, 30))
+            page_size = rng.randint(1, 15)
+
+            async def fetch(source_id, min_id, limit):
+                return [msg for msg in messages if msg.id > min_id][:limit]
+
+            async def scenario():
+                buffer = SourceBuffer(fetch, page_size=page_size)
+                return [list(post.ids) async for post in buffer.posts(1, 0)]
+
+            self.assertEqual(asyncio.run(scenario()), expected, (seed, page_size))
+
+    def test_group_stream_and_unit_fields(self):
+        async def messages():
+            for msg in [Msg(1, message='один'), Msg(2, 5), Msg(3, 5, message='подпись'), Msg(4, media=None)]:
+                yield msg
+
+        async def scenario():
+            return [unit async for unit in group_stream(messages())]
+
+        units = asyncio.run(scenario())
+        self.assertEqual([unit.ids for unit in units], [(1,), (2, 3), (4,)])
+        self.assertEqual(units[1].caption, 'подпись')
+        self.assertEqual(units[1].chat_id, -100)
+        self.assertFalse(units[2].has_content)
+        # Компактная запись без __dict__
+        self.assertFalse(hasattr(PostUnit.from_messages([Msg(1)]), '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
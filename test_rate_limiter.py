@@ -0,0 +1,140 @@
+import asyncio
+import unittest
+from rate_limiter import RateGovernor, TokenBucket
+from test_support import FakeClock
+
+
+class FakeFloodWaitError(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"A wait of {seconds} seconds is required")
+        self.seconds = seconds
+
+
+class FakeClient:
+    """Клиент, который выбрасывает флуд на заданных номерах вызовов"""
+
+    def __init__(self, clock, flood_on=(), flood_seconds=30):
+        self.clock = clock
+        self.flood_on = set(flood_on)
+        self.flood_seconds = flood_seconds
+        self.calls = []
+
+    async def send_message(self, entity, message):
+        number = len(self.calls)
+        self.calls.append((self.clock(), entity, message))
+        if number in self.flood_on:
+            raise FakeFloodWaitError(self.flood_seconds)
+        return message
+
+
+def make_governor(clock, **kwargs):
+    params = dict(
+        rate=1.0, burst=1, destination_rate=10.0, destination_burst=10,
+        flood_errors=(FakeFloodWaitError,), clock=clock, sleep=clock.sleep
+    )
+    params.update(kwargs)
+    return RateGovernor(**params)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_reserve_waits_when_empty(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2.0, capacity=2, clock=clock)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+        clock.now += 1.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+
+class TestRateGovernor(unittest.TestCase):
+    def test_account_rate_spaces_sends(self):
+        clock = FakeClock()
+        governor = make_governor(clock)
+        client = FakeClient(clock)
+
+        async def scenario():
+            for i in range(5):
+                await governor.call(i, client.send_message, i, 'text')
+
+        asyncio.run(scenario())
+        times = [call[0] for call in client.calls]
+        self.assertEqual(times, [0.0, 1.0, 2.0, 3.0, 4.0])
+
+    def test_destination_limit_is_per_destination(self):
+        clock = FakeClock()
+        governor = make_governor(clock, rate=100.0, burst=100, destination_rate=0.5, destination_burst=1)
+        client = FakeClient(clock)
+
+        async def scenario():
+            await governor.call('a', client.send_message, 'a', 1)
+            await governor.call('b', client.send_message, 'b', 1)
+            await governor.call('a', client.send_message, 'a', 2)
+
+        asyncio.run(scenario())
+        self.assertEqual([call[0] for call in client.calls], [0.0, 0.0, 2.0])
+
+    def test_flood_wait_freezes_all_senders_and_retries(self):
+        clock = FakeClock()
+        governor = make_governor(clock, rate=100.0, burst=100)
+        client = FakeClient(clock, flood_on={1}, flood_seconds=30)
+
+        async def sender(destination):
+            for i in range(3):
+                await governor.call(destination, client.send_message, destination, i)
+
+        async def scenario():
+            await asyncio.gather(sender('a'), sender('b'))
+
+        asyncio.run(scenario())
+        self.assertEqual(governor.flood_waits, 1)
+        # После флуда ни один получатель не отправлял раньше окончания паузы
+        flood_at = client.calls[1][0]
+        after = [call[0] for call in client.calls[2:]]
+        self.assertTrue(all(t >= flood_at + 30 for t in after))
+        self.assertEqual(governor.sends, 6)
+        self.assertLess(governor.account.rate, 100.0)
+
+    def test_gives_up_after_max_retries(self):
+        clock = FakeClock()
+        governor = make_governor(clock, max_retries=2)
+        client = FakeClient(clock, flood_on={0, 1, 2}, flood_seconds=5)
+
+        async def scenario():
+            await governor.call('a', client.send_message, 'a', 'x')
+
+        with self.assertRaises(FakeFloodWaitError):
+            asyncio.run(scenario())
+        self.assertEqual(len(client.calls), 3)
+
+    def test_long_flood_is_raised_without_waiting(self):
+        clock = FakeClock()
+        governor = make_governor(clock, max_flood_wait=60)
+        client = FakeClient(clock, flood_on={0}, flood_seconds=3600)
+
+        async def scenario():
+            await governor.call('a', client.send_message, 'a', 'x')
+
+        with self.assertRaises(FakeFloodWaitError):
+            asyncio.run(scenario())
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(clock.now, 0.0)
+        self.assertEqual(governor.frozen_until, 3600)
+
+    def test_rate_recovers_after_successes(self):
+        clock = FakeClock()
+        governor = make_governor(clock, rate=1.0, recovery_after=2, recovery_step=0.25)
+        governor.freeze(1)
+        self.assertEqual(governor.account.rate, 0.5)
+        client = FakeClient(clock)
+
+        async def scenario():
+            for i in range(8):
+                await governor.call('a', client.send_message, 'a', i)
+
+        asyncio.run(scenario())
+        self.assertEqual(governor.account.rate, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
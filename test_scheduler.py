@@ -0,0 +1,114 @@
+import asyncio
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from config import ChannelConfig
+from scheduler import DeadlineHeap, RepostScheduler, next_deadline
+
+
+def make_config(channel_id, posts_per_day=24, last=None, interval=None):
+    now = datetime.now(timezone.utc)
+    return ChannelConfig(
+        channel_id=channel_id,
+        posts_per_day=posts_per_day,
+        start_date=datetime(2000, 1, 1, tzinfo=timezone.utc),
+        last_repost_date=last or now,
+        interval_seconds=interval
+    )
+
+
+class TestDeadlineHeap(unittest.TestCase):
+    def test_pop_due_in_order(self):
+        heap = DeadlineHeap()
+        for channel_id, deadline in [(1, 30), (2, 10), (3, 20), (4, 50)]:
+            heap.push(channel_id, deadline)
+        self.assertEqual(heap.pop_due(25), [2, 3])
+        self.assertEqual(heap.peek(), 30)
+
+    def test_rekey_in_place(self):
+        heap = DeadlineHeap()
+        heap.push(1, 10)
+        heap.push(2, 20)
+        heap.push(1, 30)
+        self.assertEqual(len(heap), 2)
+        self.assertEqual(heap.pop_due(25), [2])
+        heap.push(1, 5)
+        self.assertEqual(heap.peek(), 5)
+
+    def test_random_operations_keep_heap_order(self):
+        rng = random.Random(42)
+        heap = DeadlineHeap()
+        expected = {}
+        for _ in range(2000):
+            channel_id = rng.randrange(200)
+            if rng.random() < 0.2:
+                heap.remove(channel_id)
+                expected.pop(channel_id, None)
+            else:
+                deadline = rng.random() * 1000
+                heap.push(channel_id, deadline)
+                expected[channel_id] = deadline
+        popped = heap.pop_due(float('inf'))
+        self.assertEqual(popped, sorted(expected, key=lambda c: expected[c]))
+
+
+class TestNextDeadline(unittest.TestCase):
+    def test_uses_interval_or_posts_per_day(self):
+        last = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.assertEqual(
+            next_deadline(make_config(1, posts_per_day=24, last=last)),
+            last.timestamp() + 3600
+        )
+        self.assertEqual(
+            next_deadline(make_config(1, last=last, interval=60)),
+            last.timestamp() + 60
+        )
+
+    def test_not_before_start_date(self):
+        config = make_config(1, last=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        config.start_date = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        self.assertEqual(next_deadline(config), config.start_date.timestamp())
+
+
+class TestRepostScheduler(unittest.TestCase):
+    def test_dispatches_due_channel_and_reschedules(self):
+        processed = []
+
+        async def handler(config):
+            processed.append(config.channel_id)
+            config.last_repost_date = datetime.now(timezone.utc)
+            return config
+
+        async def scenario():
+            scheduler = RepostScheduler(handler)
+            overdue = make_config(1, last=datetime.now(timezone.utc) - timedelta(days=1))
+            scheduler.schedule(overdue)
+            scheduler.schedule(make_config(2))
+            runner = asyncio.create_task(scheduler.run())
+            await asyncio.sleep(0.05)
+            runner.cancel()
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        self.assertEqual(processed, [1])
+        self.assertGreater(scheduler.deadline_of(1), datetime.now(timezone.utc).timestamp())
+
+    def test_stop_removes_channel(self):
+        async def handler(config):
+            return config
+
+        async def scenario():
+            scheduler = RepostScheduler(handler)
+            scheduler.schedule(make_config(1))
+            config = make_config(1)
+            config.is_active = False
+            scheduler.schedule(config)
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        self.assertNotIn(1, scheduler)
+        self.assertIsNone(scheduler.deadline_of(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
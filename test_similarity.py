@@ -0,0 +1,82 @@
+import asyncio
+import random
+import unittest
+from similarity import SimilarityIndex, dhash, hamming, normalize_text, post_fingerprints, simhash
+from storage import AsyncDatabase
+from test_support import FakeClock
+
+TEXT = (
+    "Сегодня в центре города открылась новая библиотека с читальным залом, "
+    "коворкингом и детской комнатой, вход свободный для всех жителей"
+)
+
+
+class TestFingerprints(unittest.TestCase):
+    def test_reposted_text_is_close(self):
+        original = simhash(normalize_text(TEXT))
+        # Другой источник: своя подпись, ссылка и регистр
+        repost = simhash(normalize_text(TEXT.upper() + "\n\n@other_channel https://t.me/other/1"))
+        signed = simhash(normalize_text(TEXT + "\n\nИсточник: @other_channel"))
+        edited = simhash(normalize_text(TEXT.replace("новая", "большая")))
+        other = simhash(normalize_text("Курс валют на завтра: доллар и евро снова подорожали на бирже"))
+        self.assertEqual(original, repost)
+        self.assertLessEqual(hamming(original, signed), 6)
+        self.assertLessEqual(hamming(original, edited), 6)
+        self.assertGreater(hamming(original, other), 12)
+
+    def test_short_text_is_not_compared(self):
+        self.assertEqual(post_fingerprints(["Подписывайтесь!"], [], min_tokens=5), [])
+        self.assertEqual(len(post_fingerprints([TEXT], [], min_tokens=5)), 1)
+
+    def test_dhash_tolerates_brightness(self):
+        rng = random.Random(1)
+        pixels = [[rng.randrange(200) for _ in range(9)] for _ in range(8)]
+        brighter = [[value + 30 for value in row] for row in pixels]
+        self.assertEqual(dhash(pixels), dhash(brighter))
+        self.assertEqual(dhash(pixels).bit_length() <= 64, True)
+
+
+class TestSimilarityIndex(unittest.TestCase):
+    def test_finds_near_duplicates_per_destination(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            clock = FakeClock(1_000_000.0)
+            index = SimilarityIndex(db, max_distance=3, window_days=1, max_per_destination=2, clock=clock)
+            base = random.Random(2).getrandbits(64)
+            near = base ^ (1 << 5) ^ (1 << 40) ^ (1 << 63)
+            far = base ^ 0xFFFF_0000_FFFF
+            await index.add(10, [('text', base)])
+            found = await index.find(10, [('text', near)])
+            missed = await index.find(10, [('text', far)])
+            other_destination = await index.find(11, [('text', near)])
+            other_kind = await index.find(10, [('image', base)])
+            # За пределами окна запись не считается
+            clock.now += 2 * 86400
+            expired = await index.find(10, [('text', base)])
+            values = [base ^ mask for mask in (0xFFFF_FFFF, 0xFFFF_FFFF_0000_0000, 0xFFFF_0000_FFFF_0000)]
+            for value in values:
+                await index.add(10, [('text', value)])
+            removed = await index.prune()
+            kept = [await index.find(10, [('text', value)]) for value in values]
+            await db.close()
+            return base, found, missed, other_destination, other_kind, expired, removed, kept
+
+        base, found, missed, other_destination, other_kind, expired, removed, kept = asyncio.run(scenario())
+        self.assertEqual(found, ('text', base))
+        self.assertIsNone(missed)
+        self.assertIsNone(other_destination)
+        self.assertIsNone(other_kind)
+        self.assertIsNone(expired)
+        # Устаревшая запись и самая старая сверх лимита в 2 отпечатка
+        self.assertEqual(removed, 2 * index_bands())
+        self.assertIsNone(kept[0])
+        self.assertIsNotNone(kept[1])
+        self.assertIsNotNone(kept[2])
+
+
+def index_bands():
+    return SimilarityIndex(None, max_distance=3).bands
+
+
+if __name__ == '__main__':
+    unittest.main()
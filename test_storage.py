@@ -0,0 +1,73 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from config import ChannelConfig
+from database import Database
+from storage import AsyncDatabase
+
+
+def make_config(channel_id):
+    now = datetime.now(timezone.utc)
+    return ChannelConfig(channel_id=channel_id, posts_per_day=2, start_date=now, last_repost_date=now)
+
+
+class TestAsyncDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'channels.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip_and_group_commit(self):
+        async def scenario():
+            db = AsyncDatabase(self.path)
+            await asyncio.gather(*(db.add_channel(make_config(i)) for i in range(200)))
+            await asyncio.gather(*(db.mark_reposted(i, 1) for i in range(200)))
+            channels = await db.get_all_channels()
+            reposted = await db.is_reposted(5, 1)
+            missing = await db.get_channel(10_000)
+            await db.close()
+            return db, channels, reposted, missing
+
+        db, channels, reposted, missing = asyncio.run(scenario())
+        self.assertEqual(len(channels), 200)
+        self.assertTrue(reposted)
+        self.assertIsNone(missing)
+        self.assertEqual(db.writes, 400)
+        self.assertLess(db.commits, db.writes)
+        # Данные действительно на диске
+        self.assertEqual(len(Database(self.path).get_all_channels()), 200)
+
+    def test_failed_write_does_not_roll_back_batch(self):
+        async def scenario():
+            db = AsyncDatabase(self.path)
+            results = await asyncio.gather(
+                db.add_channel(make_config(1)),
+                db.add_channel(None),
+                db.add_channel(make_config(2)),
+                return_exceptions=True
+            )
+            channels = await db.get_all_channels()
+            await db.close()
+            return results, channels
+
+        results, channels = asyncio.run(scenario())
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(sorted(c.channel_id for c in channels), [1, 2])
+
+    def test_memory_database_reads_through_writer(self):
+        async def scenario():
+            db = AsyncDatabase(':memory:')
+            await db.add_channel(make_config(7))
+            channel = await db.get_channel(7)
+            await db.close()
+            return channel
+
+        self.assertEqual(asyncio.run(scenario()).channel_id, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
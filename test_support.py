@@ -0,0 +1,16 @@
+"""Общие заглушки для тестов"""
+import asyncio
+
+
+class FakeClock:
+    """Симулированные часы: время двигает сам тест, sleep мгновенно сдвигает его"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+        await asyncio.sleep(0)
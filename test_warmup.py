@@ -0,0 +1,92 @@
+import asyncio
+import random
+import unittest
+from warmup import Warmup
+
+
+class VirtualTime:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_warmup(time, **kwargs):
+    return Warmup(clock=time.clock, sleep=time.sleep, rng=random.Random(1), **kwargs)
+
+
+class TestWarmup(unittest.TestCase):
+    def test_overdue_first_in_batches_then_the_rest_at_once(self):
+        time = VirtualTime()
+        warmup = make_warmup(time, batch_size=3, interval=2.0, jitter=1.0)
+        started = []
+
+        def activate(key):
+            async def run():
+                started.append((key, time.now))
+            return run
+
+        # Просрочены на 1..7 с; каналы 100..104 — ещё не наступили
+        for key in range(1, 8):
+            warmup.submit(key, time.now - key, activate(key))
+        for key in range(100, 105):
+            warmup.submit(key, time.now + 3600 + key, activate(key))
+
+        self.assertEqual(asyncio.run(warmup.drain()), 4)
+        keys = [key for key, _ in started]
+        self.assertEqual(keys, [7, 6, 5, 4, 3, 2, 1, 100, 101, 102, 103, 104])
+        # Пачки по 3 разнесены паузой interval + jitter
+        self.assertEqual(len({at for _, at in started[:3]}), 1)
+        self.assertTrue(all(2.0 <= pause <= 3.0 for pause in time.sleeps))
+        self.assertEqual(len(time.sleeps), 3)
+        self.assertAlmostEqual(warmup.ready_seconds, sum(time.sleeps))
+        self.assertEqual(len(warmup), 0)
+
+    def test_discard_and_resubmit(self):
+        time = VirtualTime()
+        warmup = make_warmup(time, batch_size=10)
+        started = []
+
+        def activate(key, version):
+            async def run():
+                started.append((key, version))
+            return run
+
+        warmup.submit(1, time.now - 10, activate(1, 'old'))
+        warmup.submit(2, time.now - 5, activate(2, 'old'))
+        warmup.submit(3, time.now - 1, activate(3, 'old'))
+        # Канал 1 остановили командой, канал 2 перенастроили до его очереди
+        warmup.discard(1)
+        warmup.submit(2, time.now - 5, activate(2, 'new'))
+        self.assertNotIn(1, warmup)
+        asyncio.run(warmup.drain())
+        self.assertEqual(started, [(2, 'new'), (3, 'old')])
+
+    def test_failed_activation_does_not_stop_warmup(self):
+        time = VirtualTime()
+        warmup = make_warmup(time, batch_size=1, interval=0, jitter=0)
+        started = []
+
+        async def broken():
+            raise RuntimeError('нет доступа')
+
+        async def ok():
+            started.append(2)
+
+        warmup.submit(1, 0, broken)
+        warmup.submit(2, 1, ok)
+        with self.assertLogs('warmup', 'ERROR'):
+            asyncio.run(warmup.drain())
+        self.assertEqual(started, [2])
+        self.assertEqual(warmup.activated, 1)
+        self.assertIsNotNone(warmup.ready_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Поэтапный запуск каналов после старта процесса.
+
+    Если сразу поставить в расписание тысячи просроченных каналов, все они
+    одновременно запросят get_entity и историю, и аккаунт получит flood
+    wait. Warmup держит очередь ожидающих запуска каналов и запускает
+    просроченные пачками по batch_size, самые просроченные первыми, с
+    паузой interval плюс случайная добавка до jitter секунд между пачками.
+    Каналы, чей дедлайн ещё не наступил, запускаются без очереди: их
+    первые обработки и так разнесены по времени.
+
+    Ключ — тот же, что у планировщика (channel_id или пара маршрута);
+    повторная постановка заменяет запись, discard убирает канал, который
+    остановили или перезапустили командой до его очереди.
+    """
+
+    def __init__(self, batch_size: int = 50, interval: float = 2.0, jitter: float = 1.0,
+                 clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+                 rng: Optional[random.Random] = None):
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.jitter = jitter
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._items: Dict[Hashable, Tuple[int, Callable[[], Awaitable[Any]]]] = {}
+        self._seq = 0
+        self._added = asyncio.Event()
+        self.started_at = clock()
+        self.ready_at: Optional[float] = None
+        self.batches = 0
+        self.activated = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    @property
+    def ready_seconds(self) -> Optional[float]:
+        """Время от старта до первого опустошения очереди (None — ещё идёт)"""
+        return None if self.ready_at is None else self.ready_at - self.started_at
+
+    def submit(self, key: Hashable, deadline: float, activate: Callable[[], Awaitable[Any]]):
+        """Поставить запуск канала в очередь по его дедлайну"""
+        self._seq += 1
+        self._items[key] = (self._seq, activate)
+        heapq.heappush(self._heap, (deadline, self._seq, key))
+        self._added.set()
+
+    def discard(self, key: Hashable):
+        # Запись в куче станет устаревшей и будет пропущена
+        self._items.pop(key, None)
+
+    def _pop(self) -> Optional[Tuple[float, Hashable, Callable[[], Awaitable[Any]]]]:
+        while self._heap:
+            deadline, seq, key = heapq.heappop(self._heap)
+            item = self._items.get(key)
+            if item is not None and item[0] == seq:
+                del self._items[key]
+                return deadline, key, item[1]
+        return None
+
+    def next_batch(self) -> List[Tuple[Hashable, Callable[[], Awaitable[Any]]]]:
+        """Самые просроченные каналы пачкой, а если просроченных нет — все остальные"""
+        now = self.clock()
+        batch = []
+        while self._heap and len(batch) < self.batch_size:
+            if batch and self._heap[0][0] > now:
+                break
+            item = self._pop()
+            if item is None:
+                break
+            deadline, key, activate = item
+            batch.append((key, activate))
+            if deadline > now:
+                # Дальше в куче только каналы, которым ещё рано: запускаем их разом
+                while True:
+                    item = self._pop()
+                    if item is None:
+                        break
+                    batch.append(item[1:])
+                break
+        return batch
+
+    async def _activate(self, batch):
+        for key, activate in batch:
+            try:
+                await activate()
+                self.activated += 1
+            except Exception as e:
+                logger.error(f"Ошибка запуска {key}: {str(e)}")
+
+    async def drain(self) -> int:
+        """Запустить всё, что стоит в очереди; вернуть число пачек"""
+        batches = 0
+        while self._items:
+            batch = self.next_batch()
+            if not batch:
+                break
+            await self._activate(batch)
+            batches += 1
+            self.batches += 1
+            if self._items:
+                await self.sleep(self.interval + self.rng.uniform(0, self.jitter))
+        if self.ready_at is None:
+            self.ready_at = self.clock()
+            logger.info(f"Запуск каналов завершён за {self.ready_seconds:.1f} с: "
+                        f"{self.activated} запущено, пачек {self.batches}")
+        return batches
+
+    async def run(self):
+        """Фоновый цикл: разбирать очередь по мере поступления каналов"""
+        while True:
+            self._added.clear()
+            await self.drain()
+            await self._added.wait()